@@ -1,7 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django import forms
+from django.http import HttpResponseRedirect
 from django.utils.html import format_html
-from .models import Workshop, WorkshopImage, Review, ClothingModel, ModelImage, Measurements, Order, User
+from .models import (
+    Workshop, WorkshopImage, Review, ClothingModel, ModelImage, Measurements, Order, User,
+    BillOfMaterialsItem, InsufficientStock
+)
 
 class WorkshopImageInline(admin.TabularInline):
     model = WorkshopImage
@@ -42,6 +46,17 @@ class WorkshopAdminForm(forms.ModelForm):
             return specialties_list
         return []
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # Coordonnées saisies : elles priment sur le gazetteer ; effacées : la
+        # position est de nouveau déduite de l'adresse
+        if {'latitude', 'longitude'} & set(self.changed_data):
+            if cleaned_data.get('latitude') is not None and cleaned_data.get('longitude') is not None:
+                cleaned_data['location_source'] = 'client'
+            elif cleaned_data.get('latitude') is None and cleaned_data.get('longitude') is None:
+                cleaned_data['location_source'] = ''
+        return cleaned_data
+
     def save(self, commit=True):
         instance = super().save(commit=False)
         # Mettre à jour le champ specialties avec les données du formulaire
@@ -56,7 +71,7 @@ class WorkshopAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'address', 'is_verified', 'is_active', 'average_rating']
     list_filter = ['is_verified', 'is_active', 'created_at']
     search_fields = ['name', 'address', 'user__username']
-    readonly_fields = ['average_rating', 'created_at', 'updated_at']
+    readonly_fields = ['average_rating', 'review_count', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Informations de base', {
@@ -65,6 +80,10 @@ class WorkshopAdmin(admin.ModelAdmin):
         ('Contact', {
             'fields': ('address', 'phone')
         }),
+        ('Localisation', {
+            'fields': ('latitude', 'longitude', 'location_source'),
+            'description': "Laisser vide pour déduire la position de la ville indiquée dans l'adresse"
+        }),
         ('Spécialités', {
             'fields': ('specialties_input',),
             'description': 'Entrez les spécialités de l\'atelier (optionnel)'
@@ -73,7 +92,7 @@ class WorkshopAdmin(admin.ModelAdmin):
             'fields': ('estimated_delivery_time', 'price_range_min', 'price_range_max')
         }),
         ('Statut', {
-            'fields': ('is_verified', 'is_active', 'rating')
+            'fields': ('is_verified', 'is_active', 'rating', 'average_rating', 'review_count')
         }),
         ('Dates', {
             'fields': ('created_at', 'updated_at'),
@@ -104,12 +123,29 @@ class ModelImageInline(admin.TabularInline):
     model = ModelImage
     extra = 1
 
+class BillOfMaterialsItemInline(admin.TabularInline):
+    model = BillOfMaterialsItem
+    extra = 1
+    raw_id_fields = ['material']
+    readonly_fields = ['material_quantity']
+
 @admin.register(ClothingModel)
 class ClothingModelAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'price', 'featured', 'is_active']
-    list_filter = ['category', 'featured', 'is_active', 'created_at']
+    list_display = ['name', 'category', 'price', 'featured', 'is_active', 'is_draft']
+    list_filter = ['category', 'featured', 'is_active', 'is_draft', 'created_at']
     search_fields = ['name', 'description']
-    inlines = [ModelImageInline]
+    inlines = [ModelImageInline, BillOfMaterialsItemInline]
+    actions = ['publish_drafts']
+
+    @admin.action(description="Publier les brouillons sélectionnés")
+    def publish_drafts(self, request, queryset):
+        # save() plutôt qu'update() : le signal post_save réindexe chaque modèle pour la recherche
+        drafts = queryset.filter(is_draft=True)
+        for model in drafts:
+            model.is_draft = False
+            model.is_active = True
+            model.save(update_fields=['is_draft', 'is_active', 'updated_at'])
+        self.message_user(request, f"{len(drafts)} modèle(s) publié(s)", messages.SUCCESS)
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -142,7 +178,16 @@ class OrderAdmin(admin.ModelAdmin):
         ('Dates', {
             'fields': ('created_at',)
         }),
-    ) 
+    )
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Confirmation et mise en fabrication réservent ou consomment les matières :
+        # la transaction du formulaire est annulée et l'erreur affichée si le stock manque
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except InsufficientStock as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
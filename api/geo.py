@@ -0,0 +1,187 @@
+"""
+Outils géographiques hors ligne : gazetteer de villes, geohash et distances.
+
+Les coordonnées des ateliers sont indexées par geohash (colonne Workshop.geohash) :
+une recherche par rayon se réduit à quelques préfixes LIKE 'xxx%' servis par l'index,
+puis la distance exacte est calculée en SQL sur les candidats restants.
+"""
+import math
+import re
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+from .search import fold
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Villes connues -> (latitude, longitude). Les clés sont repliées (voir fold()).
+GAZETTEER = {
+    # Sénégal
+    'dakar': (14.6928, -17.4467),
+    'pikine': (14.7646, -17.3907),
+    'guediawaye': (14.7833, -17.4000),
+    'rufisque': (14.7154, -17.2733),
+    'thies': (14.7910, -16.9359),
+    'mbour': (14.4200, -16.9700),
+    'saint louis': (16.0179, -16.4896),
+    'touba': (14.8500, -15.8833),
+    'kaolack': (14.1652, -16.0758),
+    'ziguinchor': (12.5681, -16.2733),
+    # Afrique de l'Ouest et centrale
+    'nouakchott': (18.0735, -15.9582),
+    'bamako': (12.6392, -8.0029),
+    'conakry': (9.6412, -13.5784),
+    'abidjan': (5.3600, -4.0083),
+    'bouake': (7.6900, -5.0300),
+    'yamoussoukro': (6.8276, -5.2893),
+    'ouagadougou': (12.3714, -1.5197),
+    'niamey': (13.5116, 2.1254),
+    'lome': (6.1319, 1.2228),
+    'cotonou': (6.3703, 2.3912),
+    'porto novo': (6.4969, 2.6289),
+    'douala': (4.0511, 9.7679),
+    'yaounde': (3.8480, 11.5021),
+    'libreville': (0.4162, 9.4673),
+    'brazzaville': (-4.2634, 15.2429),
+    'kinshasa': (-4.4419, 15.2663),
+    # Maghreb
+    'casablanca': (33.5731, -7.5898),
+    'rabat': (34.0209, -6.8416),
+    'marrakech': (31.6295, -7.9811),
+    'alger': (36.7538, 3.0588),
+    'tunis': (36.8065, 10.1815),
+    # Europe et Amérique du Nord
+    'paris': (48.8566, 2.3522),
+    'lyon': (45.7640, 4.8357),
+    'marseille': (43.2965, 5.3698),
+    'toulouse': (43.6047, 1.4442),
+    'lille': (50.6292, 3.0573),
+    'bordeaux': (44.8378, -0.5792),
+    'nantes': (47.2184, -1.5536),
+    'strasbourg': (48.5734, 7.7521),
+    'nice': (43.7102, 7.2620),
+    'montpellier': (43.6108, 3.8767),
+    'bruxelles': (50.8503, 4.3517),
+    'geneve': (46.2044, 6.1432),
+    'montreal': (45.5017, -73.5673),
+}
+
+
+def geocode_address(address):
+    """
+    Retourne (latitude, longitude) de la ville du gazetteer citée dans l'adresse,
+    ou None. En cas de plusieurs correspondances, le nom le plus long l'emporte
+    (« saint louis » plutôt que « louis »).
+    """
+    normalized = ' %s ' % ' '.join(re.findall(r'[a-z0-9]+', fold(address)))
+    matches = [name for name in GAZETTEER if f' {name} ' in normalized]
+    if not matches:
+        return None
+    return GAZETTEER[max(matches, key=len)]
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= middle:
+            value |= 1
+            rng[0] = middle
+        else:
+            rng[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size_degrees(precision):
+    """Dimensions (hauteur en latitude, largeur en longitude) d'une cellule geohash"""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def precision_for_radius(radius_km, latitude):
+    """
+    Précision la plus fine dont les cellules couvrent au moins le rayon demandé,
+    pour que la cellule centrale et ses 8 voisines contiennent tout le cercle.
+    Retourne 0 si le rayon dépasse la plus grande cellule (pas de préfiltre).
+    """
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_deg, lon_deg = cell_size_degrees(precision)
+        if min(lat_deg * KM_PER_DEGREE, lon_deg * KM_PER_DEGREE * cos_lat) >= radius_km:
+            return precision
+    return 0
+
+
+def covering_prefixes(latitude, longitude, radius_km):
+    """Préfixes geohash (cellule centrale + voisines) couvrant le cercle, ou [] si trop large"""
+    precision = precision_for_radius(radius_km, latitude)
+    if not precision:
+        return []
+    lat_deg, lon_deg = cell_size_degrees(precision)
+    prefixes = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        for dlon in (-lon_deg, 0, lon_deg):
+            lat = min(max(latitude + dlat, -90.0), 90.0)
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(lat, lon, precision))
+    return sorted(prefixes)
+
+
+def distance_km_expression(latitude, longitude):
+    """Expression SQL de la distance haversine (km) entre le point et Workshop.latitude/longitude"""
+    lat1 = math.radians(latitude)
+    lat2 = Radians(F('latitude'))
+    dlat = lat2 - Value(lat1)
+    dlon = Radians(F('longitude')) - Value(math.radians(longitude))
+    a = Power(Sin(dlat / 2), 2) + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin(dlon / 2), 2)
+    # Least() protège ASin des arrondis flottants au-delà de 1
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)), output_field=FloatField())
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Filtre les ateliers à moins de radius_km, annotés de distance_km et triés par distance"""
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    queryset = queryset.exclude(geohash='')
+    if prefixes:
+        condition = Q()
+        for prefix in prefixes:
+            condition |= Q(geohash__startswith=prefix)
+        queryset = queryset.filter(condition)
+    return (
+        queryset
+        .annotate(distance_km=distance_km_expression(latitude, longitude))
+        .filter(distance_km__lte=radius_km)
+        .order_by('distance_km', 'id')
+    )
+
+
+def nearest(queryset, latitude, longitude, count, max_radius_km):
+    """
+    Les `count` ateliers les plus proches, par rayons croissants : chaque étape ne
+    lit que les cellules geohash concernées.
+    """
+    radius = min(5.0, max_radius_km)
+    while True:
+        candidates = within_radius(queryset, latitude, longitude, radius)
+        if radius >= max_radius_km or candidates.count() >= count:
+            return candidates[:count]
+        radius = min(radius * 4, max_radius_km)
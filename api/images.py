@@ -0,0 +1,238 @@
+"""
+Versions redimensionnées des images téléversées (vignettes WebP et JPEG).
+
+Pour chaque image, une version par largeur de DERIVATIVE_WIDTHS et par format
+est enregistrée à côté de l'original (photo.jpg -> photo_320w.webp, ...) ; avec
+le stockage adressé par contenu, sous sa propre empreinte (voir api.storage). Une
+image plus étroite qu'une largeur cible n'est jamais agrandie : elle donne une
+seule version à sa largeur d'origine. L'orientation EXIF est appliquée avant
+redimensionnement, car les métadonnées ne sont pas recopiées.
+
+Les chemins sont stockés dans le champ JSON <champ>_derivatives du modèle,
+sous la forme {format: {largeur: chemin}}, et exposés par les serializers en
+URLs absolues (voir DerivativesField).
+
+Les images envoyées à Gemini (GenerateModelView) sont reçues en mémoire par
+BoundedUploadHandler, qui interrompt la lecture au-delà de la taille maximale,
+puis décodées à résolution réduite par downscale_for_model().
+"""
+import base64
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image, ImageOps
+
+from .models import MaterialImage, ModelImage, User, Workshop, WorkshopImage
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+
+# format -> (extension, format Pillow, options d'enregistrement)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Champs image qui reçoivent des versions redimensionnées : modèle -> noms des champs
+IMAGE_FIELDS = {
+    ModelImage: ('image',),
+    WorkshopImage: ('image',),
+    MaterialImage: ('image',),
+    Workshop: ('logo',),
+    User: ('profile_picture',),
+}
+
+# Images de galerie : leur champ `image` porte aussi width, height, dominant_color
+# et placeholder, servis avec la liste pour un premier affichage sans requête
+SUMMARY_MODELS = (ModelImage, WorkshopImage, MaterialImage)
+PLACEHOLDER_SIZE = 16
+EMPTY_SUMMARY = {'width': None, 'height': None, 'dominant_color': '', 'placeholder': ''}
+
+
+def derivatives_field(field_name):
+    return f'{field_name}_derivatives'
+
+
+def derivative_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.{extension}'
+
+
+def target_widths(width):
+    widths = [target for target in DERIVATIVE_WIDTHS if target < width]
+    if len(widths) < len(DERIVATIVE_WIDTHS):
+        # Pas d'agrandissement : la plus grande version garde la largeur d'origine
+        widths.append(width)
+    return widths
+
+
+def _flatten(image):
+    """RGB pour le JPEG (fond blanc sous la transparence) ; RGB ou RGBA pour le WebP"""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def _encode(image, pillow_format, options):
+    if pillow_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def open_image(storage, name):
+    """Image décodée et redressée (orientation EXIF), ou None si le fichier est absent ou illisible"""
+    try:
+        with storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            return _flatten(ImageOps.exif_transpose(image))
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning("Image illisible : %s : %s", name, exc)
+        return None
+
+
+def render_derivatives(storage, name, image):
+    """Génère et enregistre les versions de l'image ; retourne {format: {largeur: chemin}}"""
+    derivatives = {key: {} for key in DERIVATIVE_FORMATS}
+    for width in target_widths(image.width):
+        height = max(round(image.height * width / image.width), 1)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for key, (extension, pillow_format, options) in DERIVATIVE_FORMATS.items():
+            derivative = derivative_name(name, width, extension)
+            if storage.exists(derivative):
+                storage.delete(derivative)
+            derivatives[key][str(width)] = storage.save(
+                derivative, ContentFile(_encode(resized, pillow_format, options))
+            )
+    return derivatives
+
+
+def describe_image(image):
+    """
+    Dimensions, couleur dominante et placeholder (WebP de PLACEHOLDER_SIZE px
+    en data URI, quelques centaines d'octets) affichés avant le chargement.
+    """
+    small = image.copy()
+    small.thumbnail((64, 64), Image.BOX)
+    palette = small.convert('RGB').quantize(colors=5)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BOX)
+    encoded = base64.b64encode(_encode(small, 'WEBP', {'quality': 30})).decode('ascii')
+    return {
+        'width': image.width,
+        'height': image.height,
+        'dominant_color': f'#{red:02x}{green:02x}{blue:02x}',
+        'placeholder': f'data:image/webp;base64,{encoded}',
+    }
+
+
+def image_summary(storage, name):
+    """describe_image() d'un fichier stocké ; EMPTY_SUMMARY s'il est illisible"""
+    image = open_image(storage, name)
+    return describe_image(image) if image is not None else dict(EMPTY_SUMMARY)
+
+
+def delete_derivatives(storage, derivatives):
+    for paths in (derivatives or {}).values():
+        for name in paths.values():
+            storage.delete(name)
+
+
+def refresh_image(instance, field_name, previous=None):
+    """
+    Remplace les versions d'un champ image de l'instance : supprime les
+    anciennes (`previous`, par défaut celles enregistrées), génère les nouvelles
+    et, pour SUMMARY_MODELS, recalcule dimensions, couleur et placeholder. Le
+    tout est enregistré par un UPDATE, sans repasser par save() ni les signaux.
+    Retourne les versions générées ({} si l'image est absente ou illisible).
+    """
+    fieldfile = getattr(instance, field_name)
+    attname = derivatives_field(field_name)
+    if previous is None:
+        previous = getattr(instance, attname)
+    delete_derivatives(fieldfile.storage, previous)
+
+    image = open_image(fieldfile.storage, fieldfile.name) if fieldfile else None
+    values = {attname: render_derivatives(fieldfile.storage, fieldfile.name, image) if image is not None else {}}
+    if isinstance(instance, SUMMARY_MODELS):
+        values.update(describe_image(image) if image is not None else EMPTY_SUMMARY)
+    for name, value in values.items():
+        setattr(instance, name, value)
+    type(instance)._default_manager.filter(pk=instance.pk).update(**values)
+    return values[attname]
+
+
+class BoundedUploadHandler(FileUploadHandler):
+    """
+    Reçoit les fichiers en mémoire, par morceaux, et arrête de lire la requête
+    dès que leur taille cumulée dépasse max_size ; `exceeded` est alors vrai.
+    Un Content-Length annoncé trop grand est refusé avant toute lecture.
+    """
+
+    def __init__(self, max_size, request=None):
+        super().__init__(request)
+        self.max_size = max_size
+        self.received = 0
+        self.exceeded = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_size + 64 * 1024:  # marge pour les champs et séparateurs
+            # Retourner (POST, FILES) court-circuite l'analyse : le corps n'est pas lu
+            self.exceeded = True
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = BytesIO()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return InMemoryUploadedFile(
+            file=self.file,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+
+
+def downscale_for_model(data, max_side):
+    """
+    Décode l'image à la plus petite résolution utile et retourne le JPEG à
+    envoyer au modèle (plus grand côté <= max_side). draft() laisse le
+    décodeur JPEG réduire d'un facteur 2 à 8 pendant le décodage ; thumbnail()
+    termine par reduce() puis un rééchantillonnage sur l'image déjà réduite.
+    Lève ValueError si les données ne sont pas une image.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+        image = _flatten(image)
+        return _encode(image, 'JPEG', {'quality': 85})
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ValueError(str(exc)) from exc
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.stock import take_checkpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Enregistre un point de contrôle du solde de chaque matière (à planifier, "
+        "par ex. chaque nuit) pour limiter le rejeu des calculs de stock à une date"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = take_checkpoints(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{created} point(s) de contrôle enregistré(s)"))
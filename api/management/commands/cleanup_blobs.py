@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.storage import purge_unused_blobs, recount_references
+
+
+class Command(BaseCommand):
+    help = "Recompte les références des médias dédupliqués et efface les blobs inutilisés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Délai avant effacement d'un blob sans référence (téléversements en cours)")
+        parser.add_argument('--dry-run', action='store_true', help="Liste les blobs sans les effacer")
+
+    def handle(self, *args, **options):
+        corrected = recount_references()
+        purged = purge_unused_blobs(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        for key in purged:
+            self.stdout.write(key)
+        verb = "à effacer" if options['dry_run'] else "effacé(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{corrected} compteur(s) corrigé(s), {len(purged)} blob(s) {verb}"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_FIELDS, derivatives_field, refresh_image
+
+
+class Command(BaseCommand):
+    help = "Génère les versions redimensionnées (WebP/JPEG) des images existantes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Régénère aussi les images qui ont déjà leurs versions")
+
+    def handle(self, *args, **options):
+        for model, field_names in IMAGE_FIELDS.items():
+            for field_name in field_names:
+                attname = derivatives_field(field_name)
+                queryset = model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                if not options['force']:
+                    queryset = queryset.filter(**{attname: {}})
+                done = failed = 0
+                for instance in queryset.only('pk', field_name, attname).iterator(chunk_size=200):
+                    if refresh_image(instance, field_name):
+                        done += 1
+                    else:
+                        failed += 1
+                label = f"{model._meta.label}.{field_name}"
+                self.stdout.write(f"{label} : {done} image(s) traitée(s), {failed} illisible(s) ou absente(s)")
+        self.stdout.write(self.style.SUCCESS("Versions redimensionnées à jour"))
@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.images import EMPTY_SUMMARY, SUMMARY_MODELS, image_summary
+
+SUMMARY_FIELDS = list(EMPTY_SUMMARY)
+
+
+def _init_worker():
+    # Processus lancés par spawn (macOS, Windows) : Django n'y est pas encore initialisé
+    django.setup()
+
+
+def _summarize(item):
+    pk, name = item
+    return pk, image_summary(default_storage, name)
+
+
+class Command(BaseCommand):
+    help = "Calcule dimensions, couleur dominante et placeholder des images de galerie existantes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true',
+                            help="Recalcule aussi les images qui ont déjà leur placeholder")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Les processus fils ne doivent pas hériter des connexions ouvertes
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+            for model in SUMMARY_MODELS:
+                queryset = model._default_manager.exclude(image='')
+                if not options['force']:
+                    queryset = queryset.filter(placeholder='')
+                items = list(queryset.order_by('pk').values_list('pk', 'image'))
+                done = failed = 0
+                for start in range(0, len(items), batch_size):
+                    batch = items[start:start + batch_size]
+                    instances = []
+                    for pk, summary in executor.map(_summarize, batch, chunksize=8):
+                        instance = model(pk=pk, **summary)
+                        instances.append(instance)
+                        if summary['placeholder']:
+                            done += 1
+                        else:
+                            failed += 1
+                    model._default_manager.bulk_update(instances, SUMMARY_FIELDS)
+                self.stdout.write(f"{model._meta.label} : {done} image(s) traitée(s), {failed} illisible(s) ou absente(s)")
+        self.stdout.write(self.style.SUCCESS("Placeholders à jour"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.purchasing import DEFAULT_COVERAGE_DAYS, DEFAULT_LOOKBACK_DAYS, plan_reorders
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule les quantités à commander pour chaque fournisseur actif et enregistre "
+        "les brouillons de bons de commande (à planifier, par ex. chaque nuit)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--coverage-days', type=int, default=DEFAULT_COVERAGE_DAYS,
+                            help="Jours de consommation à couvrir")
+        parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                            help="Période d'observation des sorties")
+
+    def handle(self, *args, **options):
+        drafts = plan_reorders(options['coverage_days'], max(options['lookback_days'], 1))
+        for draft in drafts:
+            self.stdout.write(f"Fournisseur {draft.supplier_id} : {draft.line_count} ligne(s), {draft.total_amount}")
+        self.stdout.write(self.style.SUCCESS(f"{len(drafts)} brouillon(s) de bon de commande"))
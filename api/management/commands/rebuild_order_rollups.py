@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from api.models import Order, OrderDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table des agrégats journaliers de commandes (OrderDailyRollup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = (
+            Order.objects
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'workshop_id', 'status', 'payment_status')
+            .annotate(order_count=Count('id'), revenue=Sum('total_price'))
+            .order_by()
+        )
+        with transaction.atomic():
+            OrderDailyRollup.objects.all().delete()
+            created = OrderDailyRollup.objects.bulk_create(
+                (OrderDailyRollup(**row) for row in rows.iterator()),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} agrégat(s) journalier(s) reconstruit(s)"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from api.models import Review, Workshop
+
+
+class Command(BaseCommand):
+    help = "Recalcule review_count et review_sum de chaque atelier à partir de la table des avis"
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.filter(workshop=OuterRef('pk')).order_by().values('workshop')
+        updated = Workshop.objects.update(
+            review_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), Value(0)),
+            review_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), Value(0.0)),
+        )
+        self.stdout.write(self.style.SUCCESS(f"{updated} atelier(s) recalculé(s)"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.stock import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = "Recalcule current_stock depuis le registre des mouvements et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Signaler les écarts sans corriger")
+
+    def handle(self, *args, **options):
+        drift = reconcile_stock(dry_run=options['dry_run'])
+        for material, ledger_balance, difference in drift:
+            self.stdout.write(
+                f"{material.sku} : stock {material.current_stock}, registre {ledger_balance} (écart {difference:+})"
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Aucun écart"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} matière(s) en écart (non corrigées)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)} matière(s) corrigée(s)"))
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.valuation import stock_valuation
+
+
+class Command(BaseCommand):
+    help = "Valorise le stock au coût moyen pondéré et en FIFO, avec sous-totaux par catégorie et fournisseur"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-cache', action='store_true', help="Recalculer sans lire le cache")
+        parser.add_argument('--materials', action='store_true', help="Afficher le détail par matière")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        data = stock_valuation(use_cache=not options['no_cache'])
+        if options['json']:
+            if not options['materials']:
+                data = {key: value for key, value in data.items() if key != 'materials'}
+            self.stdout.write(json.dumps(data, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        row = "{:<40} {:>8} {:>16} {:>16}"
+        for title, groups in (("Par catégorie", data['by_category']), ("Par fournisseur", data['by_supplier'])):
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(row.format('', 'Matières', 'CMP', 'FIFO'))
+            for group in groups:
+                self.stdout.write(row.format(
+                    str(group['name'])[:40], group['materials'],
+                    group['weighted_average_value'], group['fifo_value'],
+                ))
+        if options['materials']:
+            self.stdout.write(self.style.MIGRATE_HEADING("Par matière"))
+            for line in data['materials']:
+                self.stdout.write(row.format(
+                    f"{line['sku']} {line['name']}"[:40], line['quantity'],
+                    line['weighted_average_value'], line['fifo_value'],
+                ))
+        totals = data['totals']
+        self.stdout.write(self.style.SUCCESS(
+            f"Total : {totals['materials']} matière(s), CMP {totals['weighted_average_value']}, "
+            f"FIFO {totals['fifo_value']}"
+        ))
@@ -0,0 +1,55 @@
+"""
+Compteurs applicatifs partagés entre les workers, tenus en base (MetricCounter).
+
+Chaque incrément est un UPDATE value = value + n : aucun n'est perdu quand
+plusieurs processus gunicorn ou threads de run_ai_worker comptent en même
+temps, ce que ne garantit pas cache.incr() (lecture puis écriture). Les
+compteurs survivent aux redémarrages ; reset() les remet à zéro.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MetricCounter
+
+
+def increment(name, amount=1):
+    if MetricCounter.objects.filter(name=name).update(value=F('value') + amount):
+        return
+    try:
+        with transaction.atomic():
+            MetricCounter.objects.create(name=name, value=amount)
+    except IntegrityError:
+        # Compteur créé entre-temps par un autre worker
+        MetricCounter.objects.filter(name=name).update(value=F('value') + amount)
+
+
+def observe(name, value, buckets):
+    """
+    Ajoute une mesure à l'histogramme `name` : compte, somme et effectif du
+    premier seuil de `buckets` (croissants) qui la contient, ou de 'inf'.
+    """
+    bucket = next((str(limit) for limit in buckets if value <= limit), 'inf')
+    increment(f'{name}.count')
+    increment(f'{name}.sum', round(value))
+    increment(f'{name}.le_{bucket}')
+
+
+def histogram(name, buckets):
+    """Lecture d'un histogramme tenu par observe() : compte, moyenne et effectifs par seuil"""
+    labels = [str(limit) for limit in buckets] + ['inf']
+    values = snapshot([f'{name}.count', f'{name}.sum'] + [f'{name}.le_{label}' for label in labels])
+    count = values[f'{name}.count']
+    return {
+        'count': count,
+        'mean': round(values[f'{name}.sum'] / count, 1) if count else None,
+        'buckets': {label: values[f'{name}.le_{label}'] for label in labels},
+    }
+
+
+def snapshot(names):
+    values = dict(MetricCounter.objects.filter(name__in=names).values_list('name', 'value'))
+    return {name: values.get(name, 0) for name in names}
+
+
+def reset(names):
+    MetricCounter.objects.filter(name__in=names).delete()
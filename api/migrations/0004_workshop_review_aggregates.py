@@ -0,0 +1,36 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_review_aggregates(apps, schema_editor):
+    Workshop = apps.get_model('api', 'Workshop')
+    Review = apps.get_model('api', 'Review')
+    reviews = Review.objects.filter(workshop=OuterRef('pk')).order_by().values('workshop')
+    Workshop.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), Value(0)),
+        review_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_workshop_specialties'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workshop',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workshop',
+            name='review_sum',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_review_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_workshop_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['workshop', '-date', '-id'], name='review_workshop_date_idx'),
+        ),
+    ]
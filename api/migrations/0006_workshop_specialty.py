@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_specialties(apps, schema_editor):
+    Workshop = apps.get_model('api', 'Workshop')
+    WorkshopSpecialty = apps.get_model('api', 'WorkshopSpecialty')
+    links = []
+    for workshop_id, specialties in Workshop.objects.values_list('id', 'specialties'):
+        if not isinstance(specialties, list):
+            continue
+        codes = {str(s).strip()[:50] for s in specialties if str(s).strip()}
+        links.extend(WorkshopSpecialty(workshop_id=workshop_id, code=code) for code in codes)
+    WorkshopSpecialty.objects.bulk_create(links, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_review_workshop_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkshopSpecialty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50)),
+                ('workshop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='specialty_links', to='api.workshop')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='workshopspecialty',
+            constraint=models.UniqueConstraint(fields=('code', 'workshop'), name='unique_workshop_specialty'),
+        ),
+        migrations.RunPython(populate_specialties, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+# Index natif propre à chaque moteur, voir api/search.py
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE api_searchentry_fts USING fts5(
+        keywords, body, content='api_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER api_searchentry_ai AFTER INSERT ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(rowid, keywords, body) VALUES (new.id, new.keywords, new.body);
+    END""",
+    """CREATE TRIGGER api_searchentry_ad AFTER DELETE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, keywords, body)
+        VALUES ('delete', old.id, old.keywords, old.body);
+    END""",
+    """CREATE TRIGGER api_searchentry_au AFTER UPDATE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, keywords, body)
+        VALUES ('delete', old.id, old.keywords, old.body);
+        INSERT INTO api_searchentry_fts(rowid, keywords, body) VALUES (new.id, new.keywords, new.body);
+    END""",
+]
+
+SQLITE_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS api_searchentry_ai',
+    'DROP TRIGGER IF EXISTS api_searchentry_ad',
+    'DROP TRIGGER IF EXISTS api_searchentry_au',
+    'DROP TABLE IF EXISTS api_searchentry_fts',
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE api_searchentry ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(keywords, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED""",
+    'CREATE INDEX api_searchentry_vector_idx ON api_searchentry USING GIN (search_vector)',
+]
+
+POSTGRES_TEARDOWN = [
+    'DROP INDEX IF EXISTS api_searchentry_vector_idx',
+    'ALTER TABLE api_searchentry DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any('FTS5' in row[0] for row in cursor.fetchall())
+
+
+def create_native_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and sqlite_has_fts5(connection):
+        statements = SQLITE_SETUP
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRES_SETUP
+    else:
+        # Pas d'index natif : api.search utilisera un filtre LIKE
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_native_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_TEARDOWN,
+        'postgresql': POSTGRES_TEARDOWN,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_workshop_specialty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('workshop', 'Atelier'), ('model', 'Modèle'), ('material', 'Matière'), ('supplier', 'Fournisseur')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('subtitle', models.CharField(blank=True, max_length=200)),
+                ('keywords', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('doc_type', 'object_id'), name='unique_search_entry'),
+        ),
+        migrations.RunPython(create_native_index, drop_native_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def geocode_workshops(apps, schema_editor):
+    from api.geo import geocode_address, geohash_encode
+
+    Workshop = apps.get_model('api', 'Workshop')
+    for workshop in Workshop.objects.only('id', 'address').iterator():
+        coordinates = geocode_address(workshop.address)
+        if coordinates:
+            Workshop.objects.filter(pk=workshop.pk).update(
+                latitude=coordinates[0],
+                longitude=coordinates[1],
+                location_source='gazetteer',
+                geohash=geohash_encode(*coordinates),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_search_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workshop',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='workshop',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='workshop',
+            name='location_source',
+            field=models.CharField(blank=True, choices=[('client', 'Client'), ('gazetteer', 'Gazetteer')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='workshop',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.RunPython(geocode_workshops, migrations.RunPython.noop),
+    ]
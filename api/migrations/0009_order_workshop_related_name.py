@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_workshop_location'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='workshop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='api.workshop'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_opening_checkpoints(apps, schema_editor):
+    # Le solde actuel sert de point de départ : l'historique antérieur est
+    # rejoué à rebours depuis ce point
+    Material = apps.get_model('api', 'Material')
+    StockCheckpoint = apps.get_model('api', 'StockCheckpoint')
+    now = timezone.now()
+    StockCheckpoint.objects.bulk_create(
+        [
+            StockCheckpoint(material_id=pk, taken_at=now, balance=stock)
+            for pk, stock in Material.objects.values_list('pk', 'current_stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(help_text="Le solde inclut les mouvements créés jusqu'à cet instant")),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='api.material')),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['material', '-taken_at'], name='checkpoint_material_idx')],
+            },
+        ),
+        migrations.RunPython(create_opening_checkpoints, migrations.RunPython.noop),
+    ]
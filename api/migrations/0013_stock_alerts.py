@@ -0,0 +1,80 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+
+
+def populate_stock_status(apps, schema_editor):
+    Material = apps.get_model('api', 'Material')
+    StockAlert = apps.get_model('api', 'StockAlert')
+    Material.objects.update(stock_status=Case(
+        When(current_stock__lte=0, then=Value('out_of_stock')),
+        When(current_stock__lte=F('min_stock_level'), then=Value('low_stock')),
+        default=Value('in_stock'),
+    ))
+    StockAlert.objects.bulk_create(
+        [
+            StockAlert(material_id=pk, supplier_id=supplier_id, status=status,
+                       stock_level=stock, threshold=threshold)
+            for pk, supplier_id, status, stock, threshold in (
+                Material.objects.exclude(stock_status='in_stock')
+                .values_list('pk', 'supplier_id', 'stock_status', 'current_stock', 'min_stock_level')
+                .iterator()
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_stock_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('low_stock', 'Stock bas'), ('out_of_stock', 'Rupture')], max_length=20)),
+                ('stock_level', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('threshold', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='stock_status',
+            field=models.CharField(choices=[('in_stock', 'En stock'), ('low_stock', 'Stock bas'), ('out_of_stock', 'Rupture')], default='in_stock', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['stock_status', 'supplier'], name='material_stock_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='material',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='api.material'),
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='supplier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='api.supplier'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['supplier', '-created_at'], name='stock_alert_open_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('material',), name='unique_open_stock_alert'),
+        ),
+        migrations.RunPython(populate_stock_status, migrations.RunPython.noop),
+    ]
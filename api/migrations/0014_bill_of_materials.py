@@ -0,0 +1,63 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:50
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='reserved_stock',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='BillOfMaterialsItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.001'))])),
+                ('unit', models.CharField(choices=[('m', 'Mètre'), ('cm', 'Centimètre'), ('kg', 'Kilogramme'), ('g', 'Gramme'), ('pcs', 'Pièce'), ('roll', 'Rouleau'), ('sheet', 'Feuille')], max_length=10)),
+                ('material_quantity', models.DecimalField(decimal_places=3, editable=False, max_digits=10)),
+                ('notes', models.CharField(blank=True, max_length=200)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bom_items', to='api.material')),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bom_items', to='api.clothingmodel')),
+            ],
+            options={
+                'ordering': ['model', 'material'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('reserved', 'Réservée'), ('released', 'Libérée'), ('consumed', 'Consommée')], default='reserved', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reservations', to='api.material')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='billofmaterialsitem',
+            constraint=models.UniqueConstraint(fields=('model', 'material'), name='unique_bom_item'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['material', 'status'], name='reservation_material_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.UniqueConstraint(fields=('order', 'material'), name='unique_order_reservation'),
+        ),
+    ]
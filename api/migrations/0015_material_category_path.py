@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    MaterialCategory = apps.get_model('api', 'MaterialCategory')
+    parents = dict(MaterialCategory.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def resolve(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            prefix, depth = resolve(parent_id) if parent_id else ('', -1)
+            paths[pk] = (prefix + '{:08d}/'.format(pk), depth + 1)
+        return paths[pk]
+
+    categories = list(MaterialCategory.objects.all())
+    for category in categories:
+        category.path, category.depth = resolve(category.pk)
+    MaterialCategory.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_bill_of_materials'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialcategory',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='materialcategory',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_material_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('draft', 'Brouillon'), ('approved', 'Validé'), ('sent', 'Envoyé')], default='draft', max_length=20)),
+                ('coverage_days', models.PositiveIntegerField(help_text='Nombre de jours de consommation à couvrir')),
+                ('lookback_days', models.PositiveIntegerField(help_text="Période d'observation des sorties")),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('generated_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_drafts', to='api.supplier')),
+            ],
+            options={
+                'ordering': ['-generated_at', 'supplier'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrderDraftLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('current_stock', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reserved_stock', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('daily_usage', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('target_stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('suggested_quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('draft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='api.purchaseorderdraft')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_draft_lines', to='api.material')),
+            ],
+            options={
+                'ordering': ['draft', 'material'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderdraft',
+            index=models.Index(fields=['status', '-generated_at'], name='purchase_draft_status_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothingmodel',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='clothingmodel',
+            name='source_material',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='suggested_models', to='api.material'),
+        ),
+    ]
@@ -1,7 +1,20 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+class InsufficientStock(Exception):
+    """Sortie de stock refusée : le solde de la matière deviendrait négatif"""
+    def __init__(self, material_id, quantity):
+        self.material_id = material_id
+        self.quantity = quantity
+        super().__init__(f"Stock insuffisant pour la matière {material_id} ({quantity} demandé)")
+
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
         ('client', 'Client'),
@@ -12,6 +25,8 @@ class User(AbstractUser):
     phone = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profiles/', null=True, blank=True)
+    # Versions redimensionnées (voir api.images) : {format: {largeur: chemin}}
+    profile_picture_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     # Ajout des related_name pour résoudre les conflits
     groups = models.ManyToManyField(
@@ -61,6 +76,7 @@ class Workshop(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     logo = models.ImageField(upload_to='workshops/logos/')
+    logo_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     address = models.CharField(max_length=200)
     phone = models.CharField(max_length=15, blank=True, help_text="Numéro de téléphone de l'atelier")
     rating = models.FloatField(
@@ -77,19 +93,68 @@ class Workshop(models.Model):
     estimated_delivery_time = models.IntegerField(help_text="En jours")
     price_range_min = models.DecimalField(max_digits=10, decimal_places=2)
     price_range_max = models.DecimalField(max_digits=10, decimal_places=2)
+    latitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Coordonnées fournies par le client, ou déduites de l'adresse via le gazetteer
+    location_source = models.CharField(
+        max_length=10, blank=True,
+        choices=[('client', 'Client'), ('gazetteer', 'Gazetteer')]
+    )
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     is_verified = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # Agrégats des avis, tenus à jour par Review.save() et le signal post_delete
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    review_sum = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.update_location()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'latitude', 'longitude', 'location_source', 'geohash'
+            }
+        super().save(*args, **kwargs)
+
+    def update_location(self):
+        """Géocode l'adresse hors ligne si besoin et recalcule le geohash"""
+        from .geo import geocode_address, geohash_encode
+
+        if self.location_source != 'client':
+            coordinates = geocode_address(self.address)
+            if coordinates:
+                self.latitude, self.longitude = coordinates
+                self.location_source = 'gazetteer'
+            elif self.location_source == 'gazetteer':
+                self.latitude = self.longitude = None
+                self.location_source = ''
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
     def average_rating(self):
-        reviews = self.reviews.all()
-        if not reviews:
+        if not self.review_count:
             return 0
-        return sum(review.rating for review in reviews) / len(reviews)
+        return self.review_sum / self.review_count
+
+    @classmethod
+    def apply_review_delta(cls, workshop_id, count, total):
+        """Applique une variation aux agrégats d'avis en une seule requête UPDATE"""
+        cls.objects.filter(pk=workshop_id).update(
+            review_count=F('review_count') + count,
+            review_sum=F('review_sum') + total,
+        )
 
     def get_specialties_display(self):
         """Retourne les spécialités sous forme de texte lisible"""
@@ -97,6 +162,41 @@ class Workshop(models.Model):
             return ', '.join(self.specialties)
         return str(self.specialties)
 
+    def specialty_codes(self):
+        """Retourne l'ensemble des spécialités déclarées dans le champ JSON"""
+        if not isinstance(self.specialties, list):
+            return set()
+        max_length = WorkshopSpecialty._meta.get_field('code').max_length
+        return {str(s).strip()[:max_length] for s in self.specialties if str(s).strip()}
+
+    def sync_specialties(self):
+        """Aligne la table WorkshopSpecialty sur le champ JSON specialties"""
+        wanted = self.specialty_codes()
+        current = set(self.specialty_links.values_list('code', flat=True))
+        if current - wanted:
+            self.specialty_links.filter(code__in=current - wanted).delete()
+        if wanted - current:
+            WorkshopSpecialty.objects.bulk_create(
+                [WorkshopSpecialty(workshop=self, code=code) for code in wanted - current],
+                ignore_conflicts=True,
+            )
+
+class WorkshopSpecialty(models.Model):
+    """
+    Spécialités normalisées d'un atelier (une ligne par spécialité), copie indexée
+    de Workshop.specialties utilisée pour le filtrage.
+    """
+    workshop = models.ForeignKey(Workshop, related_name='specialty_links', on_delete=models.CASCADE)
+    code = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['code', 'workshop'], name='unique_workshop_specialty'),
+        ]
+
+    def __str__(self):
+        return self.code
+
 class ClothingModel(models.Model):
     CATEGORY_CHOICES = [
         ('shirt', 'Chemise'),
@@ -115,6 +215,10 @@ class ClothingModel(models.Model):
     featured = models.BooleanField(default=False)
     styles = models.JSONField()
     is_active = models.BooleanField(default=True)
+    # Suggestion générée par IA (voir chatgpt.batch), à valider avant publication
+    is_draft = models.BooleanField(default=False)
+    source_material = models.ForeignKey('Material', null=True, blank=True, on_delete=models.SET_NULL,
+                                        related_name='suggested_models')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     model_3d_url = models.URLField(blank=True, help_text="URL du modèle 3D")
@@ -125,6 +229,12 @@ class ClothingModel(models.Model):
 class ModelImage(models.Model):
     model = models.ForeignKey(ClothingModel, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='models/')
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Aperçu calculé au téléversement (voir api.images.describe_image)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, editable=False)
     is_preview = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
 
@@ -134,6 +244,12 @@ class ModelImage(models.Model):
 class WorkshopImage(models.Model):
     workshop = models.ForeignKey(Workshop, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='workshops/')
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Aperçu calculé au téléversement (voir api.images.describe_image)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, editable=False)
     is_preview = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
 
@@ -150,6 +266,29 @@ class Review(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['workshop', '-date', '-id'], name='review_workshop_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # L'avis et les agrégats de l'atelier sont écrits dans la même transaction
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = (
+                    Review.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('workshop_id', 'rating')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            if previous is None:
+                Workshop.apply_review_delta(self.workshop_id, 1, self.rating)
+            elif previous['workshop_id'] == self.workshop_id:
+                Workshop.apply_review_delta(self.workshop_id, 0, self.rating - previous['rating'])
+            else:
+                Workshop.apply_review_delta(previous['workshop_id'], -1, -previous['rating'])
+                Workshop.apply_review_delta(self.workshop_id, 1, self.rating)
 
 class Measurements(models.Model):
     SIZE_CHOICES = [
@@ -203,7 +342,7 @@ class Order(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     model = models.ForeignKey(ClothingModel, on_delete=models.PROTECT)
-    workshop = models.ForeignKey(Workshop, on_delete=models.PROTECT)
+    workshop = models.ForeignKey(Workshop, on_delete=models.PROTECT, related_name='orders')
     measurements = models.ForeignKey(Measurements, on_delete=models.PROTECT)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -220,6 +359,105 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Pagination par curseur (voir api.pagination.OrderPagination)
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # La commande et les agrégats journaliers sont écrits dans la même transaction
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = (
+                    Order.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('created_at', 'workshop_id', 'status', 'payment_status', 'total_price')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            OrderDailyRollup.record_change(previous, self)
+            if previous is None or previous['status'] != self.status:
+                from .stock import apply_order_status
+                apply_order_status(self)
+
+class OrderDailyRollup(models.Model):
+    """
+    Agrégat journalier des commandes par (jour, atelier, statut, statut de paiement).
+    Tenu à jour par Order.save() et le signal post_delete ; reconstruit par la
+    commande rebuild_order_rollups. Les tableaux de bord ne lisent que cette table.
+    """
+    day = models.DateField()
+    workshop = models.ForeignKey(Workshop, on_delete=models.CASCADE, related_name='daily_order_rollups')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    payment_status = models.CharField(max_length=20, choices=Order.PAYMENT_STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['workshop', 'day', 'status', 'payment_status'],
+                name='unique_order_daily_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='order_rollup_day_idx'),
+        ]
+
+    @classmethod
+    def apply_delta(cls, created_at, workshop_id, status, payment_status, count, revenue):
+        key = {
+            'day': timezone.localdate(created_at),
+            'workshop_id': workshop_id,
+            'status': status,
+            'payment_status': payment_status,
+        }
+        updated = cls.objects.filter(**key).update(
+            order_count=F('order_count') + count,
+            revenue=F('revenue') + revenue,
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(order_count=count, revenue=revenue, **key)
+            except IntegrityError:
+                # Ligne créée entre-temps par une autre transaction
+                cls.objects.filter(**key).update(
+                    order_count=F('order_count') + count,
+                    revenue=F('revenue') + revenue,
+                )
+
+    @classmethod
+    def record_change(cls, previous, order):
+        """Reporte la création ou la modification d'une commande (previous : valeurs avant save)"""
+        total_price = Decimal(str(order.total_price))
+        if previous is not None:
+            unchanged = (
+                timezone.localdate(previous['created_at']) == timezone.localdate(order.created_at)
+                and previous['workshop_id'] == order.workshop_id
+                and previous['status'] == order.status
+                and previous['payment_status'] == order.payment_status
+                and previous['total_price'] == total_price
+            )
+            if unchanged:
+                return
+            cls.apply_delta(
+                previous['created_at'], previous['workshop_id'], previous['status'],
+                previous['payment_status'], -1, -previous['total_price']
+            )
+        cls.apply_delta(
+            order.created_at, order.workshop_id, order.status, order.payment_status, 1, total_price
+        )
+
+    @classmethod
+    def record_delete(cls, order):
+        cls.apply_delta(
+            order.created_at, order.workshop_id, order.status, order.payment_status,
+            -1, -Decimal(str(order.total_price))
+        )
 
 class OrderStatusUpdate(models.Model):
     order = models.ForeignKey(Order, related_name='status_updates', on_delete=models.CASCADE)
@@ -249,9 +487,16 @@ class Supplier(models.Model):
         ordering = ['name']
 
 class MaterialCategory(models.Model):
+    # Chemin matérialisé : identifiants des ancêtres puis de la catégorie, par ex.
+    # "00000003/00000012/". Les descendants d'une catégorie sont les lignes dont
+    # le chemin commence par le sien, ce qui se lit en une requête.
+    PATH_SEGMENT_FORMAT = '{:08d}/'
+
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='children')
+    path = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -262,6 +507,48 @@ class MaterialCategory(models.Model):
         verbose_name_plural = "Material Categories"
         ordering = ['name']
 
+    def clean(self):
+        if self.pk and self.parent_id:
+            parent_path = MaterialCategory.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+            if parent_path and self.path and parent_path.startswith(self.path):
+                raise ValidationError({'parent': "Une catégorie ne peut pas être rangée sous elle-même ou ses descendants"})
+
+    def build_path(self):
+        segment = self.PATH_SEGMENT_FORMAT.format(self.pk)
+        if self.parent_id is None:
+            return segment, 0
+        parent = MaterialCategory.objects.filter(pk=self.parent_id).values('path', 'depth').get()
+        return parent['path'] + segment, parent['depth'] + 1
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                self.path, self.depth = self.build_path()
+                MaterialCategory.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+                return
+            old_path, old_depth = (
+                MaterialCategory.objects.select_for_update()
+                .filter(pk=self.pk).values_list('path', 'depth').get()
+            )
+            path, depth = self.build_path()
+            if path != old_path and path.startswith(old_path):
+                raise ValidationError({'parent': "Une catégorie ne peut pas être rangée sous elle-même ou ses descendants"})
+            self.path, self.depth = path, depth
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'path', 'depth'}
+            super().save(*args, **kwargs)
+            if path != old_path:
+                # Déplacement : un seul UPDATE réécrit le préfixe de tous les descendants
+                MaterialCategory.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (depth - old_depth),
+                )
+
+    def descendants(self, include_self=True):
+        categories = MaterialCategory.objects.filter(path__startswith=self.path)
+        return categories if include_self else categories.exclude(pk=self.pk)
+
 class Material(models.Model):
     UNIT_CHOICES = [
         ('m', 'Mètre'),
@@ -273,6 +560,12 @@ class Material(models.Model):
         ('sheet', 'Feuille'),
     ]
 
+    STOCK_STATUS_CHOICES = [
+        ('in_stock', 'En stock'),
+        ('low_stock', 'Stock bas'),
+        ('out_of_stock', 'Rupture'),
+    ]
+
     name = models.CharField(max_length=100)
     sku = models.CharField(max_length=50, unique=True, help_text="Code produit unique")
     category = models.ForeignKey(MaterialCategory, on_delete=models.PROTECT)
@@ -282,6 +575,11 @@ class Material(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT)
     min_stock_level = models.DecimalField(max_digits=10, decimal_places=2, help_text="Niveau minimum de stock pour les alertes")
     current_stock = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Quantité réservée par les commandes confirmées (voir StockReservation)
+    reserved_stock = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Dérivé de current_stock et min_stock_level, recalculé au franchissement d'un seuil
+    stock_status = models.CharField(max_length=20, choices=STOCK_STATUS_CHOICES, default='in_stock',
+                                    editable=False)
     location = models.CharField(max_length=100, blank=True, help_text="Emplacement dans l'atelier")
     color = models.CharField(max_length=50, blank=True)
     width = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, help_text="Largeur en cm")
@@ -294,6 +592,70 @@ class Material(models.Model):
 
     class Meta:
         ordering = ['category', 'name']
+        indexes = [
+            models.Index(fields=['category', 'name', 'id'], name='material_category_name_idx'),
+            models.Index(fields=['stock_status', 'supplier'], name='material_stock_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # current_stock n'évolue que par les mouvements de stock (mise à jour F()
+        # atomique) : enregistrer la fiche ne doit pas écraser un solde plus récent
+        if not adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('current_stock', 'reserved_stock', 'stock_status')
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                # Solde d'ouverture : point de départ du rejeu du registre
+                StockCheckpoint.objects.create(material=self, taken_at=self.created_at, balance=self.current_stock)
+            # min_stock_level a pu changer
+            for _, status in Material.sync_stock_status([self.pk]):
+                self.stock_status = status
+
+    @staticmethod
+    def stock_status_expression():
+        return Case(
+            When(current_stock__lte=0, then=Value('out_of_stock')),
+            When(current_stock__lte=F('min_stock_level'), then=Value('low_stock')),
+            default=Value('in_stock'),
+            output_field=models.CharField(),
+        )
+
+    @classmethod
+    def sync_stock_status(cls, material_ids):
+        """
+        Recalcule stock_status des matières qui ont franchi un seuil et émet les
+        alertes correspondantes. Sans franchissement, une seule requête de lecture.
+        Retourne [(material_id, nouveau statut)].
+        """
+        changed = list(
+            cls.objects.filter(pk__in=material_ids)
+            .annotate(new_status=cls.stock_status_expression())
+            .exclude(stock_status=F('new_status'))
+            .values_list('pk', 'new_status', 'supplier_id', 'current_stock', 'min_stock_level')
+        )
+        if not changed:
+            return []
+        cls.objects.filter(pk__in=[row[0] for row in changed]).update(stock_status=cls.stock_status_expression())
+        StockAlert.record_transitions(changed)
+        return [(row[0], row[1]) for row in changed]
+
+    @classmethod
+    def apply_stock_delta(cls, material_id, delta):
+        """
+        Ajoute delta au stock en une seule requête UPDATE. Une diminution n'est
+        appliquée que si le stock la couvre (condition dans la même requête),
+        sinon InsufficientStock est levée.
+        """
+        materials = cls.objects.filter(pk=material_id)
+        if delta < 0:
+            materials = materials.filter(current_stock__gte=-delta)
+        if not materials.update(current_stock=F('current_stock') + delta):
+            raise InsufficientStock(material_id, -delta)
+        cls.sync_stock_status([material_id])
 
 class StockMovement(models.Model):
     MOVEMENT_TYPE_CHOICES = [
@@ -317,19 +679,315 @@ class StockMovement(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='stockmove_created_idx'),
+            models.Index(fields=['material', '-created_at', '-id'], name='stockmove_material_created_idx'),
+        ]
+
+    @classmethod
+    def stock_delta(cls, movement_type, quantity):
+        """Effet d'un mouvement sur le stock : entrées et retours ajoutent, sorties et ajustements retirent"""
+        if movement_type in ['in', 'return']:
+            return quantity
+        elif movement_type in ['out', 'adjustment']:
+            return -quantity
+        return 0
 
     def save(self, *args, **kwargs):
-        # Mettre à jour le stock du matériau
-        if self.movement_type in ['in', 'return']:
-            self.material.current_stock += self.quantity
-        elif self.movement_type in ['out', 'adjustment']:
-            self.material.current_stock -= self.quantity
-        self.material.save()
+        # Le mouvement et la mise à jour du stock sont écrits dans la même transaction
+        with transaction.atomic():
+            deltas = {}
+            if self.pk:
+                previous = (
+                    StockMovement.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('material_id', 'movement_type', 'quantity')
+                    .first()
+                )
+                if previous:
+                    deltas[previous['material_id']] = -self.stock_delta(previous['movement_type'], previous['quantity'])
+                    self._invalidate_checkpoints({previous['material_id'], self.material_id})
+            quantity = Decimal(str(self.quantity))
+            deltas[self.material_id] = deltas.get(self.material_id, 0) + self.stock_delta(self.movement_type, quantity)
+            # Les hausses d'abord, pour qu'une correction ne soit pas refusée à tort
+            for material_id, delta in sorted(deltas.items(), key=lambda item: item[1], reverse=True):
+                if delta:
+                    Material.apply_stock_delta(material_id, delta)
+            super().save(*args, **kwargs)
+        self._refresh_material_stock()
+
+    def delete(self, *args, **kwargs):
+        # Supprimer un mouvement annule son effet sur le stock
+        with transaction.atomic():
+            Material.apply_stock_delta(self.material_id, -self.stock_delta(self.movement_type, self.quantity))
+            self._invalidate_checkpoints({self.material_id})
+            result = super().delete(*args, **kwargs)
+        self._refresh_material_stock()
+        return result
+
+    def _invalidate_checkpoints(self, material_ids):
+        # Un mouvement modifié ou supprimé fausse les soldes des points de contrôle
+        # pris depuis : ils sont supprimés (checkpoint_stock les recrée)
+        StockCheckpoint.objects.filter(material_id__in=material_ids, taken_at__gte=self.created_at).delete()
+
+    def _refresh_material_stock(self):
+        material = self._state.fields_cache.get('material')
+        if material is not None:
+            material.refresh_from_db(fields=['current_stock'])
+
+class BillOfMaterialsItem(models.Model):
+    """Nomenclature : quantité d'une matière nécessaire pour confectionner un modèle"""
+    # Facteurs de conversion vers l'unité de la matière
+    UNIT_CONVERSIONS = {
+        ('cm', 'm'): Decimal('0.01'),
+        ('m', 'cm'): Decimal('100'),
+        ('g', 'kg'): Decimal('0.001'),
+        ('kg', 'g'): Decimal('1000'),
+    }
+
+    model = models.ForeignKey(ClothingModel, on_delete=models.CASCADE, related_name='bom_items')
+    material = models.ForeignKey(Material, on_delete=models.PROTECT, related_name='bom_items')
+    quantity = models.DecimalField(max_digits=10, decimal_places=3, validators=[MinValueValidator(Decimal('0.001'))])
+    unit = models.CharField(max_length=10, choices=Material.UNIT_CHOICES)
+    # quantity convertie dans l'unité de la matière, utilisée pour les réservations
+    material_quantity = models.DecimalField(max_digits=10, decimal_places=3, editable=False)
+    notes = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['model', 'material']
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'material'], name='unique_bom_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_id} : {self.quantity} {self.unit} de {self.material_id}"
+
+    @classmethod
+    def convert(cls, quantity, unit, target_unit):
+        if unit == target_unit:
+            return quantity
+        try:
+            return quantity * cls.UNIT_CONVERSIONS[(unit, target_unit)]
+        except KeyError:
+            raise ValidationError(f"Unité {unit} incompatible avec l'unité de la matière ({target_unit})")
+
+    def clean(self):
+        if self.material_id and self.unit and self.quantity is not None:
+            self.convert(self.quantity, self.unit, self.material.unit)
+
+    def save(self, *args, **kwargs):
+        self.material_quantity = self.convert(Decimal(str(self.quantity)), self.unit, self.material.unit)
         super().save(*args, **kwargs)
 
+class StockReservation(models.Model):
+    """
+    Matière réservée pour une commande : réservée à la confirmation, libérée à
+    l'annulation, consommée (mouvement de sortie) à la mise en fabrication.
+    """
+    STATUS_CHOICES = [
+        ('reserved', 'Réservée'),
+        ('released', 'Libérée'),
+        ('consumed', 'Consommée'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    material = models.ForeignKey(Material, on_delete=models.PROTECT, related_name='reservations')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='reserved')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'material'], name='unique_order_reservation'),
+        ]
+        indexes = [
+            models.Index(fields=['material', 'status'], name='reservation_material_idx'),
+        ]
+
+    def __str__(self):
+        return f"Commande {self.order_id} : {self.quantity} de {self.material_id} ({self.status})"
+
+class StockAlert(models.Model):
+    """
+    Alerte de stock bas ou de rupture. Au plus une alerte ouverte par matière :
+    elle est mise à jour si la situation s'aggrave et close au retour en stock.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='stock_alerts')
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='stock_alerts')
+    status = models.CharField(max_length=20, choices=Material.STOCK_STATUS_CHOICES[1:])
+    stock_level = models.DecimalField(max_digits=10, decimal_places=2)
+    threshold = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['material'], condition=Q(resolved_at__isnull=True), name='unique_open_stock_alert',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['supplier', '-created_at'], condition=Q(resolved_at__isnull=True),
+                         name='stock_alert_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} - {self.material_id}"
+
+    @classmethod
+    def record_transitions(cls, changes):
+        """changes : [(material_id, nouveau statut, supplier_id, stock, seuil)]"""
+        now = timezone.now()
+        resolved = [material_id for material_id, status, *_ in changes if status == 'in_stock']
+        if resolved:
+            cls.objects.filter(material_id__in=resolved, resolved_at__isnull=True).update(resolved_at=now)
+        for material_id, status, supplier_id, stock_level, threshold in changes:
+            if status == 'in_stock':
+                continue
+            values = {'status': status, 'supplier_id': supplier_id, 'stock_level': stock_level,
+                      'threshold': threshold, 'updated_at': now}
+            if not cls.objects.filter(material_id=material_id, resolved_at__isnull=True).update(**values):
+                cls.objects.create(material_id=material_id, **values)
+
+class PurchaseOrderDraft(models.Model):
+    """
+    Bon de commande suggéré pour un fournisseur, produit par le planificateur de
+    réapprovisionnement (commande plan_reorders). Les brouillons sont remplacés à
+    chaque calcul ; les bons validés ou envoyés sont conservés.
+    """
+    STATUS_CHOICES = [
+        ('draft', 'Brouillon'),
+        ('approved', 'Validé'),
+        ('sent', 'Envoyé'),
+    ]
+
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='purchase_drafts')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    coverage_days = models.PositiveIntegerField(help_text="Nombre de jours de consommation à couvrir")
+    lookback_days = models.PositiveIntegerField(help_text="Période d'observation des sorties")
+    line_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    generated_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-generated_at', 'supplier']
+        indexes = [
+            models.Index(fields=['status', '-generated_at'], name='purchase_draft_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier_id} - {self.get_status_display()} ({self.generated_at:%Y-%m-%d})"
+
+class PurchaseOrderDraftLine(models.Model):
+    draft = models.ForeignKey(PurchaseOrderDraft, on_delete=models.CASCADE, related_name='lines')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='purchase_draft_lines')
+    current_stock = models.DecimalField(max_digits=10, decimal_places=2)
+    reserved_stock = models.DecimalField(max_digits=10, decimal_places=2)
+    daily_usage = models.DecimalField(max_digits=12, decimal_places=4)
+    target_stock = models.DecimalField(max_digits=12, decimal_places=2)
+    suggested_quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        ordering = ['draft', 'material']
+
+    def __str__(self):
+        return f"{self.material_id} x {self.suggested_quantity}"
+
+class StockCheckpoint(models.Model):
+    """
+    Solde d'une matière à un instant donné. Le stock à une date se calcule à
+    partir du point le plus proche en ne rejouant que les mouvements d'après
+    (ou d'avant) ce point. Créés par la commande checkpoint_stock.
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='checkpoints')
+    taken_at = models.DateTimeField(help_text="Le solde inclut les mouvements créés jusqu'à cet instant")
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['material', '-taken_at'], name='checkpoint_material_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} @ {self.taken_at:%Y-%m-%d %H:%M} : {self.balance}"
+
+class SearchEntry(models.Model):
+    """
+    Document de l'index de recherche plein texte (voir api.search).
+    keywords et body contiennent le texte replié (minuscules, sans accents).
+    """
+    DOC_TYPE_CHOICES = [
+        ('workshop', 'Atelier'),
+        ('model', 'Modèle'),
+        ('material', 'Matière'),
+        ('supplier', 'Fournisseur'),
+    ]
+
+    doc_type = models.CharField(max_length=20, choices=DOC_TYPE_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=200)
+    subtitle = models.CharField(max_length=200, blank=True)
+    keywords = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doc_type', 'object_id'], name='unique_search_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type}:{self.object_id} {self.title}"
+
+class StoredBlob(models.Model):
+    """
+    Fichier média stocké une seule fois sous son empreinte SHA-256 (voir
+    api.storage). ref_count compte les enregistrements moins les suppressions ;
+    un blob sans référence est effacé par la commande cleanup_blobs.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['released_at'], condition=Q(ref_count=0), name='storedblob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.ref_count})"
+
+class MetricCounter(models.Model):
+    """Compteur applicatif (voir api.metrics), incrémenté par un UPDATE atomique"""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
 class MaterialImage(models.Model):
     material = models.ForeignKey(Material, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='materials/')
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Aperçu calculé au téléversement (voir api.images.describe_image)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, editable=False)
     is_preview = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
 
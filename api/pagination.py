@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par clé (keyset) sur un tuple de colonnes, par ex. ('-date', '-id').
+
+    Le curseur encode les valeurs de tri de la dernière ligne renvoyée : la page
+    suivante est une simple comparaison de tuple servie par l'index, sans OFFSET,
+    donc en temps constant quelle que soit la profondeur. La pagination ne va que
+    vers l'avant. Le dernier champ de `ordering` doit être unique (id).
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        fields = self.get_ordering_fields(queryset.model)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, fields)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(fields, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        page = results[:self.page_size]
+        self.next_position = self.position_from(page[-1], fields) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering_fields(self, model):
+        """Retourne [(champ du modèle, descendant)] pour chaque élément de `ordering`"""
+        fields = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            try:
+                field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(f"{type(self).__name__}: champ de tri inconnu '{name}'")
+            fields.append((field, descending))
+        return fields
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position_from(self, obj, fields):
+        return [getattr(obj, field.attname) for field, _ in fields]
+
+    def position_filter(self, fields, position):
+        # (a, b, c) après (va, vb, vc) :
+        #   a > va  OR  (a = va AND b > vb)  OR  (a = va AND b = vb AND c > vc)
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(fields, position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def encode_cursor(self, position):
+        values = [str(v) if isinstance(v, Decimal) else v for v in position]
+        values = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for (field, _), value in zip(fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ReviewPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class StockMovementPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class MaterialPagination(KeysetPagination):
+    # Meta.ordering trie par nom de catégorie ; le curseur compare l'identifiant
+    # de catégorie, ce qui garde les matières groupées par catégorie
+    ordering = ('category_id', 'name', 'id')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('id',)
+    max_page_size = 200
@@ -0,0 +1,96 @@
+"""
+Planification du réapprovisionnement.
+
+Pour chaque matière active d'un fournisseur actif, la consommation journalière
+est estimée à partir des sorties récentes ; la quantité suggérée ramène le stock
+disponible (stock courant moins réservations) au niveau couvrant `coverage_days`
+jours de consommation au-dessus du stock minimum. Les suggestions sont groupées
+en brouillons de bons de commande par fournisseur et enregistrées : le tableau
+de bord lit ces tables, sans agrégat à la volée.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Material, PurchaseOrderDraft, PurchaseOrderDraftLine
+
+DEFAULT_COVERAGE_DAYS = 30
+DEFAULT_LOOKBACK_DAYS = 60
+CENT = Decimal('0.01')
+
+
+def material_usage(lookback_days, now=None):
+    """Matières actives des fournisseurs actifs avec leurs sorties sur la période, en une requête"""
+    since = (now or timezone.now()) - timedelta(days=lookback_days)
+    return (
+        Material.objects
+        .filter(is_active=True, supplier__is_active=True)
+        .annotate(usage=Coalesce(
+            Sum('movements__quantity', filter=Q(movements__movement_type='out', movements__created_at__gte=since)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ))
+        .values('id', 'supplier_id', 'current_stock', 'reserved_stock', 'min_stock_level', 'unit_price', 'usage')
+        .order_by('supplier_id', 'id')
+    )
+
+
+def suggest_line(material, coverage_days, lookback_days):
+    """Ligne suggérée pour une matière, ou None si le stock disponible couvre le besoin"""
+    daily_usage = material['usage'] / lookback_days
+    target = material['min_stock_level'] + daily_usage * coverage_days
+    available = material['current_stock'] - material['reserved_stock']
+    if available > material['min_stock_level'] and available >= target:
+        return None
+    # Quantités entières, arrondies au-dessus ; au moins de quoi repasser au-dessus du minimum
+    quantity = Decimal(max(math.ceil(target - available), 1))
+    return PurchaseOrderDraftLine(
+        material_id=material['id'],
+        current_stock=material['current_stock'],
+        reserved_stock=material['reserved_stock'],
+        daily_usage=daily_usage.quantize(Decimal('0.0001')),
+        target_stock=target.quantize(CENT),
+        suggested_quantity=quantity,
+        unit_price=material['unit_price'],
+        amount=(quantity * material['unit_price']).quantize(CENT),
+    )
+
+
+def plan_reorders(coverage_days=DEFAULT_COVERAGE_DAYS, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Recalcule les brouillons de tous les fournisseurs en une passe. Remplace les
+    brouillons précédents (statut draft) ; retourne la liste des brouillons créés.
+    """
+    now = timezone.now()
+    lines_by_supplier = {}
+    for material in material_usage(lookback_days, now).iterator(chunk_size=2000):
+        line = suggest_line(material, coverage_days, lookback_days)
+        if line is not None:
+            lines_by_supplier.setdefault(material['supplier_id'], []).append(line)
+
+    drafts = [
+        PurchaseOrderDraft(
+            supplier_id=supplier_id,
+            coverage_days=coverage_days,
+            lookback_days=lookback_days,
+            line_count=len(lines),
+            total_amount=sum((line.amount for line in lines), Decimal('0')),
+            generated_at=now,
+        )
+        for supplier_id, lines in lines_by_supplier.items()
+    ]
+    with transaction.atomic():
+        PurchaseOrderDraft.objects.filter(status='draft').delete()
+        PurchaseOrderDraft.objects.bulk_create(drafts)
+        for draft in drafts:
+            for line in lines_by_supplier[draft.supplier_id]:
+                line.draft = draft
+        PurchaseOrderDraftLine.objects.bulk_create(
+            [line for lines in lines_by_supplier.values() for line in lines], batch_size=1000
+        )
+    return drafts
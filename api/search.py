@@ -0,0 +1,250 @@
+"""
+Index de recherche plein texte commun aux ateliers, modèles, matières et fournisseurs.
+
+Chaque objet indexé correspond à une ligne SearchEntry dont le texte est replié
+(minuscules, sans accents). La table est doublée d'un index natif :
+  - SQLite : table virtuelle FTS5 (api_searchentry_fts) tenue à jour par triggers
+  - Postgres : colonne générée search_vector (tsvector) indexée en GIN
+Les autres moteurs retombent sur un filtre LIKE.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import SearchEntry, Workshop, ClothingModel, Material, Supplier
+
+MAX_QUERY_TOKENS = 8
+
+FTS_TABLE = 'api_searchentry_fts'
+
+
+def fold(text):
+    """Replie un texte pour l'index : minuscules et accents retirés (é -> e, ç -> c)"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(query):
+    return re.findall(r'\w+', fold(query))[:MAX_QUERY_TOKENS]
+
+
+def _join(*parts):
+    return ' '.join(str(p) for p in parts if p)
+
+
+def _workshop_document(workshop):
+    specialties = workshop.specialties if isinstance(workshop.specialties, list) else []
+    return {
+        'title': workshop.name,
+        'subtitle': workshop.address,
+        'keywords': workshop.name,
+        'body': _join(workshop.description, workshop.address, ' '.join(map(str, specialties))),
+        'is_active': workshop.is_active,
+    }
+
+
+def _clothing_model_document(model):
+    styles = model.styles if isinstance(model.styles, list) else []
+    return {
+        'title': model.name,
+        'subtitle': model.get_category_display(),
+        'keywords': model.name,
+        'body': _join(model.description, model.get_category_display(), ' '.join(map(str, styles))),
+        'is_active': model.is_active and not model.is_draft,
+    }
+
+
+def _material_document(material):
+    return {
+        'title': material.name,
+        'subtitle': material.sku,
+        'keywords': _join(material.name, material.sku),
+        'body': _join(material.description, material.color),
+        'is_active': material.is_active,
+    }
+
+
+def _supplier_document(supplier):
+    return {
+        'title': supplier.name,
+        'subtitle': supplier.contact_name,
+        'keywords': supplier.name,
+        'body': _join(supplier.contact_name, supplier.email),
+        'is_active': supplier.is_active,
+    }
+
+
+# doc_type -> (modèle, construction du document)
+DOCUMENT_TYPES = {
+    'workshop': (Workshop, _workshop_document),
+    'model': (ClothingModel, _clothing_model_document),
+    'material': (Material, _material_document),
+    'supplier': (Supplier, _supplier_document),
+}
+
+MODEL_DOC_TYPES = {model: doc_type for doc_type, (model, _) in DOCUMENT_TYPES.items()}
+
+
+def build_entry(doc_type, instance):
+    document = DOCUMENT_TYPES[doc_type][1](instance)
+    document['title'] = (document['title'] or '')[:200]
+    document['subtitle'] = (document['subtitle'] or '')[:200]
+    document['keywords'] = fold(document['keywords'])
+    document['body'] = fold(document['body'])
+    return SearchEntry(doc_type=doc_type, object_id=instance.pk, **document)
+
+
+def index_instance(instance):
+    doc_type = MODEL_DOC_TYPES[type(instance)]
+    entry = build_entry(doc_type, instance)
+    SearchEntry.objects.update_or_create(
+        doc_type=doc_type,
+        object_id=instance.pk,
+        defaults={
+            field: getattr(entry, field)
+            for field in ('title', 'subtitle', 'keywords', 'body', 'is_active')
+        },
+    )
+
+
+def unindex_instance(instance):
+    doc_type = MODEL_DOC_TYPES[type(instance)]
+    SearchEntry.objects.filter(doc_type=doc_type, object_id=instance.pk).delete()
+
+
+def rebuild_index(batch_size=500):
+    """Reconstruit entièrement l'index ; retourne le nombre de documents indexés"""
+    SearchEntry.objects.all().delete()
+    total = 0
+    for doc_type, (model, _) in DOCUMENT_TYPES.items():
+        batch = []
+        for instance in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(build_entry(doc_type, instance))
+            if len(batch) >= batch_size:
+                SearchEntry.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SearchEntry.objects.bulk_create(batch)
+        total += len(batch)
+    if connection.vendor == 'sqlite' and _sqlite_fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def _sqlite_fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _type_filter(doc_types, alias):
+    if not doc_types:
+        return '', []
+    placeholders = ', '.join(['%s'] * len(doc_types))
+    return f' AND {alias}.doc_type IN ({placeholders})', list(doc_types)
+
+
+def _sqlite_match(tokens):
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _postgres_tsquery(tokens):
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def _contains_all(queryset, tokens):
+    for token in tokens:
+        queryset = queryset.filter(Q(keywords__contains=token) | Q(body__contains=token))
+    return queryset
+
+
+def _search_sqlite(tokens, doc_types, active_only, limit, offset):
+    match = _sqlite_match(tokens)
+    type_sql, type_params = _type_filter(doc_types, 'e')
+    active_sql = ' AND e.is_active' if active_only else ''
+    where = f'{FTS_TABLE} MATCH %s{type_sql}{active_sql}'
+    params = [match] + type_params
+    join = f'FROM {FTS_TABLE} JOIN api_searchentry e ON e.id = {FTS_TABLE}.rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) {join} WHERE {where}', params)
+        total = cursor.fetchone()[0]
+        # bm25 : plus petit = plus pertinent ; le titre pèse 10 fois plus que le corps
+        cursor.execute(
+            f'SELECT e.doc_type, e.object_id, e.title, e.subtitle, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank '
+            f'{join} WHERE {where} ORDER BY rank DESC, e.id LIMIT %s OFFSET %s',
+            params + [limit, offset],
+        )
+        rows = cursor.fetchall()
+    return total, rows
+
+
+def _search_postgres(tokens, doc_types, active_only, limit, offset):
+    tsquery = _postgres_tsquery(tokens)
+    type_sql, type_params = _type_filter(doc_types, 'e')
+    active_sql = ' AND e.is_active' if active_only else ''
+    where = f"e.search_vector @@ to_tsquery('simple', %s){type_sql}{active_sql}"
+    params = [tsquery] + type_params
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM api_searchentry e WHERE {where}', params)
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT e.doc_type, e.object_id, e.title, e.subtitle, "
+            "ts_rank_cd(e.search_vector, to_tsquery('simple', %s)) AS rank "
+            f'FROM api_searchentry e WHERE {where} ORDER BY rank DESC, e.id LIMIT %s OFFSET %s',
+            [tsquery] + params + [limit, offset],
+        )
+        rows = cursor.fetchall()
+    return total, rows
+
+
+def _search_fallback(tokens, doc_types, active_only, limit, offset):
+    queryset = _contains_all(SearchEntry.objects.all(), tokens)
+    if doc_types:
+        queryset = queryset.filter(doc_type__in=doc_types)
+    if active_only:
+        queryset = queryset.filter(is_active=True)
+    rows = queryset.order_by('id').values_list('doc_type', 'object_id', 'title', 'subtitle')[offset:offset + limit]
+    return queryset.count(), [row + (0.0,) for row in rows]
+
+
+def search(query, doc_types=None, active_only=True, limit=20, offset=0):
+    """
+    Recherche classée par pertinence.
+    Retourne (nombre total de résultats, [(doc_type, object_id, title, subtitle, rank)]).
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return 0, []
+    if connection.vendor == 'postgresql':
+        return _search_postgres(tokens, doc_types, active_only, limit, offset)
+    if connection.vendor == 'sqlite' and _sqlite_fts_available():
+        return _search_sqlite(tokens, doc_types, active_only, limit, offset)
+    return _search_fallback(tokens, doc_types, active_only, limit, offset)
+
+
+def matching_ids(query, doc_type):
+    """
+    Sous-requête des identifiants des objets d'un type correspondant à la
+    requête (actifs ou non), sans limite : à combiner avec id__in dans le
+    filtre de la vue, avant la pagination.
+    """
+    tokens = tokenize(query)
+    entries = SearchEntry.objects.filter(doc_type=doc_type)
+    if not tokens:
+        entries = entries.none()
+    elif connection.vendor == 'postgresql':
+        entries = entries.filter(id__in=RawSQL(
+            "SELECT id FROM api_searchentry WHERE search_vector @@ to_tsquery('simple', %s)",
+            [_postgres_tsquery(tokens)],
+        ))
+    elif connection.vendor == 'sqlite' and _sqlite_fts_available():
+        entries = entries.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_sqlite_match(tokens)]
+        ))
+    else:
+        entries = _contains_all(entries, tokens)
+    return entries.values('object_id')
@@ -1,16 +1,111 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
 from .models import (
     User, Workshop, ClothingModel, ModelImage, WorkshopImage,
     Review, Measurements, Order, OrderStatusUpdate, Supplier, MaterialCategory,
-    MaterialImage, Material, StockMovement
+    MaterialImage, Material, StockMovement, StockAlert, BillOfMaterialsItem,
+    PurchaseOrderDraft, PurchaseOrderDraftLine
 )
 
-class UserSerializer(serializers.ModelSerializer):
+def query_param_list(request, name):
+    """Valeurs d'un paramètre « a,b,c » (éventuellement répété), ou None s'il est absent"""
+    if request is None or name not in request.query_params:
+        return None
+    values = request.query_params.getlist(name)
+    return {item.strip() for value in values for item in value.split(',') if item.strip()}
+
+class DerivativesField(serializers.ReadOnlyField):
+    """
+    Versions redimensionnées d'une image (voir api.images), en URLs absolues :
+    {"webp": {"320w": url, "640w": url}, "jpeg": {...}}, prêtes pour un srcset.
+    """
+    def __init__(self, image_field, **kwargs):
+        super().__init__(source=f'{image_field}_derivatives', **kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        representation = {}
+        for key, paths in (value or {}).items():
+            urls = {}
+            for width, name in sorted(paths.items(), key=lambda item: int(item[0])):
+                url = default_storage.url(name)
+                urls[f'{width}w'] = request.build_absolute_uri(url) if request is not None else url
+            representation[key] = urls
+        return representation
+
+class Expandable:
+    """
+    Champ imbriqué servi seulement sur demande (?expand=), avec les jointures et
+    prefetch nécessaires pour le sérialiser sans requête supplémentaire par objet.
+    """
+    def __init__(self, serializer_class, select_related=(), prefetch_related=(), **kwargs):
+        self.serializer_class = serializer_class
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+        self.kwargs = kwargs
+
+    def build(self):
+        return self.serializer_class(read_only=True, **self.kwargs)
+
+class DynamicFieldsMixin:
+    """
+    ?fields=a,b ne renvoie que les champs cités ; ?expand=x,y ajoute les champs
+    déclarés dans Meta.expandable_fields (nom avec ou sans suffixe _details).
+    Ne concerne que le serializer racine d'une requête en lecture : les
+    serializers imbriqués gardent leur représentation par défaut.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self.is_root():
+            return fields
+
+        expand = self.requested_expansions(request)
+        for name in expand:
+            fields[name] = self.Meta.expandable_fields[name].build()
+        only = query_param_list(request, 'fields')
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only or name in expand}
+        return fields
+
+    def is_root(self):
+        return self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+
+    @classmethod
+    def requested_expansions(cls, request):
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        requested = query_param_list(request, 'expand') or set()
+        names = set()
+        for name in requested:
+            for candidate in (name, f'{name}_details'):
+                if candidate in expandable:
+                    names.add(candidate)
+        return sorted(names)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        """Ajoute au queryset les select_related/prefetch_related des champs dépliés"""
+        for name in cls.requested_expansions(request):
+            expandable = cls.Meta.expandable_fields[name]
+            if expandable.select_related:
+                queryset = queryset.select_related(*expandable.select_related)
+            if expandable.prefetch_related:
+                queryset = queryset.prefetch_related(*expandable.prefetch_related)
+        return queryset
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    profile_picture_srcset = DerivativesField('profile_picture')
+
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 
-                 'user_type', 'phone', 'address', 'profile_picture')
+                 'user_type', 'phone', 'address', 'profile_picture', 'profile_picture_srcset')
         read_only_fields = ('id',)
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -49,12 +144,15 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
         return user
 
-class WorkshopImageSerializer(serializers.ModelSerializer):
+class WorkshopImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = DerivativesField('image')
+
     class Meta:
         model = WorkshopImage
-        fields = ('id', 'image', 'is_preview', 'order')
+        fields = ('id', 'image', 'srcset', 'width', 'height', 'dominant_color', 'placeholder',
+                 'is_preview', 'order')
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_name = serializers.SerializerMethodField()
     user_first_name = serializers.CharField(source='user.first_name', read_only=True)
     user_last_name = serializers.CharField(source='user.last_name', read_only=True)
@@ -75,16 +173,28 @@ class ReviewSerializer(serializers.ModelSerializer):
         else:
             return obj.user.username
 
-class WorkshopSerializer(serializers.ModelSerializer):
+# Nombre d'avis embarqués dans la représentation d'un atelier ; l'historique
+# complet est servi, paginé, par /workshops/{id}/reviews/
+REVIEW_PREVIEW_SIZE = 3
+
+def latest_reviews_prefetch(lookup='reviews'):
+    """Prefetch des derniers avis de chaque atelier en une seule requête (fenêtre ROW_NUMBER)"""
+    queryset = Review.objects.select_related('user').order_by('-date', '-id')[:REVIEW_PREVIEW_SIZE]
+    return Prefetch(lookup, queryset=queryset, to_attr='latest_reviews')
+
+class WorkshopSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     images = WorkshopImageSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    reviews = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
     average_rating = serializers.SerializerMethodField()
     user = UserSerializer(read_only=True)
     phone = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
 
     name = serializers.CharField(allow_null=True, required=False)
     description = serializers.CharField(allow_null=True, required=False)
     logo = serializers.ImageField(allow_null=True, required=False)
+    logo_srcset = DerivativesField('logo')
     address = serializers.CharField(allow_null=True, required=False)
     rating = serializers.FloatField(allow_null=True, required=False)
     specialties = serializers.JSONField(allow_null=True, required=False)
@@ -98,12 +208,29 @@ class WorkshopSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Workshop
-        fields = ('id', 'user', 'name', 'description', 'logo', 'address', 'phone',
+        fields = ('id', 'user', 'name', 'description', 'logo', 'logo_srcset', 'address', 'phone',
                  'rating', 'specialties', 'estimated_delivery_time',
                  'price_range_min', 'price_range_max', 'is_verified',
-                 'is_active', 'images', 'reviews', 'average_rating',
+                 'is_active', 'images', 'reviews', 'review_count', 'average_rating',
+                 'latitude', 'longitude', 'geohash', 'distance_km',
                  'created_at', 'updated_at')
-        read_only_fields = ('rating', 'is_verified', 'created_at', 'updated_at')
+        read_only_fields = ('rating', 'is_verified', 'geohash', 'created_at', 'updated_at')
+
+    def validate(self, attrs):
+        if 'latitude' in attrs or 'longitude' in attrs:
+            latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+            longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+            if (latitude is None) != (longitude is None):
+                raise serializers.ValidationError("latitude et longitude doivent être fournies ensemble")
+            # Des coordonnées explicites priment sur le géocodage de l'adresse
+            attrs['location_source'] = 'client' if latitude is not None else ''
+        return attrs
+
+    def get_reviews(self, obj):
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.select_related('user').order_by('-date', '-id')[:REVIEW_PREVIEW_SIZE]
+        return ReviewSerializer(reviews, many=True, context=self.context).data
 
     def get_average_rating(self, obj):
         return obj.average_rating()
@@ -111,12 +238,19 @@ class WorkshopSerializer(serializers.ModelSerializer):
     def get_phone(self, obj):
         return obj.user.phone if obj.user else None
 
-class ModelImageSerializer(serializers.ModelSerializer):
+    def get_distance_km(self, obj):
+        distance = getattr(obj, 'distance_km', None)
+        return round(distance, 2) if distance is not None else None
+
+class ModelImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = DerivativesField('image')
+
     class Meta:
         model = ModelImage
-        fields = ('id', 'image', 'is_preview', 'order')
+        fields = ('id', 'image', 'srcset', 'width', 'height', 'dominant_color', 'placeholder',
+                 'is_preview', 'order')
 
-class ClothingModelSerializer(serializers.ModelSerializer):
+class ClothingModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     images = ModelImageSerializer(many=True, read_only=True)
     category_display = serializers.CharField(source='get_category_display', read_only=True)
 
@@ -124,10 +258,11 @@ class ClothingModelSerializer(serializers.ModelSerializer):
         model = ClothingModel
         fields = ('id', 'name', 'category', 'category_display', 'description',
                  'price', 'estimated_time', 'featured', 'styles',
-                 'is_active', 'images', 'model_3d_url', 'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at')
+                 'is_active', 'is_draft', 'source_material', 'images', 'model_3d_url',
+                 'created_at', 'updated_at')
+        read_only_fields = ('source_material', 'created_at', 'updated_at')
 
-class MeasurementsSerializer(serializers.ModelSerializer):
+class MeasurementsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     measurement_type_display = serializers.CharField(source='get_measurement_type_display', read_only=True)
     standard_size_display = serializers.CharField(source='get_standard_size_display', read_only=True)
 
@@ -138,7 +273,7 @@ class MeasurementsSerializer(serializers.ModelSerializer):
                  'tailor_notes', 'created_at', 'updated_at')
         read_only_fields = ('user', 'created_at', 'updated_at')
 
-class OrderStatusUpdateSerializer(serializers.ModelSerializer):
+class OrderStatusUpdateSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_name = serializers.SerializerMethodField()
 
@@ -152,58 +287,87 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
             return f"{obj.created_by.first_name} {obj.created_by.last_name}"
         return None
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Les relations sont renvoyées sous forme d'identifiants ; leur détail est
+    servi sur demande : ?expand=model,workshop,measurements,status_updates
+    """
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     payment_status_display = serializers.CharField(source='get_payment_status_display', read_only=True)
     payment_method_display = serializers.CharField(source='get_payment_method_display', read_only=True)
-    model_details = ClothingModelSerializer(source='model', read_only=True)
-    workshop_details = WorkshopSerializer(source='workshop', read_only=True)
-    measurements_details = MeasurementsSerializer(source='measurements', read_only=True)
-    status_updates = OrderStatusUpdateSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'user', 'model', 'model_details', 'workshop', 'workshop_details',
-                 'measurements', 'measurements_details', 'status', 'status_display',
+        fields = ('id', 'user', 'model', 'workshop', 'measurements', 'status', 'status_display',
                  'total_price', 'created_at', 'updated_at', 'estimated_delivery',
                  'actual_delivery', 'notes', 'payment_status', 'payment_status_display',
                  'payment_method', 'payment_method_display', 'payment_id',
-                 'tracking_number', 'cancellation_reason', 'status_updates')
-        read_only_fields = ('user', 'created_at', 'updated_at', 'status_updates')
-
-class SupplierSerializer(serializers.ModelSerializer):
+                 'tracking_number', 'cancellation_reason')
+        read_only_fields = ('user', 'created_at', 'updated_at')
+        expandable_fields = {
+            'model_details': Expandable(
+                ClothingModelSerializer, source='model',
+                select_related=('model',), prefetch_related=('model__images',),
+            ),
+            'workshop_details': Expandable(
+                WorkshopSerializer, source='workshop',
+                select_related=('workshop__user',),
+                prefetch_related=('workshop__images', latest_reviews_prefetch('workshop__reviews')),
+            ),
+            'measurements_details': Expandable(
+                MeasurementsSerializer, source='measurements',
+                select_related=('measurements',),
+            ),
+            'status_updates': Expandable(
+                OrderStatusUpdateSerializer, many=True,
+                prefetch_related=(Prefetch(
+                    'status_updates',
+                    queryset=OrderStatusUpdate.objects.select_related('created_by'),
+                ),),
+            ),
+        }
+
+class SupplierSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Supplier
         fields = ('id', 'name', 'contact_name', 'email', 'phone', 'address',
                  'notes', 'is_active', 'created_at', 'updated_at')
         read_only_fields = ('created_at', 'updated_at')
 
-class MaterialCategorySerializer(serializers.ModelSerializer):
+class MaterialCategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
     parent_name = serializers.CharField(source='parent.name', read_only=True)
 
     class Meta:
         model = MaterialCategory
-        fields = ('id', 'name', 'description', 'parent', 'parent_name',
+        fields = ('id', 'name', 'description', 'parent', 'parent_name', 'path', 'depth',
                  'children', 'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at')
+        read_only_fields = ('path', 'depth', 'created_at', 'updated_at')
+
+    def validate_parent(self, parent):
+        if parent and self.instance and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("Une catégorie ne peut pas être rangée sous elle-même ou ses descendants")
+        return parent
 
     def get_children(self, obj):
-        if obj.children.exists():
-            return MaterialCategorySerializer(obj.children.all(), many=True).data
-        return []
+        # context['category_children'] : {parent_id: [catégories]} chargé en une requête par la vue
+        children_map = self.context.get('category_children')
+        children = obj.children.all() if children_map is None else children_map.get(obj.pk, [])
+        return MaterialCategorySerializer(children, many=True, context=self.context).data
+
+class MaterialImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = DerivativesField('image')
 
-class MaterialImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = MaterialImage
-        fields = ('id', 'image', 'is_preview', 'order')
+        fields = ('id', 'image', 'srcset', 'width', 'height', 'dominant_color', 'placeholder',
+                 'is_preview', 'order')
 
-class MaterialSerializer(serializers.ModelSerializer):
+class MaterialSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
     unit_display = serializers.CharField(source='get_unit_display', read_only=True)
     images = MaterialImageSerializer(many=True, read_only=True)
-    stock_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Material
@@ -213,16 +377,18 @@ class MaterialSerializer(serializers.ModelSerializer):
                  'current_stock', 'location', 'color', 'width',
                  'is_active', 'images', 'stock_status',
                  'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at', 'current_stock')
-
-    def get_stock_status(self, obj):
-        if obj.current_stock <= 0:
-            return 'out_of_stock'
-        elif obj.current_stock <= obj.min_stock_level:
-            return 'low_stock'
-        return 'in_stock'
+        read_only_fields = ('created_at', 'updated_at', 'current_stock', 'stock_status')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Stock à une date passée, présent seulement avec ?as_of= (voir api.stock)
+        if hasattr(instance, 'stock_as_of'):
+            data['stock_as_of'] = serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(
+                instance.stock_as_of
+            )
+        return data
 
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     material_name = serializers.CharField(source='material.name', read_only=True)
     movement_type_display = serializers.CharField(source='get_movement_type_display', read_only=True)
     created_by_name = serializers.SerializerMethodField()
@@ -238,4 +404,61 @@ class StockMovementSerializer(serializers.ModelSerializer):
     def get_created_by_name(self, obj):
         if obj.created_by:
             return f"{obj.created_by.first_name} {obj.created_by.last_name}"
-        return None
\ No newline at end of file
+        return None
+
+class StockAlertSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    material_name = serializers.CharField(source='material.name', read_only=True)
+    material_sku = serializers.CharField(source='material.sku', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ('id', 'material', 'material_name', 'material_sku', 'supplier',
+                 'status', 'status_display', 'stock_level', 'threshold',
+                 'created_at', 'updated_at', 'resolved_at')
+        read_only_fields = fields
+
+class BillOfMaterialsItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    material_name = serializers.CharField(source='material.name', read_only=True)
+    material_unit = serializers.CharField(source='material.unit', read_only=True)
+
+    class Meta:
+        model = BillOfMaterialsItem
+        fields = ('id', 'model', 'material', 'material_name', 'quantity', 'unit',
+                 'material_quantity', 'material_unit', 'notes')
+        read_only_fields = ('model', 'material_quantity')
+
+    def validate(self, attrs):
+        material = attrs.get('material', getattr(self.instance, 'material', None))
+        unit = attrs.get('unit', getattr(self.instance, 'unit', None))
+        quantity = attrs.get('quantity', getattr(self.instance, 'quantity', None))
+        try:
+            BillOfMaterialsItem.convert(quantity, unit, material.unit)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'unit': exc.messages})
+        return attrs
+
+class PurchaseOrderDraftLineSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    material_name = serializers.CharField(source='material.name', read_only=True)
+    material_sku = serializers.CharField(source='material.sku', read_only=True)
+    material_unit = serializers.CharField(source='material.unit', read_only=True)
+
+    class Meta:
+        model = PurchaseOrderDraftLine
+        fields = ('id', 'material', 'material_name', 'material_sku', 'material_unit',
+                 'current_stock', 'reserved_stock', 'daily_usage', 'target_stock',
+                 'suggested_quantity', 'unit_price', 'amount')
+        read_only_fields = fields
+
+class PurchaseOrderDraftSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    supplier_name = serializers.CharField(source='supplier.name', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    lines = PurchaseOrderDraftLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = PurchaseOrderDraft
+        fields = ('id', 'supplier', 'supplier_name', 'status', 'status_display',
+                 'coverage_days', 'lookback_days', 'line_count', 'total_amount',
+                 'generated_at', 'lines', 'created_at', 'updated_at')
+        read_only_fields = ('supplier', 'coverage_days', 'lookback_days', 'line_count',
+                            'total_amount', 'generated_at', 'created_at', 'updated_at')
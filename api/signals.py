@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import images, search, stats, stock, storage, valuation
+from .models import (
+    Workshop, Review, ClothingModel, Material, MaterialCategory, Supplier, Order, OrderDailyRollup, StockMovement
+)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # post_delete est aussi émis pour les suppressions en cascade et les
+    # queryset.delete(), contrairement à Review.delete()
+    Workshop.apply_review_delta(instance.workshop_id, -1, -instance.rating)
+
+
+@receiver(post_save, sender=Workshop)
+def workshop_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'specialties' in update_fields:
+        instance.sync_specialties()
+
+
+@receiver(post_save, sender=Workshop)
+@receiver(post_save, sender=ClothingModel)
+@receiver(post_save, sender=Material)
+@receiver(post_save, sender=Supplier)
+def searchable_saved(sender, instance, **kwargs):
+    search.index_instance(instance)
+
+
+@receiver(post_delete, sender=Workshop)
+@receiver(post_delete, sender=ClothingModel)
+@receiver(post_delete, sender=Material)
+@receiver(post_delete, sender=Supplier)
+def searchable_deleted(sender, instance, **kwargs):
+    search.unindex_instance(instance)
+
+
+@receiver(post_init, sender=Order)
+def order_loaded(sender, instance, **kwargs):
+    # Valeur chargée, pour invalider aussi l'ancien atelier si la commande change d'atelier.
+    # Lue dans __dict__ pour ne pas déclencher de requête sur un champ différé.
+    instance._loaded_workshop_id = instance.__dict__.get('workshop_id')
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleting(sender, instance, **kwargs):
+    # Avant la suppression en cascade des réservations, pour rendre la matière réservée
+    stock.release_order_materials(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Les créations et modifications sont reportées par Order.save()
+    OrderDailyRollup.record_delete(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    workshop_ids = {instance.workshop_id, instance._loaded_workshop_id}
+
+    def invalidate():
+        for workshop_id in workshop_ids:
+            stats.invalidate_workshop_orders(workshop_id)
+
+    # Après le commit : invalidées plus tôt, les statistiques pourraient être
+    # recalculées et remises en cache par une lecture qui ne voit pas encore la commande
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=StockMovement)
+@receiver(post_delete, sender=StockMovement)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=MaterialCategory)
+@receiver(post_save, sender=Supplier)
+def valuation_input_changed(sender, instance, **kwargs):
+    # Coûts, quantités et libellés du rapport : version changée après le commit (voir order_changed)
+    transaction.on_commit(valuation.invalidate_valuation)
+
+
+def image_loaded(sender, instance, **kwargs):
+    # Fichiers et versions chargés, pour ne régénérer qu'au changement d'image.
+    # Lus dans __dict__ pour ne pas déclencher de requête sur un champ différé.
+    instance._loaded_images = {
+        field_name: (
+            getattr(instance.__dict__[field_name], 'name', instance.__dict__[field_name]) or '',
+            instance.__dict__.get(images.derivatives_field(field_name)),
+        )
+        for field_name in images.IMAGE_FIELDS[sender]
+        if field_name in instance.__dict__
+    }
+
+
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_images', {})
+    for field_name in images.IMAGE_FIELDS[sender]:
+        name = getattr(instance, field_name).name or ''
+        loaded_name, loaded_derivatives = loaded.get(field_name, ('', None))
+        if name != loaded_name or (created and name):
+            images.refresh_image(instance, field_name, previous=loaded_derivatives)
+            if not created:
+                storage.release(getattr(instance, field_name).storage, loaded_name)
+            loaded[field_name] = (name, getattr(instance, images.derivatives_field(field_name)))
+    instance._loaded_images = loaded
+
+
+def image_deleted(sender, instance, **kwargs):
+    for field_name in images.IMAGE_FIELDS[sender]:
+        fieldfile = getattr(instance, field_name)
+        images.delete_derivatives(fieldfile.storage, instance.__dict__.get(images.derivatives_field(field_name)))
+        storage.release(fieldfile.storage, fieldfile.name)
+
+
+for model in images.IMAGE_FIELDS:
+    post_init.connect(image_loaded, sender=model, dispatch_uid=f'images_loaded_{model.__name__}')
+    post_save.connect(image_saved, sender=model, dispatch_uid=f'images_saved_{model.__name__}')
+    post_delete.connect(image_deleted, sender=model, dispatch_uid=f'images_deleted_{model.__name__}')
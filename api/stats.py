@@ -0,0 +1,137 @@
+"""
+Statistiques de commandes par atelier, calculées en une requête et mises en cache.
+
+Les totaux et séries temporelles sont lus dans les agrégats journaliers
+(OrderDailyRollup) : leur coût dépend du nombre de jours, pas du nombre de commandes.
+
+Chaque atelier a un numéro de version en cache ; toutes les clés de ses
+statistiques l'incluent. Une écriture sur Order change la version, ce qui
+invalide d'un coup toutes les variantes (filtres de dates, pages) sans avoir
+à les énumérer.
+"""
+import uuid
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+
+from .models import Order, OrderDailyRollup
+
+STATS_CACHE_TIMEOUT = 300
+
+
+def _version_key(workshop_id):
+    return f'workshop:{workshop_id}:orders:version'
+
+
+def cache_key(workshop_id, name, *parts):
+    version = cache.get(_version_key(workshop_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(_version_key(workshop_id), version, None)
+    return ':'.join(['workshop', str(workshop_id), 'orders', version, name, *map(str, parts)])
+
+
+def invalidate_workshop_orders(workshop_id):
+    if workshop_id is not None:
+        cache.set(_version_key(workshop_id), uuid.uuid4().hex, None)
+
+
+def compute_order_stats(rollups):
+    """Totaux, chiffre d'affaires et répartitions par statut en une seule requête sur les agrégats"""
+    zero = Value(Decimal('0'))
+    aggregates = {
+        'total_orders': Coalesce(Sum('order_count'), 0),
+        'total_revenue': Coalesce(Sum('revenue'), zero),
+        'paid_revenue': Coalesce(Sum('revenue', filter=Q(payment_status='paid')), zero),
+    }
+    for code, _ in Order.STATUS_CHOICES:
+        aggregates[f'status__{code}'] = Coalesce(Sum('order_count', filter=Q(status=code)), 0)
+    for code, _ in Order.PAYMENT_STATUS_CHOICES:
+        aggregates[f'payment__{code}'] = Coalesce(Sum('order_count', filter=Q(payment_status=code)), 0)
+    row = rollups.order_by().aggregate(**aggregates)
+
+    return {
+        'total_orders': row['total_orders'],
+        'total_revenue': row['total_revenue'],
+        'paid_revenue': row['paid_revenue'],
+        'pending_orders': row['status__pending'],
+        'by_status': {code: row[f'status__{code}'] for code, _ in Order.STATUS_CHOICES},
+        'by_payment_status': {code: row[f'payment__{code}'] for code, _ in Order.PAYMENT_STATUS_CHOICES},
+    }
+
+
+def workshop_order_stats(workshop_id):
+    key = cache_key(workshop_id, 'stats')
+    data = cache.get(key)
+    if data is None:
+        data = compute_order_stats(OrderDailyRollup.objects.filter(workshop_id=workshop_id))
+        cache.set(key, data, STATS_CACHE_TIMEOUT)
+    return data
+
+
+def workshop_clients_page(workshop_id, start=None, end=None, offset=0, limit=20):
+    """
+    Une page du classement des clients par nombre de commandes, avec le total.
+    start/end : bornes datetime [start, end[ sur Order.created_at.
+    """
+    key = cache_key(workshop_id, 'clients', start and start.isoformat(), end and end.isoformat(), offset, limit)
+    data = cache.get(key)
+    if data is None:
+        orders = Order.objects.filter(workshop_id=workshop_id)
+        if start:
+            orders = orders.filter(created_at__gte=start)
+        if end:
+            orders = orders.filter(created_at__lt=end)
+        clients = (
+            orders
+            .values('user__id', 'user__username', 'user__first_name', 'user__last_name')
+            .annotate(order_count=Count('id'))
+            .order_by('-order_count', 'user__id')
+        )
+        data = {
+            'count': orders.values('user_id').distinct().count(),
+            'results': list(clients[offset:offset + limit]),
+        }
+        cache.set(key, data, STATS_CACHE_TIMEOUT)
+    return data
+
+
+TIMESERIES_INTERVALS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def order_timeseries(rollups, interval='day', start=None, end=None):
+    """
+    Nombre de commandes et chiffre d'affaires par période, lus dans les agrégats.
+    start/end : dates inclusives sur OrderDailyRollup.day.
+    """
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    trunc = TIMESERIES_INTERVALS[interval]
+    period = trunc('day') if trunc else F('day')
+    rows = (
+        rollups
+        .values(period=period)
+        .annotate(
+            orders=Sum('order_count'),
+            total_revenue=Sum('revenue'),
+            paid_revenue=Coalesce(Sum('revenue', filter=Q(payment_status='paid')), Value(Decimal('0'))),
+        )
+        .order_by('period')
+    )
+    return [
+        {
+            'period': row['period'].isoformat(),
+            'order_count': row['orders'],
+            'revenue': row['total_revenue'],
+            'paid_revenue': row['paid_revenue'],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,332 @@
+"""
+Opérations de stock en lot et soldes historiques.
+
+Une réception de livraison (des centaines de lignes) est appliquée avec un
+nombre fixe de requêtes : une résolution des matières, un INSERT groupé des
+mouvements et un seul UPDATE des soldes (CASE par matière).
+
+Le stock à une date est calculé depuis le point de contrôle (StockCheckpoint)
+le plus proche : seuls les mouvements entre ce point et la date sont rejoués.
+Les points sont pris avec CHECKPOINT_LAG de retard : created_at est fixé avant
+la validation de la transaction, un mouvement daté d'avant le point mais validé
+après lui serait ignoré par le point comme par le rejeu.
+"""
+from datetime import timedelta
+from decimal import ROUND_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import (
+    BillOfMaterialsItem, InsufficientStock, Material, StockCheckpoint, StockMovement, StockReservation
+)
+
+MAX_RECEIPT_LINES = 1000
+CHECKPOINT_LAG = timedelta(minutes=5)
+
+
+class StockReceiptLineSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=50, required=False)
+    material = serializers.IntegerField(required=False, min_value=1)
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'),
+                                          required=False, allow_null=True)
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        if not attrs.get('sku') and not attrs.get('material'):
+            raise serializers.ValidationError("Indiquer sku ou material")
+        return attrs
+
+
+class StockReceiptSerializer(serializers.Serializer):
+    MODE_CHOICES = [
+        ('atomic', 'Tout ou rien'),
+        ('per_line', 'Ligne par ligne'),
+    ]
+
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default='atomic')
+    lines = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                  max_length=MAX_RECEIPT_LINES)
+
+
+def resolve_materials(lines):
+    """Matières citées par les lignes (par sku ou id), en une requête : ({sku: m}, {id: m})"""
+    skus = {line['sku'] for line in lines if line.get('sku')}
+    ids = {line['material'] for line in lines if line.get('material')}
+    materials = Material.objects.filter(Q(sku__in=skus) | Q(pk__in=ids)).only('id', 'sku')
+    by_sku = {}
+    by_id = {}
+    for material in materials:
+        by_sku[material.sku] = material
+        by_id[material.pk] = material
+    return by_sku, by_id
+
+
+def receive_delivery(lines, reference='', user=None, atomic=True):
+    """
+    Enregistre des entrées de stock en lot.
+    atomic=True : rien n'est appliqué si une ligne est invalide ; sinon seules
+    les lignes valides le sont. Retourne (mouvements créés, [{line, errors}]).
+    """
+    errors = []
+    valid = []
+    for index, raw in enumerate(lines):
+        line = StockReceiptLineSerializer(data=raw)
+        if line.is_valid():
+            valid.append((index, line.validated_data))
+        else:
+            errors.append({'line': index, 'errors': line.errors})
+
+    by_sku, by_id = resolve_materials([data for _, data in valid])
+    movements = []
+    for index, data in valid:
+        material = by_sku.get(data['sku']) if data.get('sku') else by_id.get(data['material'])
+        if material is None or (data.get('sku') and data.get('material') and material.pk != data['material']):
+            errors.append({'line': index, 'errors': {'material': ["Matière introuvable"]}})
+            continue
+        movements.append(StockMovement(
+            material_id=material.pk,
+            movement_type='in',
+            quantity=data['quantity'],
+            unit_price=data.get('unit_price'),
+            reference=data.get('reference') or reference,
+            notes=data.get('notes', ''),
+            created_by=user,
+        ))
+
+    errors.sort(key=lambda error: error['line'])
+    if (errors and atomic) or not movements:
+        return [], errors
+
+    with transaction.atomic():
+        created = StockMovement.objects.bulk_create(movements)
+        apply_stock_deltas(_totals_by_material(movements))
+    return created, errors
+
+
+def _totals_by_material(movements):
+    totals = {}
+    for movement in movements:
+        delta = StockMovement.stock_delta(movement.movement_type, movement.quantity)
+        totals[movement.material_id] = totals.get(movement.material_id, 0) + delta
+    return totals
+
+
+def per_material(values, field='pk'):
+    """
+    Expression CASE donnant à chaque matière sa valeur de `values` ({material_id: valeur}).
+    `field` désigne la matière dans la table mise à jour : 'pk' sur Material,
+    'material_id' sur les tables qui la référencent (StockReservation).
+    """
+    return Case(
+        *[When(**{field: material_id}, then=Value(value)) for material_id, value in values.items()],
+        default=Value(Decimal('0')),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def apply_stock_deltas(totals):
+    """
+    Ajoute à chaque matière son total en un seul UPDATE. Réservé aux hausses de
+    stock : les baisses passent par Material.apply_stock_delta (contrôle du solde).
+    """
+    if not totals:
+        return 0
+    updated = Material.objects.filter(pk__in=list(totals)).update(
+        current_stock=F('current_stock') + per_material(totals)
+    )
+    Material.sync_stock_status(list(totals))
+    return updated
+
+
+def _balance_field():
+    return DecimalField(max_digits=12, decimal_places=2)
+
+
+def movement_delta_expression():
+    """Effet signé d'un mouvement sur le stock (voir StockMovement.stock_delta)"""
+    return Case(
+        When(movement_type__in=['in', 'return'], then=F('quantity')),
+        When(movement_type__in=['out', 'adjustment'], then=F('quantity') * Value(-1)),
+        default=Value(Decimal('0')),
+        output_field=_balance_field(),
+    )
+
+
+def _movement_total(**filters):
+    """Sous-requête : somme signée des mouvements de la matière de la requête externe"""
+    movements = (
+        StockMovement.objects
+        .filter(material=OuterRef('pk'), **filters)
+        .order_by()
+        .values('material')
+        .annotate(total=Sum(movement_delta_expression()))
+        .values('total')[:1]
+    )
+    return Coalesce(Subquery(movements, output_field=_balance_field()), Value(Decimal('0')))
+
+
+def annotate_stock_as_of(queryset, moment):
+    """
+    Annote stock_as_of : le stock de chaque matière à l'instant `moment`.
+    Rejoue vers l'avant depuis le dernier point de contrôle antérieur ou, à
+    défaut, à rebours depuis le premier point postérieur. Les matières créées
+    après `moment` sont exclues.
+    """
+    checkpoints = StockCheckpoint.objects.filter(material=OuterRef('pk'))
+    before = checkpoints.filter(taken_at__lte=moment).order_by('-taken_at')
+    after = checkpoints.filter(taken_at__gt=moment).order_by('taken_at')
+    queryset = queryset.filter(created_at__lte=moment).alias(
+        checkpoint_before_at=Subquery(before.values('taken_at')[:1]),
+        checkpoint_before_balance=Subquery(before.values('balance')[:1]),
+        checkpoint_after_at=Subquery(after.values('taken_at')[:1]),
+        checkpoint_after_balance=Subquery(after.values('balance')[:1]),
+    )
+    forward = F('checkpoint_before_balance') + _movement_total(
+        created_at__gt=OuterRef('checkpoint_before_at'), created_at__lte=moment
+    )
+    backward = F('checkpoint_after_balance') - _movement_total(
+        created_at__gt=moment, created_at__lte=OuterRef('checkpoint_after_at')
+    )
+    return queryset.annotate(stock_as_of=Coalesce(
+        forward, backward, _movement_total(created_at__lte=moment), output_field=_balance_field()
+    ))
+
+
+def take_checkpoints(moment=None, batch_size=1000):
+    """
+    Enregistre le solde du registre de chaque matière à `moment` (au plus tard
+    maintenant moins CHECKPOINT_LAG) ; retourne le nombre créé
+    """
+    latest = timezone.now() - CHECKPOINT_LAG
+    moment = min(moment, latest) if moment else latest
+    materials = annotate_stock_as_of(Material.objects.order_by('pk'), moment).values_list('pk', 'stock_as_of')
+    checkpoints = (
+        StockCheckpoint(material_id=pk, taken_at=moment, balance=balance)
+        for pk, balance in materials.iterator(chunk_size=batch_size)
+    )
+    return len(StockCheckpoint.objects.bulk_create(checkpoints, batch_size=batch_size))
+
+
+def stock_drift(materials=None):
+    """[(matière, solde du registre, écart current_stock - registre)] pour les matières en écart"""
+    materials = materials if materials is not None else Material.objects.all()
+    materials = annotate_stock_as_of(materials.order_by('pk'), timezone.now())
+    return [
+        (material, material.stock_as_of, material.current_stock - material.stock_as_of)
+        for material in materials
+        if material.current_stock != material.stock_as_of
+    ]
+
+
+def reconcile_stock(dry_run=False):
+    """
+    Recale current_stock sur le registre. Les matières sont verrouillées pendant
+    le calcul pour qu'aucun mouvement ne s'intercale entre la mesure et la correction.
+    Retourne la liste des écarts (voir stock_drift).
+    """
+    with transaction.atomic():
+        drift = stock_drift(Material.objects.select_for_update(of=('self',)))
+        if not dry_run:
+            for material, _, difference in drift:
+                Material.objects.filter(pk=material.pk).update(current_stock=F('current_stock') - difference)
+            Material.sync_stock_status([material.pk for material, _, _ in drift])
+    return drift
+
+
+def order_requirements(order):
+    """{material_id: quantité} nécessaire à la commande d'après la nomenclature de son modèle"""
+    return {
+        material_id: quantity.quantize(Decimal('0.01'), rounding=ROUND_UP)
+        for material_id, quantity in BillOfMaterialsItem.objects
+        .filter(model_id=order.model_id)
+        .values_list('material_id', 'material_quantity')
+    }
+
+
+def apply_order_status(order, user=None):
+    """Réservation, libération ou consommation des matières selon le nouveau statut de la commande"""
+    if order.status == 'confirmed':
+        reserve_order_materials(order)
+    elif order.status == 'cancelled':
+        release_order_materials(order)
+    elif order.status == 'in_progress':
+        consume_order_materials(order, user)
+
+
+def reserve_order_materials(order):
+    """Réserve la nomenclature de la commande (lignes déjà réservées ou consommées ignorées)"""
+    existing = dict(StockReservation.objects.filter(order=order).values_list('material_id', 'status'))
+    requirements = order_requirements(order)
+    new = {m: q for m, q in requirements.items() if m not in existing}
+    renewed = {m: q for m, q in requirements.items() if existing.get(m) == 'released'}
+    if not new and not renewed:
+        return
+    with transaction.atomic():
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, material_id=material_id, quantity=quantity)
+            for material_id, quantity in new.items()
+        ])
+        if renewed:
+            StockReservation.objects.filter(order=order, material_id__in=list(renewed)).update(
+                status='reserved', quantity=per_material(renewed, 'material_id'), updated_at=timezone.now()
+            )
+        totals = {**new, **renewed}
+        Material.objects.filter(pk__in=list(totals)).update(
+            reserved_stock=F('reserved_stock') + per_material(totals)
+        )
+
+
+def release_order_materials(order):
+    """Libère les réservations en cours de la commande"""
+    reservations = StockReservation.objects.filter(order=order, status='reserved')
+    totals = dict(reservations.values_list('material_id', 'quantity'))
+    if not totals:
+        return
+    with transaction.atomic():
+        reservations.update(status='released', updated_at=timezone.now())
+        Material.objects.filter(pk__in=list(totals)).update(
+            reserved_stock=F('reserved_stock') - per_material(totals)
+        )
+
+
+def consume_order_materials(order, user=None):
+    """
+    Transforme les réservations de la commande en mouvements de sortie : un
+    INSERT groupé et un UPDATE des soldes, refusé en bloc (InsufficientStock)
+    si une matière n'a pas le stock nécessaire.
+    """
+    with transaction.atomic():
+        reserve_order_materials(order)
+        reservations = StockReservation.objects.filter(order=order, status='reserved')
+        totals = dict(reservations.values_list('material_id', 'quantity'))
+        if not totals:
+            return
+        amount = per_material(totals)
+        updated = Material.objects.filter(pk__in=list(totals), current_stock__gte=amount).update(
+            current_stock=F('current_stock') - amount,
+            reserved_stock=F('reserved_stock') - amount,
+        )
+        if updated != len(totals):
+            short = (
+                Material.objects.filter(pk__in=list(totals))
+                .exclude(current_stock__gte=amount)
+                .values_list('pk', flat=True)
+                .first()
+            )
+            raise InsufficientStock(short, totals[short])
+        reservations.update(status='consumed', updated_at=timezone.now())
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                material_id=material_id, movement_type='out', quantity=quantity,
+                reference=f"Commande #{order.pk}", created_by=user,
+            )
+            for material_id, quantity in totals.items()
+        ])
+        Material.sync_stock_status(list(totals))
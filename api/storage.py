@@ -0,0 +1,196 @@
+"""
+Stockage des médias adressé par contenu.
+
+Chaque fichier est haché (SHA-256) pendant sa lecture, par morceaux, puis
+rangé sous blobs/<2 premiers caractères>/<empreinte><extension> : un même
+contenu téléversé plusieurs fois (logo, photos reprises d'un modèle à l'autre)
+n'est stocké qu'une fois. Le nom demandé (upload_to) n'est pas conservé ;
+seule l'extension l'est, pour le type de contenu servi.
+
+Les références sont comptées dans StoredBlob : chaque save() ajoute une
+référence, chaque delete() en retire une. Le fichier n'est jamais effacé
+directement ; la commande cleanup_blobs recompte les références depuis la
+base et supprime les blobs qui n'en ont plus depuis un délai de grâce.
+
+Le stockage réel est délégué au backend de CONTENT_STORAGE_BACKEND :
+FileSystemStorage en local, S3Boto3Storage en production.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+BLOB_PREFIX = 'blobs/'
+SPOOL_MAX_MEMORY = 5 * 1024 * 1024
+
+
+def blob_key(digest, name):
+    extension = os.path.splitext(name)[1].lower()
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest}{extension}'
+
+
+def hash_to_spool(content):
+    """Lit le fichier une fois : empreinte, taille et copie (en mémoire puis sur disque)"""
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    if content.seekable():
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), size, spool
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+
+    def __init__(self, backend=None):
+        self.backend_path = backend or getattr(
+            settings, 'CONTENT_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage'
+        )
+        self.backend = import_string(self.backend_path)()
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom final est l'empreinte, choisie dans _save()
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        digest, size, spool = hash_to_spool(content)
+        key = blob_key(digest, name)
+        try:
+            with transaction.atomic():
+                blob, created = StoredBlob.objects.select_for_update().get_or_create(
+                    key=key, defaults={'sha256': digest, 'size': size},
+                )
+                # Ligne verrouillée : cleanup_blobs ne peut pas effacer le fichier en même temps
+                if created or not self.backend.exists(key):
+                    stored = self.backend.save(key, File(spool, name=key))
+                    if stored != key:
+                        # Fichier déjà présent sans ligne (base restaurée...) : même contenu
+                        self.backend.delete(stored)
+                StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, released_at=None)
+        finally:
+            spool.close()
+        return key
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(key=name).first()
+            if blob is None or blob.ref_count == 0:
+                return
+            blob.ref_count -= 1
+            blob.released_at = timezone.now() if blob.ref_count == 0 else None
+            blob.save(update_fields=['ref_count', 'released_at'])
+
+    def purge(self, name):
+        """Efface réellement le fichier (réservé à cleanup_blobs)"""
+        self.backend.delete(name)
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+
+def release(storage, name):
+    """Retire une référence à un blob ; sans effet sur les autres stockages (pas d'effacement)"""
+    if name and isinstance(storage, ContentAddressedStorage):
+        storage.delete(name)
+
+
+def referenced_blob_counts():
+    """{clé: nombre de références} relevées dans tous les champs fichier et les versions d'images"""
+    from django.apps import apps
+    from django.db.models import FileField
+
+    from .images import IMAGE_FIELDS, derivatives_field
+
+    counts = {}
+    for model in apps.get_models():
+        file_fields = [field.name for field in model._meta.concrete_fields if isinstance(field, FileField)]
+        derivative_fields = [derivatives_field(name) for name in IMAGE_FIELDS.get(model, ())]
+        if not file_fields and not derivative_fields:
+            continue
+        rows = model._default_manager.values_list(*file_fields, *derivative_fields).iterator(chunk_size=2000)
+        for row in rows:
+            names = list(row[:len(file_fields)])
+            for derivatives in row[len(file_fields):]:
+                names.extend(name for paths in (derivatives or {}).values() for name in paths.values())
+            for name in names:
+                if name and name.startswith(BLOB_PREFIX):
+                    counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def recount_references():
+    """Aligne StoredBlob.ref_count sur les références réelles ; retourne le nombre de blobs corrigés"""
+    from .models import StoredBlob
+
+    counts = referenced_blob_counts()
+    now = timezone.now()
+    changed = []
+    for blob in StoredBlob.objects.only('id', 'key', 'ref_count', 'released_at').iterator(chunk_size=2000):
+        ref_count = counts.get(blob.key, 0)
+        if ref_count != blob.ref_count:
+            blob.ref_count = ref_count
+            blob.released_at = (blob.released_at or now) if ref_count == 0 else None
+            changed.append(blob)
+    StoredBlob.objects.bulk_update(changed, ['ref_count', 'released_at'], batch_size=1000)
+    return len(changed)
+
+
+def purge_unused_blobs(grace, dry_run=False):
+    """Efface les blobs sans référence depuis plus de `grace` (timedelta) ; retourne les clés effacées"""
+    from .models import StoredBlob
+
+    storage = ContentAddressedStorage()
+    candidates = StoredBlob.objects.filter(ref_count=0, released_at__lt=timezone.now() - grace)
+    purged = []
+    for pk in candidates.values_list('pk', flat=True).iterator():
+        with transaction.atomic():
+            # Reverrouillé et revérifié : un save() concurrent a pu le réutiliser
+            blob = StoredBlob.objects.select_for_update().filter(pk=pk, ref_count=0).first()
+            if blob is None:
+                continue
+            if not dry_run:
+                storage.purge(blob.key)
+                blob.delete()
+            purged.append(blob.key)
+    return purged
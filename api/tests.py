@@ -0,0 +1,197 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.db import connection
+from django.db.models import Q, Sum
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chatgpt.models import AIJob
+
+from . import stock
+from .models import (
+    BillOfMaterialsItem, ClothingModel, InsufficientStock, Material, MaterialCategory, Measurements, Order,
+    StockCheckpoint, StockMovement, StockReservation, Supplier, User, Workshop,
+)
+
+
+class OrderReservationTests(TestCase):
+    def setUp(self):
+        client = User.objects.create_user('client', 'client@example.com', 'x', user_type='client')
+        tailor = User.objects.create_user('atelier', 'atelier@example.com', 'x', user_type='workshop')
+        workshop = Workshop.objects.create(
+            user=tailor, name='Atelier', description='d', logo='workshops/logos/logo.png', address='Dakar',
+            estimated_delivery_time=7, price_range_min=10, price_range_max=100,
+        )
+        model = ClothingModel.objects.create(
+            name='Robe', category='dress', description='d', price=100, estimated_time=7, styles=[],
+        )
+        supplier = Supplier.objects.create(name='S', contact_name='c', email='s@example.com', phone='1', address='a')
+        category = MaterialCategory.objects.create(name='Tissus')
+        # Matière sans nomenclature : les identifiants des réservations diffèrent de ceux des matières
+        Material.objects.create(
+            name='Fil', sku='FIL-1', category=category, description='d', unit='m', unit_price=1,
+            supplier=supplier, min_stock_level=1,
+        )
+        self.material = Material.objects.create(
+            name='Wax', sku='WAX-1', category=category, description='d', unit='m', unit_price=10,
+            supplier=supplier, min_stock_level=1, current_stock=100,
+        )
+        BillOfMaterialsItem.objects.create(model=model, material=self.material, quantity=2, unit='m')
+        self.order = Order.objects.create(
+            user=client, model=model, workshop=workshop,
+            measurements=Measurements.objects.create(user=client), total_price=100,
+            estimated_delivery=timezone.now() + timedelta(days=7),
+        )
+
+    def set_status(self, status):
+        self.order.status = status
+        self.order.save()
+        self.material.refresh_from_db()
+
+    def test_reconfirmed_order_reserves_and_consumes_its_materials(self):
+        self.set_status('confirmed')
+        self.set_status('cancelled')
+        self.assertEqual(self.material.reserved_stock, Decimal('0'))
+
+        self.set_status('confirmed')
+        reservation = StockReservation.objects.get(order=self.order)
+        self.assertEqual((reservation.status, reservation.quantity), ('reserved', Decimal('2')))
+        self.assertEqual(self.material.reserved_stock, Decimal('2'))
+
+        self.set_status('in_progress')
+        self.assertEqual(self.material.current_stock, Decimal('98'))
+        self.assertEqual(self.material.reserved_stock, Decimal('0'))
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, 'consumed')
+
+
+class StockCheckpointTests(TestCase):
+    def setUp(self):
+        supplier = Supplier.objects.create(name='S', contact_name='c', email='s@example.com', phone='1', address='a')
+        self.material = Material.objects.create(
+            name='Wax', sku='WAX-1', category=MaterialCategory.objects.create(name='Tissus'), description='d',
+            unit='m', unit_price=10, supplier=supplier, min_stock_level=1,
+        )
+        # Matière créée la veille, avec son point de contrôle initial
+        created_at = timezone.now() - timedelta(days=1)
+        Material.objects.filter(pk=self.material.pk).update(created_at=created_at)
+        StockCheckpoint.objects.filter(material=self.material).update(taken_at=created_at)
+
+    def test_movement_committed_after_checkpoint_is_replayed(self):
+        # Le point est pris pendant qu'un mouvement daté d'une minute plus tôt n'est pas encore validé
+        stock.take_checkpoints()
+        movement = StockMovement.objects.create(material=self.material, movement_type='in', quantity=10)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(stock.stock_drift(), [])
+        self.assertEqual(stock.reconcile_stock(), [])
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.current_stock, Decimal('10'))
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    """Entrées et sorties en parallèle sur une même matière : aucune mise à jour perdue, jamais de stock négatif"""
+    movements_per_worker = 50
+    initial_stock = Decimal('20')
+
+    def setUp(self):
+        supplier = Supplier.objects.create(name='S', contact_name='c', email='s@example.com', phone='1', address='a')
+        self.material = Material.objects.create(
+            name='Wax', sku='WAX-1', category=MaterialCategory.objects.create(name='Tissus'), description='d',
+            unit='m', unit_price=10, supplier=supplier, min_stock_level=0, current_stock=self.initial_stock,
+        )
+
+    def run_worker(self, seed):
+        rng = random.Random(seed)
+        added = removed = Decimal('0')
+        try:
+            for _ in range(self.movements_per_worker):
+                movement_type = rng.choice(['in', 'out', 'out'])
+                quantity = Decimal(rng.randint(1, 5))
+                try:
+                    # StockMovement.save() passe par Material.apply_stock_delta
+                    StockMovement.objects.create(material=self.material, movement_type=movement_type, quantity=quantity)
+                except InsufficientStock:
+                    continue
+                if movement_type == 'in':
+                    added += quantity
+                else:
+                    removed += quantity
+        finally:
+            connection.close()
+        return added, removed
+
+    def test_concurrent_movements_keep_the_balance(self):
+        # SQLite refuse les transactions d'écriture concurrentes (database is locked)
+        workers = 1 if connection.vendor == 'sqlite' else 8
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(self.run_worker, range(workers)))
+        added = sum(result[0] for result in results)
+        removed = sum(result[1] for result in results)
+
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.current_stock, self.initial_stock + added - removed)
+        self.assertGreaterEqual(self.material.current_stock, 0)
+        ledger = StockMovement.objects.filter(material=self.material).aggregate(
+            total_in=Sum('quantity', filter=Q(movement_type='in'), default=0),
+            total_out=Sum('quantity', filter=Q(movement_type='out'), default=0),
+        )
+        self.assertEqual((ledger['total_in'], ledger['total_out']), (added, removed))
+
+        # Sortie au-delà du stock : refusée, sans mouvement ni modification du solde
+        movements = StockMovement.objects.count()
+        with self.assertRaises(InsufficientStock):
+            StockMovement.objects.create(material=self.material, movement_type='out',
+                                         quantity=self.material.current_stock + 1)
+        self.assertEqual(StockMovement.objects.count(), movements)
+        current_stock = self.material.current_stock
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.current_stock, current_stock)
+
+
+class GenerateModelUploadTests(TestCase):
+    """Le gestionnaire d'upload borné est installé avant l'authentification (contrôle CSRF compris)"""
+    csrf_token = 'a' * 32
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', 'client@example.com', 'x', user_type='client')
+
+    def image(self, size=(64, 64)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile('robe.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def session_post(self, data):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        client.cookies['csrftoken'] = self.csrf_token
+        # Jeton en premier champ : il est lu même si l'image dépasse la limite
+        return client.post('/api/generate-model/', {'csrfmiddlewaretoken': self.csrf_token, **data})
+
+    def jwt_post(self, data):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        return client.post('/api/generate-model/', data, format='multipart')
+
+    def test_upload_with_session_and_jwt(self):
+        for post in (self.session_post, self.jwt_post):
+            with self.subTest(auth=post.__name__):
+                response = post({'prompt': 'Une robe', 'image': self.image()})
+                self.assertEqual(response.status_code, 202, response.content)
+                job = AIJob.objects.get(pk=response.json()['id'])
+                self.assertTrue(job.payload['image'])
+
+    @override_settings(GENERATE_MODEL_MAX_UPLOAD_SIZE=1000)
+    def test_oversized_upload_with_session_and_jwt(self):
+        for post in (self.session_post, self.jwt_post):
+            with self.subTest(auth=post.__name__):
+                response = post({'prompt': 'Une robe', 'image': self.image((256, 256))})
+                self.assertEqual(response.status_code, 413, response.content)
+        self.assertFalse(AIJob.objects.exists())
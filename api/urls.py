@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 from . import views
-from .views import GenerateModelView
+from .views import GenerateModelView, SearchView
 
 # Router principal
 router = DefaultRouter()
@@ -16,6 +16,7 @@ router.register(r'material-categories', views.MaterialCategoryViewSet)
 router.register(r'materials', views.MaterialViewSet)
 router.register(r'stock-movements', views.StockMovementViewSet)
 router.register(r'measurements', views.MeasurementsViewSet)
+router.register(r'purchase-order-drafts', views.PurchaseOrderDraftViewSet)
 
 # Router imbriqué pour les ateliers
 workshop_router = routers.NestedDefaultRouter(router, r'workshops', lookup='workshop')
@@ -25,6 +26,7 @@ workshop_router.register(r'reviews', views.ReviewViewSet, basename='workshop-rev
 # Router imbriqué pour les modèles
 model_router = routers.NestedDefaultRouter(router, r'models', lookup='model')
 model_router.register(r'images', views.ModelImageViewSet, basename='model-images')
+model_router.register(r'materials', views.BillOfMaterialsItemViewSet, basename='model-materials')
 
 # Router imbriqué pour les commandes
 order_router = routers.NestedDefaultRouter(router, r'orders', lookup='order')
@@ -52,6 +54,7 @@ urlpatterns = [
 
 urlpatterns += [
     path('generate-model/', GenerateModelView.as_view(), name='generate-model'),
+    path('search/', SearchView.as_view(), name='search'),
      path('admin/modele/', views.modele_list, name='modele_list'),
     path('admin/modele/ajouter/', views.modele_add, name='modele_add'),
     path('admin/modele/<int:pk>/modifier/', views.modele_edit, name='modele_edit'),
@@ -0,0 +1,205 @@
+"""
+Valorisation du stock au coût moyen pondéré (CMP) et en FIFO.
+
+Les mouvements sont lus en flux, par lots, triés par (matière, date, id), et
+chaque matière est valorisée en une passe. Le stock présent avant le premier
+mouvement enregistré (écart entre current_stock et le registre) forme une
+couche d'ouverture valorisée au prix unitaire de la fiche matière.
+
+Le résultat est mis en cache ; la clé inclut l'id et le nombre de mouvements
+(les insertions groupées n'émettent pas de signal) et un numéro de version
+changé à chaque modification ou suppression d'un mouvement, d'une matière,
+d'une catégorie ou d'un fournisseur (voir api.signals).
+"""
+import uuid
+from collections import deque
+from decimal import Decimal
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Material, StockMovement
+
+VALUATION_CACHE_TIMEOUT = 3600
+STREAM_CHUNK_SIZE = 5000
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+
+INBOUND_TYPES = ('in', 'return')
+
+
+class MaterialValuation:
+    """Couches de coût d'une matière, tenues en CMP et en FIFO simultanément"""
+
+    def __init__(self, default_cost):
+        self.default_cost = default_cost
+        self.quantity = ZERO
+        self.average_value = ZERO
+        self.layers = deque()  # [quantité, coût unitaire], la plus ancienne à gauche
+
+    @property
+    def average_cost(self):
+        return self.average_value / self.quantity if self.quantity > 0 else self.default_cost
+
+    def receive(self, quantity, unit_cost):
+        self.quantity += quantity
+        self.average_value += quantity * unit_cost
+        self.layers.append([quantity, unit_cost])
+
+    def issue(self, quantity):
+        quantity = min(quantity, self.quantity)
+        if quantity <= 0:
+            return
+        self.average_value -= quantity * self.average_cost
+        self.quantity -= quantity
+        remaining = quantity
+        while remaining > 0 and self.layers:
+            layer = self.layers[0]
+            if layer[0] <= remaining:
+                remaining -= layer[0]
+                self.layers.popleft()
+            else:
+                layer[0] -= remaining
+                remaining = ZERO
+        if self.quantity == 0:
+            self.average_value = ZERO
+
+    def apply(self, movement_type, quantity, unit_price):
+        if movement_type in INBOUND_TYPES:
+            # Retour : réintégré au coût moyen courant ; entrée sans prix : prix de la fiche
+            if movement_type == 'return' and unit_price is None:
+                unit_price = self.average_cost
+            self.receive(quantity, unit_price if unit_price is not None else self.default_cost)
+        else:
+            self.issue(quantity)
+
+    def open_with(self, quantity):
+        """Stock antérieur au registre, placé avant toutes les couches"""
+        if quantity > 0:
+            self.quantity += quantity
+            self.average_value += quantity * self.default_cost
+            self.layers.appendleft([quantity, self.default_cost])
+
+    @property
+    def fifo_value(self):
+        return sum((qty * cost for qty, cost in self.layers), ZERO)
+
+
+def _ledger_net(movements):
+    net = ZERO
+    for movement_type, quantity, _ in movements:
+        net += quantity if movement_type in INBOUND_TYPES else -quantity
+    return net
+
+
+def value_material(material, movements):
+    """
+    Valorise une matière. material : dict (current_stock, unit_price) ;
+    movements : [(movement_type, quantity, unit_price)] dans l'ordre chronologique.
+    """
+    valuation = MaterialValuation(material['unit_price'])
+    valuation.open_with(material['current_stock'] - _ledger_net(movements))
+    for movement_type, quantity, unit_price in movements:
+        valuation.apply(movement_type, quantity, unit_price)
+    return {
+        'quantity': valuation.quantity,
+        'average_cost': valuation.average_cost.quantize(CENT),
+        'weighted_average_value': valuation.average_value.quantize(CENT),
+        'fifo_value': valuation.fifo_value.quantize(CENT),
+    }
+
+
+def stream_movements(chunk_size=STREAM_CHUNK_SIZE):
+    """(material_id, [(type, quantité, prix)]) pour chaque matière, lus en flux par lots"""
+    rows = (
+        StockMovement.objects
+        .order_by('material_id', 'created_at', 'id')
+        .values_list('material_id', 'movement_type', 'quantity', 'unit_price')
+        .iterator(chunk_size=chunk_size)
+    )
+    for material_id, group in groupby(rows, key=lambda row: row[0]):
+        yield material_id, [row[1:] for row in group]
+
+
+def compute_valuation():
+    materials = {
+        row['id']: row
+        for row in Material.objects.values(
+            'id', 'sku', 'name', 'current_stock', 'unit_price',
+            'category_id', 'category__name', 'supplier_id', 'supplier__name',
+        )
+    }
+    results = {}
+    for material_id, movements in stream_movements():
+        if material_id in materials:
+            results[material_id] = value_material(materials[material_id], movements)
+    for material_id, material in materials.items():
+        if material_id not in results:
+            results[material_id] = value_material(material, [])
+
+    lines = []
+    by_category = {}
+    by_supplier = {}
+    totals = _subtotal(None, None)
+    for material_id, values in results.items():
+        material = materials[material_id]
+        lines.append({
+            'material': material_id,
+            'sku': material['sku'],
+            'name': material['name'],
+            'category': material['category_id'],
+            'supplier': material['supplier_id'],
+            **values,
+        })
+        for groups, key, name in (
+            (by_category, material['category_id'], material['category__name']),
+            (by_supplier, material['supplier_id'], material['supplier__name']),
+        ):
+            _accumulate(groups.setdefault(key, _subtotal(key, name)), values)
+        _accumulate(totals, values)
+    del totals['id'], totals['name']
+
+    lines.sort(key=lambda line: line['sku'])
+    return {
+        'totals': totals,
+        'by_category': sorted(by_category.values(), key=lambda group: group['name']),
+        'by_supplier': sorted(by_supplier.values(), key=lambda group: group['name']),
+        'materials': lines,
+    }
+
+
+def _subtotal(key, name):
+    return {'id': key, 'name': name, 'materials': 0,
+            'weighted_average_value': ZERO, 'fifo_value': ZERO}
+
+
+def _accumulate(group, values):
+    group['materials'] += 1
+    group['weighted_average_value'] += values['weighted_average_value']
+    group['fifo_value'] += values['fifo_value']
+
+
+VERSION_KEY = 'stock:valuation:version'
+
+
+def invalidate_valuation():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def valuation_cache_key():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, None)
+    ledger = StockMovement.objects.aggregate(last_id=Max('id'), count=Count('id'))
+    return f"stock:valuation:{version}:{ledger['last_id'] or 0}:{ledger['count']}"
+
+
+def stock_valuation(use_cache=True):
+    key = valuation_cache_key()
+    data = cache.get(key) if use_cache else None
+    if data is None:
+        data = compute_valuation()
+        cache.set(key, data, VALUATION_CACHE_TIMEOUT)
+    return data
@@ -1,28 +1,42 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from .models import (
     User, Workshop, ClothingModel, ModelImage, WorkshopImage,
     Review, Measurements, Order, OrderStatusUpdate, Supplier, MaterialCategory,
-    Material, MaterialImage, StockMovement
+    Material, MaterialImage, StockMovement, WorkshopSpecialty, OrderDailyRollup,
+    InsufficientStock, StockAlert, BillOfMaterialsItem, PurchaseOrderDraft
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, WorkshopSerializer,
     ClothingModelSerializer, ModelImageSerializer, WorkshopImageSerializer,
     ReviewSerializer, MeasurementsSerializer, OrderSerializer,
     OrderStatusUpdateSerializer, SupplierSerializer, MaterialCategorySerializer,
-    MaterialSerializer, MaterialImageSerializer, StockMovementSerializer
+    MaterialSerializer, MaterialImageSerializer, StockMovementSerializer,
+    StockAlertSerializer, BillOfMaterialsItemSerializer, PurchaseOrderDraftSerializer,
+    latest_reviews_prefetch
 )
+from .pagination import (
+    ReviewPagination, OrderPagination, StockMovementPagination, MaterialPagination, UserPagination
+)
+from . import geo, images, metrics, search, stats, stock, valuation
 from django.db.models import Q, F, Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import IsAuthenticated
-import google.generativeai as genai
+from chatgpt import jobs as ai_jobs
+from chatgpt.serializers import AIJobSerializer
 from django.conf import settings
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.core.files.storage import default_storage
-import os
-from PIL import Image
+from django.core.files.base import ContentFile
+import base64
+import math
 from django.shortcuts import render
 from django.shortcuts import render, redirect, get_object_or_404
 from django import forms
@@ -37,9 +51,26 @@ from .models import ModelImage
 from django.forms import modelformset_factory
 from django.contrib.auth.decorators import login_required
 
-class UserViewSet(viewsets.ModelViewSet):
+class ExpandableQuerysetMixin:
+    """
+    Complète le queryset des select_related/prefetch_related des champs
+    demandés par ?expand= (voir DynamicFieldsMixin.optimize_queryset).
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if self.request.method in permissions.SAFE_METHODS and hasattr(serializer_class, 'optimize_queryset'):
+            queryset = serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
+
+class IsAdminUserType(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.user_type == 'admin')
+
+class UserViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserPagination
     # permission_classes = [permissions.IsAuthenticated] # Commented out
 
     def get_serializer_class(self):
@@ -77,26 +108,71 @@ class UserViewSet(viewsets.ModelViewSet):
         # Admins can see all users, and /me/ action bypasses this filter
         return User.objects.all()
 
-class WorkshopViewSet(viewsets.ModelViewSet):
+class WorkshopViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Workshop.objects.filter(is_active=True)
     serializer_class = WorkshopSerializer
     permission_classes = [permissions.AllowAny]  # Permettre l'accès public
+    default_radius_km = 25
+    max_radius_km = 1000
 
     def get_queryset(self):
-        queryset = Workshop.objects.filter(is_active=True)
+        queryset = (
+            Workshop.objects.filter(is_active=True)
+            .select_related('user')
+            .prefetch_related('images', latest_reviews_prefetch())
+        )
         specialties = self.request.query_params.getlist('specialties', None)
+        specialties_match = self.request.query_params.get('specialties_match', 'any')
         min_rating = self.request.query_params.get('min_rating', None)
         max_price = self.request.query_params.get('max_price', None)
 
         if specialties:
-            queryset = queryset.filter(specialties__overlap=specialties)
+            # Recherche sur l'index (code, workshop) de WorkshopSpecialty
+            codes = {code.strip() for value in specialties for code in value.split(',') if code.strip()}
+            links = WorkshopSpecialty.objects.filter(code__in=codes).values('workshop_id')
+            if specialties_match == 'all':
+                links = links.annotate(matched=Count('id')).filter(matched=len(codes))
+            queryset = queryset.filter(id__in=links.values('workshop_id'))
         if min_rating:
-            queryset = queryset.filter(rating__gte=min_rating)
+            # Moyenne stockée : review_sum / review_count >= min_rating, sans division
+            try:
+                min_rating = float(min_rating)
+            except ValueError:
+                min_rating = 0
+            if min_rating > 0:
+                queryset = queryset.filter(
+                    review_count__gt=0,
+                    review_sum__gte=F('review_count') * min_rating,
+                )
         if max_price:
             queryset = queryset.filter(price_range_max__lte=max_price)
+        if self.action == 'list' and 'lat' in self.request.query_params:
+            queryset = self.filter_by_distance(queryset)
 
         return queryset
 
+    def filter_by_distance(self, queryset):
+        """
+        Recherche géographique : lat, lng, radius_km (défaut 25 km) et, optionnellement,
+        nearest=N pour les N ateliers les plus proches dans la limite du rayon.
+        """
+        params = self.request.query_params
+        try:
+            latitude = float(params['lat'])
+            longitude = float(params['lng'])
+            radius_km = min(float(params.get('radius_km', self.default_radius_km)), self.max_radius_km)
+            count = int(params.get('nearest', 0))
+        except (KeyError, ValueError):
+            raise ValidationError({'error': 'Paramètres lat, lng, radius_km ou nearest invalides'})
+        # NaN et infini passent toutes les comparaisons à faux : rejetés avant les bornes
+        if not all(math.isfinite(value) for value in (latitude, longitude, radius_km)):
+            raise ValidationError({'error': 'Coordonnées ou rayon hors limites'})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or radius_km <= 0:
+            raise ValidationError({'error': 'Coordonnées ou rayon hors limites'})
+        if count > 0:
+            return geo.nearest(queryset, latitude, longitude, count, radius_km)
+        return geo.within_radius(queryset, latitude, longitude, radius_km)
+
     @action(detail=True, methods=['post'])
     def add_review(self, request, pk=None):
         workshop = self.get_object()
@@ -116,6 +192,12 @@ class WorkshopViewSet(viewsets.ModelViewSet):
             "total_active_workshops": Workshop.objects.filter(is_active=True).count(),
             # Ajoute d'autres stats ici si besoin
         }
+        # Totaux de commandes lus dans les agrégats journaliers, pas dans Order
+        order_stats = stats.compute_order_stats(OrderDailyRollup.objects.all())
+        data["total_orders"] = order_stats["total_orders"]
+        if request.user.is_authenticated and request.user.user_type == 'admin':
+            data["total_revenue"] = order_stats["total_revenue"]
+            data["paid_revenue"] = order_stats["paid_revenue"]
         return Response(data)
 
     @action(detail=False, methods=['get'], url_path='recent-orders')
@@ -123,41 +205,123 @@ class WorkshopViewSet(viewsets.ModelViewSet):
         """
         Retourne les 10 dernières commandes (tous ateliers confondus).
         """
-        recent_orders = Order.objects.order_by('-created_at')[:10]
-        serializer = OrderSerializer(recent_orders, many=True)
+        recent_orders = OrderSerializer.optimize_queryset(Order.objects.order_by('-created_at'), request)[:10]
+        serializer = OrderSerializer(recent_orders, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'], url_path='clients-orders-count')
     def clients_orders_count(self, request, pk=None):
+        """
+        Clients classés par nombre de commandes, paginé (page, page_size) et
+        filtrable par période (date_from, date_to au format AAAA-MM-JJ, inclusives).
+        """
         workshop = self.get_object()
-        data = (
-            Order.objects
-            .filter(workshop=workshop)
-            .values('user__id', 'user__username', 'user__first_name', 'user__last_name')
-            .annotate(order_count=Count('id'))
-            .order_by('-order_count')
+        params = request.query_params
+        try:
+            page = max(1, int(params.get('page', 1)))
+            page_size = min(100, max(1, int(params.get('page_size', 20))))
+            start = self.parse_day(params.get('date_from'))
+            end = self.parse_day(params.get('date_to'))
+        except ValueError:
+            return Response(
+                {'error': 'Paramètres de pagination ou de dates invalides'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end:
+            end += timedelta(days=1)
+
+        data = stats.workshop_clients_page(
+            workshop.pk, start, end, offset=(page - 1) * page_size, limit=page_size
         )
-        return Response(list(data))
+        url = request.build_absolute_uri()
+        return Response({
+            'count': data['count'],
+            'next': replace_query_param(url, 'page', page + 1) if page * page_size < data['count'] else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': data['results'],
+        })
+
+    @staticmethod
+    def parse_day(value):
+        """Début de journée (heure locale) d'une date AAAA-MM-JJ, ou None"""
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return timezone.make_aware(datetime.combine(day, time.min))
 
     @action(detail=True, methods=['get'], url_path='orders-stats')
     def orders_stats(self, request, pk=None):
         workshop = self.get_object()
-        total_orders = workshop.orders.count()
-        total_revenue = workshop.orders.aggregate(total=Sum('total_price'))['total'] or 0
-        pending_orders = workshop.orders.filter(status='pending').count()
+        return Response(stats.workshop_order_stats(workshop.pk))
+
+    @action(detail=True, methods=['get'], url_path='orders-timeseries')
+    def orders_timeseries(self, request, pk=None):
+        """
+        Commandes et chiffre d'affaires de l'atelier par période
+        (voir timeseries_response pour les paramètres).
+        """
+        workshop = self.get_object()
+        return self.timeseries_response(request, OrderDailyRollup.objects.filter(workshop_id=workshop.pk))
+
+    @action(detail=False, methods=['get'], url_path='orders-timeseries',
+            permission_classes=[permissions.IsAuthenticated])
+    def all_orders_timeseries(self, request):
+        """
+        Série temporelle tous ateliers confondus (administrateurs) ; un atelier
+        n'obtient que la sienne. Filtre optionnel workshop=<id> pour les administrateurs.
+        """
+        rollups = OrderDailyRollup.objects.all()
+        if request.user.user_type == 'admin':
+            workshop_id = request.query_params.get('workshop')
+            if workshop_id:
+                if not workshop_id.isdigit():
+                    return Response({'error': 'Paramètre workshop invalide'}, status=status.HTTP_400_BAD_REQUEST)
+                rollups = rollups.filter(workshop_id=workshop_id)
+        elif request.user.user_type == 'workshop':
+            rollups = rollups.filter(workshop__user=request.user)
+        else:
+            return Response({'error': 'Accès réservé aux ateliers et administrateurs'}, status=status.HTTP_403_FORBIDDEN)
+        return self.timeseries_response(request, rollups)
+
+    def timeseries_response(self, request, rollups):
+        """
+        Paramètres : interval (day, week, month), date_from, date_to (AAAA-MM-JJ,
+        inclusives), status et payment_status. Ne lit que OrderDailyRollup.
+        """
+        params = request.query_params
+        interval = params.get('interval', 'day')
+        if interval not in stats.TIMESERIES_INTERVALS:
+            return Response({'error': 'interval doit valoir day, week ou month'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = self.parse_day(params.get('date_from'))
+            end = self.parse_day(params.get('date_to'))
+        except ValueError:
+            return Response({'error': 'Dates invalides'}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('status'):
+            rollups = rollups.filter(status=params['status'])
+        if params.get('payment_status'):
+            rollups = rollups.filter(payment_status=params['payment_status'])
         return Response({
-            'total_orders': total_orders,
-            'total_revenue': total_revenue,
-            'pending_orders': pending_orders,
+            'interval': interval,
+            'results': stats.order_timeseries(
+                rollups, interval, start and start.date(), end and end.date()
+            ),
         })
 
-class ClothingModelViewSet(viewsets.ModelViewSet):
-    queryset = ClothingModel.objects.filter(is_active=True)
+class ClothingModelViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
+    queryset = ClothingModel.objects.filter(is_active=True, is_draft=False)
     serializer_class = ClothingModelSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        queryset = ClothingModel.objects.filter(is_active=True)
+        # Les brouillons restent hors catalogue (et hors recherche) tant qu'ils ne sont pas publiés
+        queryset = ClothingModel.objects.filter(is_active=True, is_draft=False)
+        if (self.request.query_params.get('drafts') == 'true' and self.request.user.is_authenticated
+                and self.request.user.user_type == 'admin'):
+            # Brouillons générés par lot (voir chatgpt.batch), à valider par un administrateur
+            queryset = ClothingModel.objects.filter(is_draft=True)
         category = self.request.query_params.get('category', None)
         featured = self.request.query_params.get('featured', None)
         min_price = self.request.query_params.get('min_price', None)
@@ -174,7 +338,65 @@ class ClothingModelViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-class ModelImageViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        Peut-on confectionner `quantity` exemplaires du modèle avec le stock
+        disponible (stock courant moins réservations) ? Une seule requête sur la nomenclature.
+        """
+        model = self.get_object()
+        try:
+            quantity = int(request.query_params.get('quantity', 1))
+        except ValueError:
+            quantity = 0
+        if quantity < 1:
+            return Response({'error': 'quantity doit être un entier positif'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = (
+            BillOfMaterialsItem.objects.filter(model=model)
+            .annotate(available=F('material__current_stock') - F('material__reserved_stock'))
+            .values('material_id', 'material__name', 'material__sku', 'material__unit',
+                    'material_quantity', 'available')
+        )
+        materials = []
+        for item in items:
+            required = item['material_quantity'] * quantity
+            available = item['available']
+            materials.append({
+                'material': item['material_id'],
+                'name': item['material__name'],
+                'sku': item['material__sku'],
+                'unit': item['material__unit'],
+                'required': required,
+                'available': available,
+                'missing': max(required - available, 0),
+                # Quantité nulle après conversion d'unité : la matière ne limite pas la production
+                'max_units': (
+                    max(int(available // item['material_quantity']), 0) if item['material_quantity'] else None
+                ),
+            })
+        return Response({
+            'model': model.pk,
+            'quantity': quantity,
+            'bom_defined': bool(materials),
+            'can_make': all(m['missing'] == 0 for m in materials),
+            'max_units': min((m['max_units'] for m in materials if m['max_units'] is not None), default=None),
+            'materials': materials,
+        })
+
+class BillOfMaterialsItemViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
+    queryset = BillOfMaterialsItem.objects.all()
+    serializer_class = BillOfMaterialsItemSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        return BillOfMaterialsItem.objects.filter(model_id=self.kwargs.get('model_pk')).select_related('material')
+
+    def perform_create(self, serializer):
+        model = get_object_or_404(ClothingModel, pk=self.kwargs.get('model_pk'))
+        serializer.save(model=model)
+
+class ModelImageViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = ModelImage.objects.all()
     serializer_class = ModelImageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -183,7 +405,7 @@ class ModelImageViewSet(viewsets.ModelViewSet):
         model_id = self.kwargs.get('model_pk')
         return ModelImage.objects.filter(model_id=model_id)
 
-class WorkshopImageViewSet(viewsets.ModelViewSet):
+class WorkshopImageViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = WorkshopImage.objects.all()
     serializer_class = WorkshopImageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -192,20 +414,21 @@ class WorkshopImageViewSet(viewsets.ModelViewSet):
         workshop_id = self.kwargs.get('workshop_pk')
         return WorkshopImage.objects.filter(workshop_id=workshop_id)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = ReviewPagination
 
     def get_queryset(self):
         workshop_id = self.kwargs.get('workshop_pk')
-        return Review.objects.filter(workshop_id=workshop_id)
+        return Review.objects.filter(workshop_id=workshop_id).select_related('user')
 
     def perform_create(self, serializer):
         workshop = get_object_or_404(Workshop, pk=self.kwargs.get('workshop_pk'))
         serializer.save(user=self.request.user, workshop=workshop)
 
-class MeasurementsViewSet(viewsets.ModelViewSet):
+class MeasurementsViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Measurements.objects.all()
     serializer_class = MeasurementsSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -216,9 +439,10 @@ class MeasurementsViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = OrderPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -228,20 +452,38 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Order.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Une commande créée confirmée ou en cours réserve ou consomme ses matières
+        try:
+            serializer.save(user=self.request.user)
+        except InsufficientStock:
+            raise ValidationError({"error": "Stock insuffisant"})
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except InsufficientStock:
+            raise ValidationError({"error": "Stock insuffisant"})
 
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         order = self.get_object()
         serializer = OrderStatusUpdateSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(
-                order=order,
-                created_by=request.user,
-                status=serializer.validated_data['status']
-            )
-            order.status = serializer.validated_data['status']
-            order.save()
+            # Le passage en fabrication consomme les matières : refusé en bloc si le stock manque
+            try:
+                with transaction.atomic():
+                    order.status = serializer.validated_data['status']
+                    order.save()
+                    serializer.save(
+                        order=order,
+                        created_by=request.user,
+                        status=serializer.validated_data['status']
+                    )
+            except InsufficientStock:
+                return Response(
+                    {"error": "Stock insuffisant"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -258,7 +500,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         order.save()
         return Response(OrderSerializer(order).data)
 
-class OrderStatusUpdateViewSet(viewsets.ModelViewSet):
+class OrderStatusUpdateViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = OrderStatusUpdate.objects.all()
     serializer_class = OrderStatusUpdateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -288,28 +530,27 @@ class OrderStatusUpdateViewSet(viewsets.ModelViewSet):
             # Raise a permission denied error
             raise permissions.PermissionDenied("You do not have permission to add status updates to this order.")
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         queryset = Supplier.objects.all()
-        search = self.request.query_params.get('search', None)
+        search_query = self.request.query_params.get('search', None)
         is_active = self.request.query_params.get('is_active', None)
 
-        if search:
+        if search_query:
+            # Plein texte, plus l'email en sous-chaîne (les jetons ne couvrent que des débuts de mots)
             queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(contact_name__icontains=search) |
-                Q(email__icontains=search)
+                Q(id__in=search.matching_ids(search_query, 'supplier')) | Q(email__icontains=search_query)
             )
         if is_active is not None:
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
 
         return queryset
 
-class MaterialCategoryViewSet(viewsets.ModelViewSet):
+class MaterialCategoryViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = MaterialCategory.objects.all()
     serializer_class = MaterialCategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -317,41 +558,138 @@ class MaterialCategoryViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # Allow non-authenticated users to list categories if needed, otherwise restrict
         # If you only want authenticated users to see categories, add permissions.IsAuthenticated
-        return MaterialCategory.objects.all()
+        return MaterialCategory.objects.select_related('parent')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method in permissions.SAFE_METHODS:
+            # Enfants de toutes les catégories en une requête, pour les sous-arbres imbriqués
+            context['category_children'] = self.children_map(MaterialCategory.objects.select_related('parent'))
+        return context
+
+    @staticmethod
+    def children_map(categories):
+        children = {}
+        for category in categories.order_by('name', 'id'):
+            children.setdefault(category.parent_id, []).append(category)
+        return children
 
-class MaterialViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Arborescence complète construite en mémoire à partir d'une requête ;
+        root=<id> limite au sous-arbre de cette catégorie (chemin matérialisé).
+        """
+        categories = MaterialCategory.objects.all()
+        root_id = request.query_params.get('root')
+        if root_id:
+            root = get_object_or_404(MaterialCategory, pk=root_id)
+            categories = root.descendants()
+        children = self.children_map(categories)
+
+        def node(category):
+            return {
+                'id': category.pk,
+                'name': category.name,
+                'description': category.description,
+                'depth': category.depth,
+                'children': [node(child) for child in children.get(category.pk, [])],
+            }
+
+        roots = [root] if root_id else children.get(None, [])
+        return Response([node(category) for category in roots])
+
+class MaterialViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
+    pagination_class = MaterialPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        queryset = Material.objects.all()
-        search = self.request.query_params.get('search', None)
+        queryset = Material.objects.select_related('category', 'supplier').prefetch_related('images')
+        search_query = self.request.query_params.get('search', None)
         category = self.request.query_params.get('category', None)
         supplier = self.request.query_params.get('supplier', None)
         stock_status = self.request.query_params.get('stock_status', None)
         is_active = self.request.query_params.get('is_active', None)
 
-        if search:
+        if search_query:
+            # Plein texte, plus le SKU en sous-chaîne (un fragment de code au milieu du SKU)
             queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(sku__icontains=search) |
-                Q(description__icontains=search)
+                Q(id__in=search.matching_ids(search_query, 'material')) | Q(sku__icontains=search_query)
             )
         if category:
-            queryset = queryset.filter(category_id=category)
+            # La catégorie et toutes ses sous-catégories
+            path = MaterialCategory.objects.filter(pk=category).values_list('path', flat=True).first()
+            queryset = queryset.filter(category__path__startswith=path) if path else queryset.none()
         if supplier:
             queryset = queryset.filter(supplier_id=supplier)
         if stock_status:
+            # Statut stocké et indexé ; « stock bas » inclut les ruptures
             if stock_status == 'out_of_stock':
-                queryset = queryset.filter(current_stock=0)
+                queryset = queryset.filter(stock_status='out_of_stock')
             elif stock_status == 'low_stock':
-                queryset = queryset.filter(current_stock__lte=F('min_stock_level'))
+                queryset = queryset.filter(stock_status__in=['low_stock', 'out_of_stock'])
         if is_active is not None:
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
+        as_of = self.request.query_params.get('as_of', None)
+        if as_of:
+            queryset = stock.annotate_stock_as_of(queryset, self.parse_as_of(as_of))
 
         return queryset
 
+    @staticmethod
+    def parse_as_of(value):
+        """as_of : date-heure ISO, ou date AAAA-MM-JJ (stock en fin de journée)"""
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({'error': 'Paramètre as_of invalide'})
+            moment = datetime.combine(day + timedelta(days=1), time.min) - timedelta(microseconds=1)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUserType])
+    def valuation(self, request):
+        """
+        Valeur du stock (coût moyen pondéré et FIFO) avec sous-totaux par catégorie
+        et par fournisseur ; materials=1 ajoute le détail par matière.
+        """
+        data = valuation.stock_valuation()
+        if request.query_params.get('materials') not in ('1', 'true'):
+            data = {key: value for key, value in data.items() if key != 'materials'}
+        return Response(data)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def alerts(self, request):
+        """
+        Alertes de stock ouvertes groupées par fournisseur (index partiel sur les
+        alertes ouvertes, sans parcourir les matières). Filtres : status, supplier.
+        """
+        alerts = (
+            StockAlert.objects.filter(resolved_at__isnull=True)
+            .select_related('material', 'supplier')
+            .order_by('supplier__name', 'supplier_id', '-created_at')
+        )
+        if request.query_params.get('status'):
+            alerts = alerts.filter(status=request.query_params['status'])
+        if request.query_params.get('supplier'):
+            alerts = alerts.filter(supplier_id=request.query_params['supplier'])
+
+        groups = {}
+        for alert in alerts:
+            group = groups.setdefault(alert.supplier_id, {
+                'supplier': {'id': alert.supplier_id, 'name': alert.supplier.name, 'email': alert.supplier.email},
+                'alerts': [],
+            })
+            group['alerts'].append(StockAlertSerializer(alert).data)
+        return Response({
+            'count': sum(len(group['alerts']) for group in groups.values()),
+            'results': list(groups.values()),
+        })
+
     @action(detail=True, methods=['post'])
     def add_stock(self, request, pk=None):
         material = self.get_object()
@@ -370,21 +708,22 @@ class MaterialViewSet(viewsets.ModelViewSet):
         material = self.get_object()
         serializer = StockMovementSerializer(data=request.data)
         if serializer.is_valid():
-            quantity = serializer.validated_data['quantity']
-            if material.current_stock < quantity:
+            # Le contrôle du stock est fait par la requête UPDATE elle-même
+            try:
+                serializer.save(
+                    material=material,
+                    movement_type='out',
+                    created_by=request.user
+                )
+            except InsufficientStock:
                 return Response(
                     {"error": "Stock insuffisant"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer.save(
-                material=material,
-                movement_type='out',
-                created_by=request.user
-            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class MaterialImageViewSet(viewsets.ModelViewSet):
+class MaterialImageViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = MaterialImage.objects.all()
     serializer_class = MaterialImageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -398,13 +737,14 @@ class MaterialImageViewSet(viewsets.ModelViewSet):
         # Optional: Check if user has permissions to add images to this material
         serializer.save(material=material)
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     queryset = StockMovement.objects.all()
     serializer_class = StockMovementSerializer
+    pagination_class = StockMovementPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = StockMovement.objects.all()
+        queryset = StockMovement.objects.select_related('material', 'created_by')
         material_id = self.request.query_params.get('material', None)
         movement_type = self.request.query_params.get('movement_type', None)
 
@@ -426,49 +766,154 @@ class StockMovementViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Optional: Check if the user has permission to create stock movements for this material
-        serializer.save(created_by=self.request.user)
+        try:
+            serializer.save(created_by=self.request.user)
+        except InsufficientStock:
+            raise ValidationError({"error": "Stock insuffisant"})
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except InsufficientStock:
+            raise ValidationError({"error": "Stock insuffisant"})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUserType])
+    def receive(self, request):
+        """
+        Réception d'une livraison : {reference, mode: atomic|per_line, lines: [{sku ou
+        material, quantity, unit_price, reference, notes}]}, appliquée en une transaction.
+        """
+        receipt = stock.StockReceiptSerializer(data=request.data)
+        receipt.is_valid(raise_exception=True)
+        created, errors = stock.receive_delivery(
+            receipt.validated_data['lines'],
+            reference=receipt.validated_data['reference'],
+            user=request.user,
+            atomic=receipt.validated_data['mode'] == 'atomic',
+        )
+        return Response(
+            {
+                'created': len(created),
+                'movements': [movement.pk for movement in created],
+                'errors': errors,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except InsufficientStock:
+            raise ValidationError({"error": "Stock insuffisant"})
+
+class PurchaseOrderDraftViewSet(ExpandableQuerysetMixin, mixins.UpdateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Bons de commande suggérés (calculés par la commande plan_reorders). Seul le
+    statut est modifiable, pour valider ou marquer un bon comme envoyé.
+    """
+    queryset = PurchaseOrderDraft.objects.all()
+    serializer_class = PurchaseOrderDraftSerializer
+    permission_classes = [IsAdminUserType]
+
+    def get_queryset(self):
+        queryset = PurchaseOrderDraft.objects.select_related('supplier').prefetch_related('lines__material')
+        status_filter = self.request.query_params.get('status', None)
+        supplier = self.request.query_params.get('supplier', None)
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        if supplier:
+            queryset = queryset.filter(supplier_id=supplier)
+        return queryset
+
+class SearchView(APIView):
+    """
+    Recherche plein texte classée sur les ateliers, modèles, matières et fournisseurs.
+    Paramètres : q, type (répétable : workshop, model, material, supplier), page, page_size.
+    """
+    permission_classes = [permissions.AllowAny]
+    page_size = 20
+    max_page_size = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        public_types = ['workshop', 'model', 'material']
+        allowed_types = public_types + ['supplier'] if request.user.is_authenticated else public_types
+        doc_types = [t for t in request.query_params.getlist('type') if t in allowed_types] or allowed_types
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = min(self.max_page_size, max(1, int(request.query_params.get('page_size', self.page_size))))
+        except ValueError:
+            return Response({'error': 'Paramètres de pagination invalides'}, status=status.HTTP_400_BAD_REQUEST)
+
+        total, rows = search.search(query, doc_types, limit=page_size, offset=(page - 1) * page_size)
+        url = request.build_absolute_uri()
+        return Response({
+            'count': total,
+            'next': replace_query_param(url, 'page', page + 1) if page * page_size < total else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': [
+                {'type': doc_type, 'id': object_id, 'title': title, 'subtitle': subtitle, 'rank': rank}
+                for doc_type, object_id, title, subtitle, rank in rows
+            ],
+        })
 
 class GenerateModelView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Avant l'authentification : le contrôle CSRF de SessionAuthentication lit
+        # request.POST, ce qui analyse le corps avec les gestionnaires déjà installés.
+        # L'image est reçue en mémoire, dans la limite de taille, sans fichier
+        # temporaire ni écriture dans MEDIA_ROOT
+        self.upload_handler = images.BoundedUploadHandler(settings.GENERATE_MODEL_MAX_UPLOAD_SIZE, request)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
+        max_size = settings.GENERATE_MODEL_MAX_UPLOAD_SIZE
+        metrics.increment('generate_model.requests')
+
         prompt = request.data.get('prompt')
+        if self.upload_handler.exceeded:
+            metrics.increment('generate_model.rejected_too_large')
+            return Response({'error': f'Image trop volumineuse (maximum {max_size} octets)'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
         image = request.FILES.get('image')
 
         if not prompt:
             return Response({'error': 'Prompt requis'}, status=400)
 
-        image_path = None
-        img = None
+        persisted = None
+        payload = None
         if image:
-            save_dir = os.path.join(settings.MEDIA_ROOT, 'models')
-            os.makedirs(save_dir, exist_ok=True)
-            filename = default_storage.get_available_name(os.path.join('models', image.name))
-            file_path = os.path.join(settings.MEDIA_ROOT, filename)
-            with open(file_path, 'wb+') as destination:
-                for chunk in image.chunks():
-                    destination.write(chunk)
-            image_path = default_storage.url(filename)
-            img = Image.open(file_path)
-
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
-        if img:
-            model = genai.GenerativeModel('gemini-pro-vision')
-            gemini_response = model.generate_content([prompt, img])
-        else:
-            model = genai.GenerativeModel('gemini-pro')
-            gemini_response = model.generate_content(prompt)
-
+            data = image.read()
+            metrics.increment('generate_model.bytes_in', len(data))
+            try:
+                payload = images.downscale_for_model(data, settings.GENERATE_MODEL_IMAGE_MAX_SIDE)
+            except ValueError:
+                return Response({'error': 'Image illisible'}, status=400)
+            # L'original n'est conservé que sur demande (persist=true), référencé par le job (AIJob.image)
+            if str(request.data.get('persist', '')).lower() in ('1', 'true'):
+                persisted = ContentFile(data, name=image.name)
+                metrics.increment('generate_model.images_persisted')
+
+        # L'appel à Gemini est exécuté par le worker IA (voir chatgpt.jobs) ; le
+        # résultat ({'result', 'image_url'}) est lu sur status_url
+        job = ai_jobs.submit('generate_model', {
+            'prompt': prompt,
+            'image': base64.b64encode(payload).decode('ascii') if payload else None,
+            'image_url': None,
+        }, request.user, image=persisted)
         return Response({
-            'result': gemini_response.text,
-            'image_url': image_path
-        })
+            **AIJobSerializer(job, context={'request': request}).data,
+            'image_url': job.payload['image_url']
+        }, status=status.HTTP_202_ACCEPTED)
 
 class ClothingModelForm(forms.ModelForm):
     class Meta:
         model = ClothingModel
-        fields = ['name', 'category', 'description', 'price', 'estimated_time', 'featured', 'styles', 'is_active', 'model_3d_url']
+        fields = ['name', 'category', 'description', 'price', 'estimated_time', 'featured', 'styles', 'is_active', 'is_draft', 'model_3d_url']
 
 
 @login_required
@@ -613,8 +1058,13 @@ def commande_add(request):
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
-            form.save()
-            return redirect('commande_list')
+            # Confirmation et mise en fabrication réservent ou consomment les matières
+            try:
+                form.save()
+            except InsufficientStock as exc:
+                form.add_error('status', str(exc))
+            else:
+                return redirect('commande_list')
     else:
         form = OrderForm()
     return render(request, 'admin/commande_form.html', {'form': form})
@@ -626,8 +1076,13 @@ def commande_edit(request, pk):
     if request.method == 'POST':
         form = OrderForm(request.POST, instance=commande)
         if form.is_valid():
-            form.save()
-            return redirect('commande_list')
+            # Confirmation et mise en fabrication réservent ou consomment les matières
+            try:
+                form.save()
+            except InsufficientStock as exc:
+                form.add_error('status', str(exc))
+            else:
+                return redirect('commande_list')
     else:
         form = OrderForm(instance=commande)
     return render(request, 'admin/commande_form.html', {'form': form, 'edit': True, 'commande': commande})
@@ -11,6 +11,9 @@ def build():
     
     # Appliquer les migrations
     subprocess.check_call([sys.executable, "manage.py", "migrate"])
+
+    # Créer la table du cache partagé (sans effet si elle existe déjà)
+    subprocess.check_call([sys.executable, "manage.py", "createcachetable"])
     
     print("Build completed successfully!")
 
@@ -12,6 +12,9 @@ python manage.py collectstatic --noinput
 # Appliquer les migrations
 python manage.py migrate
 
+# Créer la table du cache partagé
+python manage.py createcachetable
+
 # Créer un superutilisateur si nécessaire (décommenter si besoin)
 # python manage.py createsuperuser --noinput
 
@@ -0,0 +1,285 @@
+"""
+Génération de modèles par lot sur le catalogue de matières.
+
+Un lot (AIBatchRun) porte une ligne AIBatchItem par matière retenue (par
+catégorie, fournisseur ou liste d'identifiants). process_run traite les
+matières en attente sur un pool de threads borné ; les appels au modèle
+passent par un seau à jetons de AI_BATCH_RATE_PER_MINUTE appels par minute,
+dont le débit est divisé par deux à chaque réponse 429. Les réponses déjà en
+cache (chatgpt.cache, partagé avec generate_models_from_fabric) ne consomment
+pas de jeton.
+
+Les suggestions sont enregistrées en brouillons (ClothingModel.is_draft,
+inactifs) par bulk_create, dans la même transaction que le passage de la
+matière à « done » : un lot interrompu (arrêt du processus, disjoncteur
+ouvert) reprend avec les seules matières restantes.
+
+Les lots en attente (créés par l'API) sont exécutés un à un par le worker IA
+(run_ai_worker) ; generate_catalog_models crée, traite et reprend les lots à la main.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from api import metrics
+from api.models import ClothingModel, Material, MaterialCategory
+
+from . import cache
+from .client import CircuitOpen
+from .llm import LLMError, get_llm
+from .models import AIBatchItem, AIBatchRun
+
+logger = logging.getLogger(__name__)
+
+BATCH_MODEL = 'gpt-4'
+DEFAULT_ESTIMATED_TIME = 7
+METRICS = ('ai_batch.items_done', 'ai_batch.items_failed', 'ai_batch.models_created')
+
+
+class RateLimiter:
+    """Seau à jetons partagé par les threads du pool"""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60
+        self.min_rate = 1 / 60
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        """Réponse 429 : le débit est divisé par deux (au plus bas un appel par minute)"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.capacity = 1
+            self.tokens = min(self.tokens, 1)
+
+
+def select_materials(filters):
+    """Matières actives retenues par les filtres d'un lot : category (avec ses sous-catégories), supplier, materials"""
+    queryset = Material.objects.filter(is_active=True)
+    if filters.get('category'):
+        path = MaterialCategory.objects.filter(pk=filters['category']).values_list('path', flat=True).first()
+        queryset = queryset.filter(category__path__startswith=path) if path else queryset.none()
+    if filters.get('supplier'):
+        queryset = queryset.filter(supplier_id=filters['supplier'])
+    if filters.get('materials'):
+        queryset = queryset.filter(pk__in=filters['materials'])
+    return queryset.order_by('pk')
+
+
+def create_run(filters, user=None):
+    materials = select_materials(filters)
+    with transaction.atomic():
+        run = AIBatchRun.objects.create(
+            filters=filters, created_by=user if user is not None and user.is_authenticated else None,
+        )
+        items = [AIBatchItem(run=run, material_id=pk) for pk in materials.values_list('pk', flat=True)]
+        AIBatchItem.objects.bulk_create(items, batch_size=500)
+        run.total_items = len(items)
+        run.save(update_fields=['total_items'])
+    return run
+
+
+def start_run(run, resume=False):
+    """
+    Réserve le lot pour ce processus ; resume reprend aussi un lot resté
+    « running » (processus arrêté sans pouvoir le marquer interrompu).
+    """
+    statuses = ['queued', 'interrupted'] + (['running'] if resume else [])
+    started = AIBatchRun.objects.filter(pk=run.pk, status__in=statuses).update(
+        status='running', started_at=timezone.now(), finished_at=None,
+    )
+    run.refresh_from_db()
+    return bool(started)
+
+
+def fabric_data(material):
+    """Données du tissu au format envoyé par le front à generate_models_from_fabric"""
+    return {
+        'id': material.pk,
+        'name': material.name,
+        'description': material.description,
+        'color': material.color,
+        'unit_price': material.unit_price,
+        'unit_display': material.unit,
+    }
+
+
+def suggest_models(material, limiter):
+    from .views import FABRIC_PROMPT_FIELDS, FABRIC_SYSTEM_PROMPT, PROMPT_VERSIONS, create_fabric_models_prompt
+
+    fabric = fabric_data(material)
+    messages = [
+        {'role': 'system', 'content': FABRIC_SYSTEM_PROMPT},
+        {'role': 'user', 'content': create_fabric_models_prompt(fabric)},
+    ]
+
+    def ask_llm():
+        limiter.acquire()
+        content = get_llm().chat(BATCH_MODEL, messages, max_tokens=2000, temperature=0.8)
+        parsed = json.loads(content)
+        if not isinstance(parsed, dict) or not isinstance(parsed.get('models', []), list):
+            raise ValueError("Réponse du modèle sans liste 'models'")
+        return {'models': parsed.get('models', [])}
+
+    result, _ = cache.cached_call(
+        'generate_models_from_fabric', PROMPT_VERSIONS['generate_models_from_fabric'], BATCH_MODEL,
+        fabric, FABRIC_PROMPT_FIELDS, ask_llm,
+    )
+    return result['models']
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+    return price if Decimal('0') <= price < Decimal('1e8') else Decimal('0.00')
+
+
+def _days(value):
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_ESTIMATED_TIME
+    return days if days > 0 else DEFAULT_ESTIMATED_TIME
+
+
+def draft_models(material, suggestions):
+    """Brouillons ClothingModel (inactifs, à valider) des suggestions du modèle pour une matière"""
+    categories = dict(ClothingModel.CATEGORY_CHOICES)
+    drafts = []
+    for suggestion in suggestions:
+        if not isinstance(suggestion, dict) or not suggestion.get('name'):
+            continue
+        category = suggestion.get('category')
+        styles = suggestion.get('styles')
+        description = '\n\n'.join(
+            str(suggestion[key]) for key in ('description', 'designNotes', 'fabricUsage') if suggestion.get(key)
+        )
+        drafts.append(ClothingModel(
+            name=str(suggestion['name'])[:100],
+            category=category if isinstance(category, str) and category in categories else 'other',
+            description=description,
+            price=_price(suggestion.get('estimatedPrice', suggestion.get('price'))),
+            estimated_time=_days(suggestion.get('estimatedTime')),
+            styles=[str(style) for style in styles] if isinstance(styles, list) else [],
+            is_active=False,
+            is_draft=True,
+            source_material=material,
+        ))
+    return drafts
+
+
+def process_item(pk, limiter, stop):
+    """Traite une matière du lot (appelé dans un thread du pool)"""
+    if stop.is_set():
+        return
+    close_old_connections()
+    if not AIBatchItem.objects.filter(pk=pk, status='pending').update(
+        status='running', attempts=F('attempts') + 1,
+    ):
+        return
+    item = AIBatchItem.objects.select_related('material').get(pk=pk)
+    try:
+        drafts = draft_models(item.material, suggest_models(item.material, limiter))
+        with transaction.atomic():
+            # Filtre sur le statut et l'essai : une matière reprise par un autre processus n'est pas enregistrée deux fois
+            if AIBatchItem.objects.filter(pk=pk, status='running', attempts=item.attempts).update(
+                status='done', models_created=len(drafts), error='', finished_at=timezone.now(),
+            ):
+                ClothingModel.objects.bulk_create(drafts)
+    except CircuitOpen:
+        # Service IA indisponible : le lot s'arrête, la matière sera reprise sans compter d'essai
+        stop.set()
+        AIBatchItem.objects.filter(pk=pk, status='running').update(status='pending', attempts=F('attempts') - 1)
+        return
+    except Exception as exc:
+        # Toute autre erreur (réponse inattendue, corps d'API malformé, base) ne concerne que cette
+        # matière : elle compte comme un essai, sans interrompre le lot
+        if isinstance(exc, LLMError) and exc.status_code == 429:
+            limiter.slow_down()
+        failed = item.attempts >= settings.AI_JOB_MAX_ATTEMPTS
+        log = logger.warning if isinstance(exc, (LLMError, ValueError)) else logger.exception
+        log("Lot %s : matière %s en échec (essai %s) : %s", item.run_id, item.material_id, item.attempts, exc)
+        AIBatchItem.objects.filter(pk=pk, status='running').update(
+            status='failed' if failed else 'pending', error=str(exc) or exc.__class__.__name__,
+            finished_at=timezone.now() if failed else None,
+        )
+        if failed:
+            metrics.increment('ai_batch.items_failed')
+        return
+    metrics.increment('ai_batch.items_done')
+    metrics.increment('ai_batch.models_created', len(drafts))
+
+
+def process_run(run, concurrency=None, rate_per_minute=None):
+    """Traite les matières en attente d'un lot réservé par start_run ; retourne son statut final"""
+    concurrency = concurrency or settings.AI_BATCH_CONCURRENCY
+    limiter = RateLimiter(rate_per_minute or settings.AI_BATCH_RATE_PER_MINUTE, burst=concurrency)
+    stop = threading.Event()
+    # Matières restées « running » : processus précédent arrêté en cours de route ; l'essai
+    # interrompu compte, une matière qui arrête le processus à chaque essai finit en échec
+    stuck = run.items.filter(status='running')
+    exhausted = stuck.filter(attempts__gte=settings.AI_JOB_MAX_ATTEMPTS).update(
+        status='failed', error='Essais épuisés', finished_at=timezone.now(),
+    )
+    if exhausted:
+        metrics.increment('ai_batch.items_failed', exhausted)
+    stuck.update(status='pending')
+    final_status = 'interrupted'
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while not stop.is_set():
+                    pending = list(
+                        run.items.filter(status='pending').order_by('pk').values_list('pk', flat=True)[:concurrency * 4]
+                    )
+                    if not pending:
+                        break
+                    list(executor.map(lambda pk: process_item(pk, limiter, stop), pending))
+            except BaseException:
+                # Ctrl-C : les matières déjà soumises au pool ne sont pas démarrées
+                stop.set()
+                raise
+        if not stop.is_set():
+            final_status = 'completed'
+    finally:
+        AIBatchRun.objects.filter(pk=run.pk).update(
+            status=final_status, finished_at=timezone.now() if final_status == 'completed' else None,
+        )
+        run.refresh_from_db()
+    return final_status
+
+
+def progress(run):
+    counts = dict(run.items.values('status').annotate(count=Count('pk')).values_list('status', 'count'))
+    return {
+        **{status: counts.get(status, 0) for status, _ in AIBatchItem.STATUS_CHOICES},
+        'models_created': run.items.aggregate(total=Sum('models_created'))['total'] or 0,
+    }
+
+
+def stats():
+    return {name.split('.', 1)[1]: value for name, value in metrics.snapshot(METRICS).items()}
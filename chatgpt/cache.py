@@ -0,0 +1,145 @@
+"""
+Cache persistant des réponses OpenAI, en base : partagé par les workers
+gunicorn et conservé aux redémarrages.
+
+La clé est l'empreinte SHA-256 du tissu normalisé (seuls les champs utilisés
+par le prompt, espaces réduits, nombres au format canonique), de la version du
+template de prompt et du nom du modèle : changer le prompt ou le modèle
+invalide les entrées sans avoir à vider la table.
+
+Les entrées expirent après AI_RESPONSE_CACHE_TTL secondes ; au-delà de
+AI_RESPONSE_CACHE_MAX_ENTRIES, les moins récemment utilisées sont évincées.
+Les compteurs (hits, misses, stores, evictions) sont tenus par api.metrics.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from api import metrics
+
+from .models import AIResponseCache
+
+METRICS = ('ai_cache.hits', 'ai_cache.misses', 'ai_cache.stores', 'ai_cache.evictions')
+
+
+def _normalize_value(value):
+    """Espaces réduits ; nombres (ou chaînes numériques : "12.50", 12.5) au même format"""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float, Decimal)):
+        return value
+    text = ' '.join(str(value).split())
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return text
+    return format(number.normalize(), 'f') if number.is_finite() else text
+
+
+def normalize_fabric(fabric, fields):
+    """Champs du tissu lus par le prompt, normalisés ; absents et vides sont équivalents"""
+    normalized = {}
+    for field in fields:
+        value = _normalize_value(fabric.get(field))
+        if value not in (None, ''):
+            normalized[field] = value
+    return normalized
+
+
+def cache_key(endpoint, prompt_version, model_name, fabric, fields):
+    payload = {
+        'endpoint': endpoint,
+        'prompt_version': prompt_version,
+        'model': model_name,
+        'fabric': normalize_fabric(fabric, fields),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get(key):
+    """Réponse en cache encore valide, ou None ; met à jour la date d'usage (LRU)"""
+    now = timezone.now()
+    entry = AIResponseCache.objects.filter(key=key, expires_at__gt=now).only('id', 'response').first()
+    if entry is None:
+        metrics.increment('ai_cache.misses')
+        return None
+    AIResponseCache.objects.filter(pk=entry.pk).update(last_used_at=now, hit_count=F('hit_count') + 1)
+    metrics.increment('ai_cache.hits')
+    return entry.response
+
+
+def put(key, endpoint, prompt_version, model_name, response):
+    now = timezone.now()
+    values = {
+        'endpoint': endpoint,
+        'prompt_version': prompt_version,
+        'model_name': model_name,
+        'response': response,
+        'hit_count': 0,
+        'last_used_at': now,
+        'expires_at': now + timedelta(seconds=settings.AI_RESPONSE_CACHE_TTL),
+    }
+    try:
+        AIResponseCache.objects.update_or_create(key=key, defaults=values)
+    except IntegrityError:
+        # Même réponse enregistrée au même moment par un autre worker
+        return
+    metrics.increment('ai_cache.stores')
+    evict(now)
+
+
+def evict(now=None):
+    """Supprime les entrées expirées puis les moins récemment utilisées au-delà du maximum"""
+    now = now or timezone.now()
+    deleted, _ = AIResponseCache.objects.filter(expires_at__lte=now).delete()
+    excess = AIResponseCache.objects.count() - settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = AIResponseCache.objects.order_by('last_used_at', 'id').values_list('id', flat=True)[:excess]
+        deleted += AIResponseCache.objects.filter(id__in=list(oldest)).delete()[0]
+    if deleted:
+        metrics.increment('ai_cache.evictions', deleted)
+    return deleted
+
+
+def cached_call(endpoint, prompt_version, model_name, fabric, fields, call):
+    """
+    Réponse en cache pour ce tissu, ou résultat de call() mis en cache.
+    call() retourne la réponse à conserver, ou None pour ne rien enregistrer
+    (erreur, réponse de secours). Retourne (réponse, servie_depuis_le_cache).
+    """
+    key = cache_key(endpoint, prompt_version, model_name, fabric, fields)
+    response = get(key)
+    if response is not None:
+        return response, True
+    response = call()
+    if response is not None:
+        put(key, endpoint, prompt_version, model_name, response)
+    return response, False
+
+
+def stats():
+    now = timezone.now()
+    table = AIResponseCache.objects.aggregate(
+        entries=Count('id'),
+        expired=Count('id', filter=Q(expires_at__lte=now)),
+        entry_hits=Sum('hit_count', default=0),
+    )
+    by_endpoint = (
+        AIResponseCache.objects.values('endpoint')
+        .annotate(entries=Count('id'), hits=Sum('hit_count'))
+        .order_by('endpoint')
+    )
+    counters = metrics.snapshot(METRICS)
+    lookups = counters['ai_cache.hits'] + counters['ai_cache.misses']
+    return {
+        **{name.split('.', 1)[1]: value for name, value in counters.items()},
+        'hit_ratio': round(counters['ai_cache.hits'] / lookups, 4) if lookups else None,
+        **table,
+        'by_endpoint': list(by_endpoint),
+        'max_entries': settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+        'ttl_seconds': settings.AI_RESPONSE_CACHE_TTL,
+    }
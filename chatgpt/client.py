@@ -0,0 +1,181 @@
+"""
+Client HTTP des appels OpenAI.
+
+Une session requests par processus (connexions HTTPS conservées entre les
+appels, pool de AI_HTTP_POOL_SIZE connexions) ; les réponses 429 et 5xx et
+les erreurs réseau sont réessayées avec un délai exponentiel à jitter complet,
+en respectant Retry-After.
+
+Un disjoncteur, partagé par tous les processus via le cache, s'ouvre après
+AI_BREAKER_FAILURE_THRESHOLD échecs consécutifs : les appels échouent alors
+aussitôt (CircuitOpen), et les vues servent les modèles de secours, jusqu'à ce
+qu'un appel d'essai réussisse, AI_BREAKER_RESET_TIMEOUT secondes plus tard.
+
+Latences, essais, échecs et état du disjoncteur sont tenus par api.metrics.
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from api import metrics
+
+from .llm import LLMError
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000)
+METRICS = (
+    'openai.requests', 'openai.retries', 'openai.failures',
+    'openai.short_circuited', 'openai.breaker_opened',
+)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class CircuitOpen(LLMError):
+    def __init__(self):
+        super().__init__('Service IA indisponible (disjoncteur ouvert)')
+
+
+def get_session():
+    """Session du processus courant ; recréée après un fork (workers gunicorn)"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.AI_HTTP_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+class CircuitBreaker:
+    """
+    closed : les appels passent ; open : ils échouent aussitôt ; half_open :
+    le délai est écoulé, un seul appel d'essai passe et décide de l'état suivant.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.key = f'breaker:{name}'
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _load(self):
+        return cache.get(self.key) or {'state': 'closed', 'failures': 0, 'opened_at': None}
+
+    def state(self):
+        data = self._load()
+        if data['state'] == 'open' and time.time() - data['opened_at'] >= self.reset_timeout:
+            return 'half_open'
+        return data['state']
+
+    def allow_request(self):
+        state = self.state()
+        if state == 'closed':
+            return True
+        if state == 'half_open':
+            # add() n'aboutit que pour un seul processus : un seul appel d'essai
+            return cache.add(f'{self.key}:trial', 1, self.reset_timeout)
+        return False
+
+    def record_success(self):
+        data = self._load()
+        if data['state'] != 'closed' or data['failures']:
+            cache.set(self.key, {'state': 'closed', 'failures': 0, 'opened_at': None}, None)
+            cache.delete(f'{self.key}:trial')
+
+    def record_failure(self):
+        data = self._load()
+        failures = data['failures'] + 1
+        if data['state'] == 'open' or failures >= self.failure_threshold:
+            data = {'state': 'open', 'failures': failures, 'opened_at': time.time()}
+            cache.delete(f'{self.key}:trial')
+            metrics.increment('openai.breaker_opened')
+        else:
+            data = {**data, 'failures': failures}
+        cache.set(self.key, data, None)
+
+    def describe(self):
+        data = self._load()
+        opened_at = data['opened_at']
+        return {
+            'state': self.state(),
+            'consecutive_failures': data['failures'],
+            'opened_at': datetime.fromtimestamp(opened_at, tz=dt_timezone.utc) if opened_at else None,
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout,
+        }
+
+
+def openai_breaker():
+    return CircuitBreaker('openai', settings.AI_BREAKER_FAILURE_THRESHOLD, settings.AI_BREAKER_RESET_TIMEOUT)
+
+
+def backoff_delay(attempt, response=None):
+    """Délai avant le nouvel essai n° attempt (1, 2...) : Retry-After s'il est donné, sinon jitter complet"""
+    ceiling = min(settings.AI_HTTP_BACKOFF_MAX, settings.AI_HTTP_BACKOFF_BASE * 2 ** (attempt - 1))
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.AI_HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, ceiling)
+
+
+def post_json(url, payload, headers, breaker=None):
+    """
+    POST JSON avec nouvel essai sur 429/5xx et erreurs réseau. Retourne la
+    réponse décodée ; lève LLMError (CircuitOpen si le disjoncteur est ouvert).
+    """
+    breaker = breaker or openai_breaker()
+    if not breaker.allow_request():
+        metrics.increment('openai.short_circuited')
+        raise CircuitOpen()
+
+    session = get_session()
+    attempt = 0
+    while True:
+        attempt += 1
+        response = error = None
+        started = time.monotonic()
+        try:
+            response = session.post(url, json=payload, headers=headers, timeout=settings.AI_HTTP_TIMEOUT)
+        except requests.RequestException as exc:
+            error = exc
+        metrics.observe('openai.latency_ms', (time.monotonic() - started) * 1000, LATENCY_BUCKETS_MS)
+        metrics.increment('openai.requests')
+
+        retryable = error is not None or response.status_code in RETRY_STATUSES
+        if not retryable:
+            # Réponse de l'API (y compris 4xx de la requête elle-même) : le service répond
+            breaker.record_success()
+            if response.status_code != 200:
+                raise LLMError(f'Erreur API ({response.status_code})', response.status_code)
+            return response.json()
+        if attempt > settings.AI_HTTP_MAX_RETRIES:
+            metrics.increment('openai.failures')
+            breaker.record_failure()
+            if error is not None:
+                raise LLMError(f'Erreur de connexion : {error}') from error
+            raise LLMError(f'Erreur API ({response.status_code})', response.status_code)
+        metrics.increment('openai.retries')
+        time.sleep(backoff_delay(attempt, response))
+
+
+def stats():
+    return {
+        'breaker': openai_breaker().describe(),
+        **{name.split('.', 1)[1]: value for name, value in metrics.snapshot(METRICS).items()},
+        'latency_ms': metrics.histogram('openai.latency_ms', LATENCY_BUCKETS_MS),
+    }
@@ -0,0 +1,150 @@
+"""
+Jobs de génération IA, exécutés hors du cycle de requête.
+
+Les vues créent un AIJob (submit) et répondent aussitôt avec son id ; le
+client suit l'avancement sur /api/ai/jobs/<id>/. La commande run_ai_worker
+exécute les jobs sur un pool de AI_JOB_WORKERS threads : un appel lent au
+modèle n'occupe plus un worker gunicorn (sync, 30 s de timeout).
+
+Un job resté « running » plus de AI_JOB_TIMEOUT secondes (worker arrêté en
+cours de route) est remis en attente, jusqu'à AI_JOB_MAX_ATTEMPTS essais.
+"""
+import base64
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from api import metrics
+
+from . import cache
+from .llm import LLMError, get_llm
+from .models import AIJob
+
+logger = logging.getLogger(__name__)
+
+
+def submit(kind, payload, user=None, image=None):
+    """image : fichier conservé avec le job (AIJob.image), dont l'URL est ajoutée au payload (image_url)"""
+    job = AIJob(kind=kind, payload=payload, user=user if user is not None and user.is_authenticated else None)
+    if image is not None:
+        job.image.save(image.name, image, save=False)
+        job.payload['image_url'] = job.image.url
+    job.save()
+    metrics.increment('ai_jobs.submitted')
+    return job
+
+
+def run_generate_models(payload):
+    from .views import (
+        BASIC_PROMPT_FIELDS, DEFAULT_MODEL, PROMPT_VERSIONS,
+        create_model_generation_prompt, get_fallback_models, parse_ai_response,
+    )
+
+    fabric_data = payload.get('fabric', {})
+    messages = [
+        {
+            'role': 'system',
+            'content': 'Tu es un expert en mode et couture. Tu génères des descriptions détaillées de modèles de vêtements.'
+        },
+        {
+            'role': 'user',
+            'content': create_model_generation_prompt(fabric_data)
+        }
+    ]
+
+    unparsed = []
+
+    def ask_llm():
+        ai_response = get_llm().chat(DEFAULT_MODEL, messages, max_tokens=800, temperature=0.7)
+        models = parse_ai_response(ai_response, fabric_data, fallback=False)
+        if models is None:
+            # Réponse illisible : modèles de fallback, sans mise en cache
+            unparsed.append(ai_response)
+            return None
+        return {'models': models, 'ai_response': ai_response}
+
+    try:
+        result, cached = cache.cached_call(
+            'generate_models', PROMPT_VERSIONS['generate_models'], DEFAULT_MODEL,
+            fabric_data, BASIC_PROMPT_FIELDS, ask_llm,
+        )
+        if result is None:
+            result = {'models': get_fallback_models(fabric_data), 'ai_response': unparsed[0]}
+    except LLMError as exc:
+        # En cas d'erreur API, utiliser les modèles de fallback
+        return {
+            'success': True,
+            'models': get_fallback_models(fabric_data),
+            'message': f'{exc}, modèles générés localement'
+        }
+    return {
+        'success': True,
+        'models': result['models'],
+        'ai_analysis': f"Analyse AI: {result['ai_response'][:200]}...",
+        'model_used': DEFAULT_MODEL,
+        'cached': cached
+    }
+
+
+def run_generate_model(payload):
+    image = base64.b64decode(payload['image']) if payload.get('image') else None
+    text = get_llm().vision(payload['prompt'], image)
+    if image:
+        metrics.increment('generate_model.bytes_sent', len(image))
+    return {'result': text, 'image_url': payload.get('image_url')}
+
+
+JOB_HANDLERS = {
+    'generate_models': run_generate_models,
+    'generate_model': run_generate_model,
+}
+
+
+def requeue_stale():
+    """Remet en attente les jobs abandonnés par un worker arrêté ; retourne leur nombre"""
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_JOB_TIMEOUT)
+    stale = AIJob.objects.filter(status='running', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.AI_JOB_MAX_ATTEMPTS).update(
+        status='failed', error='Délai dépassé', finished_at=timezone.now(),
+    )
+    requeued = stale.update(status='queued', started_at=None)
+    return failed + requeued
+
+
+def claim(limit):
+    """Passe au plus `limit` jobs en attente à « running », dans l'ordre d'arrivée"""
+    if limit <= 0:
+        return []
+    candidates = (
+        AIJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)[:limit]
+    )
+    claimed = []
+    for pk in list(candidates):
+        # UPDATE conditionnel : si un autre worker a pris le job entre-temps, rien n'est modifié
+        if AIJob.objects.filter(pk=pk, status='queued').update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+    return list(AIJob.objects.filter(pk__in=claimed).order_by('created_at'))
+
+
+def execute(job):
+    """Exécute un job réclamé et enregistre son résultat (appelé dans un thread du pool)"""
+    close_old_connections()
+    try:
+        result = JOB_HANDLERS[job.kind](job.payload)
+    except Exception as exc:
+        logger.exception("Job IA %s en échec", job.id)
+        finished = {'status': 'failed', 'error': str(exc) or exc.__class__.__name__}
+        metrics.increment('ai_jobs.failed')
+    else:
+        finished = {'status': 'succeeded', 'result': result}
+        metrics.increment('ai_jobs.succeeded')
+    # Filtre sur le statut : un job remis en attente entre-temps n'est pas écrasé
+    AIJob.objects.filter(pk=job.pk, status='running', attempts=job.attempts).update(
+        finished_at=timezone.now(), **finished,
+    )
@@ -0,0 +1,74 @@
+"""
+Accès aux modèles de langage, derrière une interface commune :
+
+    chat(model, messages, max_tokens, temperature) -> texte de la réponse
+    vision(prompt, image=None) -> texte (image : JPEG en octets)
+
+AI_LLM_BACKEND choisit l'implémentation : RemoteLLM (OpenAI et Gemini) en
+production, LocalLLM pour les tests et le développement hors ligne.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+
+
+class LLMError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RemoteLLM:
+    def chat(self, model, messages, max_tokens, temperature):
+        # Session partagée, nouveaux essais et disjoncteur : voir chatgpt.client
+        from .client import post_json
+
+        result = post_json(
+            OPENAI_API_URL,
+            {'model': model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature},
+            headers={
+                'Authorization': f'Bearer {settings.OPENAI_API_KEY}',
+                'Content-Type': 'application/json',
+            },
+        )
+        return result['choices'][0]['message']['content']
+
+    def vision(self, prompt, image=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        if image:
+            model = genai.GenerativeModel('gemini-pro-vision')
+            return model.generate_content([prompt, {'mime_type': 'image/jpeg', 'data': image}]).text
+        model = genai.GenerativeModel('gemini-pro')
+        return model.generate_content(prompt).text
+
+
+class LocalLLM:
+    """Réponses déterministes, sans réseau, dérivées du contenu de la demande"""
+
+    def chat(self, model, messages, max_tokens, temperature):
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+        return json.dumps({
+            'models': [
+                {
+                    'name': f'Modèle local {digest[index * 4:index * 4 + 4]}',
+                    'description': 'Modèle généré localement',
+                    'price': 50 + index * 25,
+                    'difficulty': ('facile', 'moyen', 'difficile')[index],
+                }
+                for index in range(3)
+            ]
+        })
+
+    def vision(self, prompt, image=None):
+        suffix = f' (image de {len(image)} octets)' if image else ''
+        return f'Réponse locale : {prompt}{suffix}'
+
+
+def get_llm():
+    return import_string(settings.AI_LLM_BACKEND)()
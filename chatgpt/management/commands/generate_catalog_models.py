@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chatgpt.batch import create_run, process_run, progress, start_run
+from chatgpt.models import AIBatchRun
+
+
+class Command(BaseCommand):
+    help = "Génère par lot des brouillons de modèles pour les matières du catalogue (reprise possible après interruption)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', type=int,
+                            help="Catégorie de matières (sous-catégories comprises)")
+        parser.add_argument('--supplier', type=int, help="Fournisseur des matières")
+        parser.add_argument('--material', type=int, action='append', dest='materials',
+                            help="Matière à traiter (option répétable)")
+        parser.add_argument('--all', action='store_true', help="Toutes les matières actives du catalogue")
+        parser.add_argument('--resume', type=int, metavar='RUN_ID',
+                            help="Reprend un lot interrompu là où il s'est arrêté")
+        parser.add_argument('--pending', action='store_true',
+                            help="Traite les lots créés par l'API et les lots interrompus")
+        parser.add_argument('--concurrency', type=int, default=settings.AI_BATCH_CONCURRENCY,
+                            help="Nombre maximal d'appels simultanés au modèle")
+        parser.add_argument('--rate', type=int, default=settings.AI_BATCH_RATE_PER_MINUTE,
+                            help="Nombre maximal d'appels au modèle par minute")
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if connection.vendor == 'sqlite' and concurrency > 1:
+            # SQLite refuse les transactions d'écriture concurrentes (database is locked)
+            self.stderr.write("SQLite : les matières sont traitées une par une")
+            concurrency = 1
+
+        if options['resume']:
+            run = AIBatchRun.objects.filter(pk=options['resume']).first()
+            if run is None:
+                raise CommandError(f"Lot {options['resume']} introuvable")
+            if run.status == 'completed':
+                self.stdout.write(f"Lot {run.pk} déjà terminé")
+                return
+            runs = [run]
+        elif options['pending']:
+            runs = list(AIBatchRun.objects.filter(status__in=['queued', 'interrupted']).order_by('created_at'))
+        else:
+            filters = {key: options[key] for key in ('category', 'supplier', 'materials') if options[key]}
+            if not filters and not options['all']:
+                raise CommandError("Indiquez --category, --supplier, --material ou --all")
+            run = create_run(filters)
+            if not run.total_items:
+                run.delete()
+                raise CommandError("Aucune matière active ne correspond")
+            self.stdout.write(f"Lot {run.pk} créé : {run.total_items} matière(s)")
+            runs = [run]
+
+        for run in runs:
+            if not start_run(run, resume=bool(options['resume'])):
+                self.stderr.write(f"Lot {run.pk} déjà en cours de traitement")
+                continue
+            try:
+                final_status = process_run(run, concurrency, options['rate'])
+            except KeyboardInterrupt:
+                self.stderr.write(f"Lot {run.pk} interrompu, reprise : --resume {run.pk}")
+                return
+            counts = progress(run)
+            summary = (f"Lot {run.pk} : {counts['done']} matière(s) traitée(s), {counts['failed']} en échec, "
+                       f"{counts['models_created']} brouillon(s) créé(s)")
+            if final_status == 'completed':
+                self.stdout.write(self.style.SUCCESS(summary))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"{summary} ; service IA indisponible, reprise : --resume {run.pk}"
+                ))
@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chatgpt.batch import process_run, start_run
+from chatgpt.jobs import claim, execute, requeue_stale
+from chatgpt.models import AIBatchRun
+
+
+class Command(BaseCommand):
+    help = ("Exécute les jobs IA en attente sur un pool de threads borné, "
+            "et un à un les lots de génération créés par l'API")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.AI_JOB_WORKERS,
+                            help="Nombre maximal de jobs exécutés en parallèle")
+        parser.add_argument('--once', action='store_true',
+                            help="Vide la file puis s'arrête, au lieu d'attendre de nouveaux jobs")
+        parser.add_argument('--no-batches', action='store_true',
+                            help="Ne traite pas les lots de génération (voir generate_catalog_models)")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        batch_concurrency = settings.AI_BATCH_CONCURRENCY
+        if connection.vendor == 'sqlite' and workers > 1:
+            # SQLite refuse les transactions d'écriture concurrentes (database is locked)
+            self.stderr.write("SQLite : les jobs sont exécutés un par un")
+            workers = 1
+        # SQLite : un lot ne tourne pas en même temps qu'un job, ses matières sont traitées une par une
+        serial = connection.vendor == 'sqlite'
+        if serial:
+            batch_concurrency = 1
+        running = set()
+        batch = None
+        done = 0
+        last_requeue = 0
+        self.stdout.write(f"Worker IA démarré ({workers} job(s) en parallèle)")
+        # Un lot à la fois, sur son propre thread : process_run borne lui-même ses appels au modèle
+        with ThreadPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=1) as batches:
+            while True:
+                if time.monotonic() - last_requeue > settings.AI_JOB_TIMEOUT / 2:
+                    requeue_stale()
+                    last_requeue = time.monotonic()
+
+                # On ne réclame que ce que le pool peut exécuter tout de suite :
+                # les autres jobs restent disponibles pour d'autres workers
+                if batch is not None and batch.done():
+                    self.report_batch(batch)
+                    batch = None
+
+                if not (serial and batch is not None):
+                    for job in claim(workers - len(running)):
+                        running.add(executor.submit(execute, job))
+
+                if not options['no_batches'] and batch is None and not (serial and running):
+                    batch = self.next_batch(batches, batch_concurrency)
+
+                if not running:
+                    if options['once'] and batch is None:
+                        break
+                    time.sleep(settings.AI_JOB_POLL_INTERVAL)
+                    continue
+                finished, running = wait(running, timeout=settings.AI_JOB_POLL_INTERVAL,
+                                         return_when=FIRST_COMPLETED)
+                done += len(finished)
+        self.stdout.write(self.style.SUCCESS(f"{done} job(s) exécuté(s)"))
+
+    def next_batch(self, batches, concurrency):
+        """Réserve et lance le plus ancien lot en attente (les lots interrompus se reprennent avec --resume)"""
+        for run in AIBatchRun.objects.filter(status='queued').order_by('created_at')[:5]:
+            if start_run(run):
+                self.stdout.write(f"Lot {run.pk} : {run.total_items} matière(s)")
+                return batches.submit(process_run, run, concurrency)
+        return None
+
+    def report_batch(self, future):
+        try:
+            final_status = future.result()
+        except Exception as exc:
+            self.stderr.write(f"Lot interrompu : {exc}")
+            return
+        self.stdout.write(f"Lot terminé : {final_status}")
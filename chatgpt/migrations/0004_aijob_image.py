@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatgpt', '0003_ai_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aijob',
+            name='image',
+            field=models.FileField(blank=True, upload_to='models/'),
+        ),
+    ]
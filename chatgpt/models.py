@@ -0,0 +1,126 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class AIResponseCache(models.Model):
+    """
+    Réponse d'un appel OpenAI, réutilisée pour un même tissu (voir chatgpt.cache).
+    La clé est l'empreinte du tissu normalisé, de la version du prompt et du modèle.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    endpoint = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=50)
+    prompt_version = models.PositiveIntegerField()
+    response = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='aicache_expires_idx'),
+            models.Index(fields=['last_used_at'], name='aicache_last_used_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.model_name} v{self.prompt_version} ({self.hit_count} hits)"
+
+
+class AIJob(models.Model):
+    """
+    Génération IA exécutée hors du cycle de requête (voir chatgpt.jobs) : la vue
+    crée le job et répond aussitôt ; la commande run_ai_worker l'exécute.
+    """
+    KIND_CHOICES = [
+        ('generate_models', 'Modèles à partir d\'un tissu (ChatGPT)'),
+        ('generate_model', 'Génération à partir d\'un prompt et d\'une image (Gemini)'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'En attente'),
+        ('running', 'En cours'),
+        ('succeeded', 'Terminé'),
+        ('failed', 'Échoué'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             on_delete=models.SET_NULL, related_name='ai_jobs')
+    payload = models.JSONField(default=dict)
+    # Original conservé sur demande (persist=true de generate-model) : cette ligne
+    # référence son blob, que cleanup_blobs ne purge donc pas
+    image = models.FileField(upload_to='models/', blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # File d'attente : seuls les jobs en attente ou en cours sont indexés
+            models.Index(fields=['status', 'created_at'], name='aijob_pending_idx',
+                         condition=models.Q(status__in=['queued', 'running'])),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
+
+
+class AIBatchRun(models.Model):
+    """
+    Génération de modèles pour un ensemble de matières (voir chatgpt.batch).
+    Une ligne AIBatchItem par matière : un lot interrompu reprend là où il
+    s'est arrêté.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'En attente'),
+        ('running', 'En cours'),
+        ('completed', 'Terminé'),
+        ('interrupted', 'Interrompu'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    filters = models.JSONField(default=dict, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                                   on_delete=models.SET_NULL, related_name='ai_batch_runs')
+    total_items = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Lot {self.pk} ({self.status}, {self.total_items} matières)"
+
+
+class AIBatchItem(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('failed', 'Échoué'),
+    ]
+
+    run = models.ForeignKey(AIBatchRun, related_name='items', on_delete=models.CASCADE)
+    material = models.ForeignKey('api.Material', related_name='ai_batch_items', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    models_created = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'material'], name='unique_batch_material'),
+        ]
+        indexes = [
+            models.Index(fields=['run', 'status'], name='aibatchitem_run_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.run_id}/{self.material_id} ({self.status})"
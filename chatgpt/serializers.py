@@ -0,0 +1,39 @@
+from django.urls import reverse
+from rest_framework import serializers
+
+from .models import AIBatchRun, AIJob
+
+
+class AIJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AIJob
+        fields = ('id', 'kind', 'status', 'result', 'error', 'attempts',
+                  'created_at', 'started_at', 'finished_at', 'status_url')
+        read_only_fields = fields
+
+    def get_status_url(self, obj):
+        url = reverse('chatgpt:job_status', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class AIBatchRunSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AIBatchRun
+        fields = ('id', 'status', 'filters', 'total_items', 'progress',
+                  'created_at', 'started_at', 'finished_at', 'status_url')
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        from .batch import progress
+        return progress(obj)
+
+    def get_status_url(self, obj):
+        url = reverse('chatgpt:batch_status', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
@@ -1,11 +1,17 @@
 from django.urls import path
-from .views import generate_models_from_fabric, analyze_fabric, generate_model_image
+from . import views
 
 app_name = 'chatgpt'
 
 urlpatterns = [
-    path('api/ai/generate-models/', generate_models_from_fabric, name='generate_models'),
-    path('api/ai/analyze-fabric/', analyze_fabric, name='analyze_fabric'),
-    path('api/ai/generate-image/', generate_model_image, name='generate_image'),
+    path('api/ai/generate-models/', views.generate_models_from_fabric, name='generate_models'),
+    path('api/ai/analyze-fabric/', views.analyze_fabric, name='analyze_fabric'),
+    path('api/ai/generate-image/', views.generate_model_image, name='generate_image'),
+    path('api/ai/suggest-models/', views.generate_models, name='suggest_models'),
+    path('api/ai/jobs/<uuid:job_id>/', views.ai_job_status, name='job_status'),
+    path('api/ai/batches/', views.ai_batches, name='batches'),
+    path('api/ai/batches/<int:run_id>/', views.ai_batch_status, name='batch_status'),
+    path('api/ai/cache/stats/', views.ai_cache_stats, name='cache_stats'),
+    path('api/ai/metrics/', views.ai_metrics, name='metrics'),
     path('test-connection/', views.test_connection, name='test_connection'),
-] 
\ No newline at end of file
+]
\ No newline at end of file
@@ -9,7 +9,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 import os
-import requests
+
+from api import metrics
+from api.views import IsAdminUserType
+
+from . import batch, cache, client, jobs
+from .llm import LLMError
+from .models import AIBatchRun, AIJob
+from .serializers import AIBatchRunSerializer, AIJobSerializer
 
 # Configuration OpenAI
 openai.api_key = settings.OPENAI_API_KEY
@@ -21,6 +28,23 @@ OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 # Modèle gratuit (GPT-3.5-turbo) au lieu de GPT-4
 DEFAULT_MODEL = "gpt-3.5-turbo"
 
+# Version des templates de prompt (clé du cache) : à incrémenter à chaque
+# modification d'un prompt pour ne plus servir les réponses de l'ancien
+PROMPT_VERSIONS = {
+    'generate_models_from_fabric': 1,
+    'analyze_fabric': 1,
+    'generate_models': 1,
+}
+
+# Champs du tissu lus par les prompts : seuls eux entrent dans la clé du cache
+FABRIC_PROMPT_FIELDS = ('name', 'description', 'color', 'unit_price', 'unit_display')
+BASIC_PROMPT_FIELDS = ('name', 'type', 'color', 'price')
+
+FABRIC_SYSTEM_PROMPT = (
+    "Tu es un expert en mode et design de vêtements. Tu dois générer 4 modèles de vêtements différents "
+    "qui seraient parfaits pour le tissu décrit. Réponds uniquement en JSON valide."
+)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_models_from_fabric(request):
@@ -31,71 +55,42 @@ def generate_models_from_fabric(request):
         fabric_data = request.data
         
         # Construction du prompt pour ChatGPT
-        prompt = f"""Tu es un expert en mode et design de vêtements. Génère 4 modèles de vêtements différents qui seraient parfaits pour ce tissu :
+        prompt = create_fabric_models_prompt(fabric_data)
 
-Nom du tissu: {fabric_data.get('name', 'Tissu')}
-Description: {fabric_data.get('description', 'Non spécifiée')}
-Couleur: {fabric_data.get('color', 'Non spécifiée')}
-Prix au mètre: {fabric_data.get('unit_price', 0)}€
-Unité: {fabric_data.get('unit_display', 'm')}
+        # Appel à ChatGPT, sauf si ce tissu a déjà été traité
+        def ask_chatgpt():
+            response = openai.ChatCompletion.create(
+                model="gpt-4",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": FABRIC_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.8,
+                max_tokens=2000
+            )
 
-Crée des modèles variés qui mettent en valeur les caractéristiques de ce tissu. 
-Adapte les styles, les prix et les délais selon le type et la qualité du tissu.
-
-Pour chaque modèle, fournis :
-- Un nom créatif et descriptif
-- Une description détaillée
-- La catégorie (shirt, dress, suit, pants, skirt, other)
-- 3-4 styles/tags
-- Un prix estimé en euros
-- Un délai de confection en jours
-- Des notes de design
-- L'utilisation du tissu
-- Un prompt pour générer une image
+            # Extraction de la réponse
+            content = response.choices[0].message.content
+            parsed_response = json.loads(content)
+            return {'models': parsed_response.get('models', [])}
 
-Réponds uniquement en JSON valide avec cette structure :
-{{
-  "models": [
-    {{
-      "name": "Nom du modèle",
-      "description": "Description détaillée",
-      "category": "shirt",
-      "styles": ["style1", "style2", "style3"],
-      "estimatedPrice": 150,
-      "estimatedTime": 7,
-      "designNotes": "Notes de design",
-      "fabricUsage": "Comment utiliser le tissu",
-      "imagePrompt": "Prompt pour générer l'image"
-    }}
-  ]
-}}"""
-
-        # Appel à ChatGPT
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un expert en mode et design de vêtements. Tu dois générer 4 modèles de vêtements différents qui seraient parfaits pour le tissu décrit. Réponds uniquement en JSON valide."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.8,
-            max_tokens=2000
+        result, cached = cache.cached_call(
+            'generate_models_from_fabric', PROMPT_VERSIONS['generate_models_from_fabric'], 'gpt-4',
+            fabric_data, FABRIC_PROMPT_FIELDS, ask_chatgpt,
         )
 
-        # Extraction de la réponse
-        content = response.choices[0].message.content
-        parsed_response = json.loads(content)
-        
         return Response({
             'success': True,
-            'models': parsed_response.get('models', []),
+            'models': result['models'],
             'fabric_id': fabric_data.get('id'),
-            'fabric_name': fabric_data.get('name')
+            'fabric_name': fabric_data.get('name'),
+            'cached': cached
         })
 
     except json.JSONDecodeError as e:
@@ -130,28 +125,36 @@ Prix: {fabric_data.get('unit_price', 0)}€/{fabric_data.get('unit_display', 'm'
 
 Donne une analyse concise et utile en français."""
 
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un expert en textiles. Analyse ce tissu et donne des conseils sur les types de vêtements les plus adaptés."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=300
+        def ask_chatgpt():
+            response = openai.ChatCompletion.create(
+                model="gpt-4",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Tu es un expert en textiles. Analyse ce tissu et donne des conseils sur les types de vêtements les plus adaptés."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.7,
+                max_tokens=300
+            )
+
+            analysis = response.choices[0].message.content
+            return {'analysis': analysis}
+
+        result, cached = cache.cached_call(
+            'analyze_fabric', PROMPT_VERSIONS['analyze_fabric'], 'gpt-4',
+            fabric_data, FABRIC_PROMPT_FIELDS, ask_chatgpt,
         )
 
-        analysis = response.choices[0].message.content
-        
         return Response({
             'success': True,
-            'analysis': analysis,
-            'fabric_id': fabric_data.get('id')
+            'analysis': result['analysis'],
+            'fabric_id': fabric_data.get('id'),
+            'cached': cached
         })
 
     except Exception as e:
@@ -202,7 +205,8 @@ def generate_model_image(request):
 def generate_models(request):
     """
     Génère des modèles de vêtements basés sur un tissu donné
-    Utilise la version gratuite de ChatGPT (GPT-3.5-turbo)
+    Utilise la version gratuite de ChatGPT (GPT-3.5-turbo), de façon asynchrone :
+    répond 202 avec le job créé, dont le résultat est servi par ai_job_status
     """
     try:
         data = json.loads(request.body)
@@ -216,53 +220,20 @@ def generate_models(request):
                 'message': 'Modèles générés localement (pas d\'API key configurée)'
             })
         
-        # Préparer le prompt pour GPT-3.5-turbo
-        prompt = create_model_generation_prompt(fabric_data)
-        
-        headers = {
-            'Authorization': f'Bearer {OPENAI_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'model': DEFAULT_MODEL,
-            'messages': [
-                {
-                    'role': 'system',
-                    'content': 'Tu es un expert en mode et couture. Tu génères des descriptions détaillées de modèles de vêtements.'
-                },
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'max_tokens': 800,  # Réduit pour économiser les tokens
-            'temperature': 0.7
-        }
-        
-        response = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
-            
-            # Parser la réponse AI
-            models = parse_ai_response(ai_response, fabric_data)
-            
-            return Response({
-                'success': True,
-                'models': models,
-                'ai_analysis': f"Analyse AI: {ai_response[:200]}...",
-                'model_used': DEFAULT_MODEL
-            })
-        else:
-            # En cas d'erreur API, utiliser les modèles de fallback
+        # Service IA en échec répété : modèles de secours sans attendre (voir chatgpt.client)
+        if client.openai_breaker().state() == 'open':
             return Response({
                 'success': True,
                 'models': get_fallback_models(fabric_data),
-                'message': f'Erreur API ({response.status_code}), modèles générés localement'
+                'message': 'Service IA indisponible, modèles générés localement'
             })
-            
+
+        # L'appel à GPT-3.5-turbo est exécuté par le worker IA (voir chatgpt.jobs) :
+        # le résultat est lu sur status_url
+        job = jobs.submit('generate_models', {'fabric': fabric_data}, request.user)
+        return Response(AIJobSerializer(job, context={'request': request}).data,
+                        status=status.HTTP_202_ACCEPTED)
+
     except Exception as e:
         return Response({
             'success': True,
@@ -270,6 +241,47 @@ def generate_models(request):
             'message': f'Erreur: {str(e)}, modèles générés localement'
         }, status=status.HTTP_200_OK)
 
+def create_fabric_models_prompt(fabric_data):
+    """Prompt de generate_models_from_fabric, partagé avec la génération par lot (chatgpt.batch)"""
+    return f"""Tu es un expert en mode et design de vêtements. Génère 4 modèles de vêtements différents qui seraient parfaits pour ce tissu :
+
+Nom du tissu: {fabric_data.get('name', 'Tissu')}
+Description: {fabric_data.get('description', 'Non spécifiée')}
+Couleur: {fabric_data.get('color', 'Non spécifiée')}
+Prix au mètre: {fabric_data.get('unit_price', 0)}€
+Unité: {fabric_data.get('unit_display', 'm')}
+
+Crée des modèles variés qui mettent en valeur les caractéristiques de ce tissu. 
+Adapte les styles, les prix et les délais selon le type et la qualité du tissu.
+
+Pour chaque modèle, fournis :
+- Un nom créatif et descriptif
+- Une description détaillée
+- La catégorie (shirt, dress, suit, pants, skirt, other)
+- 3-4 styles/tags
+- Un prix estimé en euros
+- Un délai de confection en jours
+- Des notes de design
+- L'utilisation du tissu
+- Un prompt pour générer une image
+
+Réponds uniquement en JSON valide avec cette structure :
+{{
+  "models": [
+    {{
+      "name": "Nom du modèle",
+      "description": "Description détaillée",
+      "category": "shirt",
+      "styles": ["style1", "style2", "style3"],
+      "estimatedPrice": 150,
+      "estimatedTime": 7,
+      "designNotes": "Notes de design",
+      "fabricUsage": "Comment utiliser le tissu",
+      "imagePrompt": "Prompt pour générer l'image"
+    }}
+  ]
+}}"""
+
 def create_model_generation_prompt(fabric_data):
     """Crée un prompt optimisé pour GPT-3.5-turbo"""
     fabric_name = fabric_data.get('name', 'tissu')
@@ -303,8 +315,11 @@ def create_model_generation_prompt(fabric_data):
     }}
     """
 
-def parse_ai_response(ai_response, fabric_data):
-    """Parse la réponse AI et génère des modèles"""
+def parse_ai_response(ai_response, fabric_data, fallback=True):
+    """
+    Parse la réponse AI et génère des modèles ; si le parsing échoue, retourne
+    les modèles de fallback, ou None avec fallback=False (réponse à ne pas mettre en cache)
+    """
     try:
         # Essayer de parser le JSON de la réponse AI
         if '{' in ai_response and '}' in ai_response:
@@ -334,7 +349,7 @@ def parse_ai_response(ai_response, fabric_data):
         pass
     
     # Fallback si parsing échoue
-    return get_fallback_models(fabric_data)
+    return get_fallback_models(fabric_data) if fallback else None
 
 def get_fallback_models(fabric_data):
     """Modèles de fallback sans API"""
@@ -376,6 +391,78 @@ def get_fallback_models(fabric_data):
     
     return models
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ai_job_status(request, job_id):
+    """Statut et résultat d'un job IA, pour son auteur ou un administrateur"""
+    job = AIJob.objects.filter(pk=job_id).first()
+    if job is None or (job.user_id != request.user.id and request.user.user_type != 'admin'):
+        return Response({'error': 'Job introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(AIJobSerializer(job, context={'request': request}).data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUserType])
+def ai_metrics(request):
+    """État du disjoncteur, latences et compteurs des appels OpenAI et des jobs IA"""
+    return Response({
+        'openai': client.stats(),
+        'jobs': metrics.snapshot(['ai_jobs.submitted', 'ai_jobs.succeeded', 'ai_jobs.failed']),
+        'batches': batch.stats(),
+    })
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUserType])
+def ai_batches(request):
+    """
+    GET : derniers lots de génération sur le catalogue de matières.
+    POST : crée un lot pour les matières actives retenues par category,
+    supplier et/ou materials (ou all=true pour tout le catalogue) ; il est
+    traité par le worker IA (python manage.py run_ai_worker, voir Procfile),
+    ou à la main par : python manage.py generate_catalog_models --pending
+    """
+    if request.method == 'GET':
+        runs = AIBatchRun.objects.order_by('-created_at')[:50]
+        return Response(AIBatchRunSerializer(runs, many=True, context={'request': request}).data)
+
+    data = request.data
+    try:
+        filters = {
+            key: int(data[key]) for key in ('category', 'supplier') if data.get(key) not in (None, '')
+        }
+        materials = data.getlist('materials') if hasattr(data, 'getlist') else data.get('materials')
+        if materials:
+            if not isinstance(materials, list):
+                raise TypeError
+            filters['materials'] = [int(pk) for pk in materials]
+    except (TypeError, ValueError):
+        return Response({'error': 'category, supplier et materials doivent être des identifiants'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not filters and str(data.get('all', '')).lower() != 'true':
+        return Response({'error': 'Indiquez category, supplier, materials ou all=true'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    run = batch.create_run(filters, request.user)
+    if not run.total_items:
+        run.delete()
+        return Response({'error': 'Aucune matière active ne correspond'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(AIBatchRunSerializer(run, context={'request': request}).data,
+                    status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUserType])
+def ai_batch_status(request, run_id):
+    """Avancement d'un lot de génération"""
+    run = AIBatchRun.objects.filter(pk=run_id).first()
+    if run is None:
+        return Response({'error': 'Lot introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(AIBatchRunSerializer(run, context={'request': request}).data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUserType])
+def ai_cache_stats(request):
+    """Compteurs et taille du cache des réponses OpenAI"""
+    return Response(cache.stats())
+
 @csrf_exempt
 @api_view(['GET'])
 def test_connection(request):
@@ -404,21 +491,21 @@ def test_connection(request):
             'max_tokens': 10
         }
         
-        response = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            return Response({
-                'status': 'success',
-                'message': 'Connexion API réussie',
-                'model': DEFAULT_MODEL
-            })
-        else:
-            return Response({
-                'status': 'error',
-                'message': f'Erreur API: {response.status_code}',
-                'model': DEFAULT_MODEL
-            })
-            
+        # Même chemin que les appels réels : nouveaux essais, disjoncteur et métriques (voir chatgpt.client)
+        client.post_json(OPENAI_API_URL, payload, headers)
+        return Response({
+            'status': 'success',
+            'message': 'Connexion API réussie',
+            'model': DEFAULT_MODEL
+        })
+
+    except LLMError as e:
+        return Response({
+            'status': 'error',
+            'message': f'Erreur API: {e.status_code}' if e.status_code else str(e),
+            'model': DEFAULT_MODEL
+        })
+
     except Exception as e:
         return Response({
             'status': 'error',
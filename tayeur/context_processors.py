@@ -1,12 +1,14 @@
 from django.contrib.auth import get_user_model
-from api.models import Order, Workshop, ClothingModel
+from django.db.models import Sum
+from api.models import OrderDailyRollup, Workshop, ClothingModel
 
 def admin_dashboard_stats(request):
     User = get_user_model()
     nb_clients = User.objects.filter(user_type='client').count()
     nb_workshops = Workshop.objects.count()
     nb_models = ClothingModel.objects.count()
-    nb_orders = Order.objects.count()
+    # Lu dans les agrégats journaliers plutôt qu'un COUNT(*) sur toutes les commandes
+    nb_orders = OrderDailyRollup.objects.aggregate(total=Sum('order_count'))['total'] or 0
     return {
         'nb_clients': nb_clients,
         'nb_workshops': nb_workshops,
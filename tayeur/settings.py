@@ -84,6 +84,19 @@ DATABASES = {
     }
 }
 
+# Cache partagé par tous les workers gunicorn (invalidations visibles partout).
+# Table créée par : python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'tayeur_cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -108,6 +121,13 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Médias dédupliqués par contenu (voir api/storage.py) ; le stockage réel est
+# délégué à CONTENT_STORAGE_BACKEND. Blobs inutilisés : manage.py cleanup_blobs
+STORAGES = {
+    'default': {'BACKEND': 'api.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+CONTENT_STORAGE_BACKEND = 'django.core.files.storage.FileSystemStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -187,5 +207,31 @@ SIMPLE_JWT = {
 AUTH_USER_MODEL = 'api.User'
 
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Cache des réponses OpenAI (voir chatgpt/cache.py)
+AI_RESPONSE_CACHE_TTL = 7 * 24 * 3600
+AI_RESPONSE_CACHE_MAX_ENTRIES = 5000
+# Jobs IA (voir chatgpt/jobs.py), exécutés par : python manage.py run_ai_worker
+AI_LLM_BACKEND = 'chatgpt.llm.RemoteLLM'  # 'chatgpt.llm.LocalLLM' hors ligne et en test
+AI_HTTP_TIMEOUT = 30
+# Client OpenAI (voir chatgpt/client.py) : pool, nouveaux essais, disjoncteur
+AI_HTTP_POOL_SIZE = 10
+AI_HTTP_MAX_RETRIES = 3
+AI_HTTP_BACKOFF_BASE = 0.5
+AI_HTTP_BACKOFF_MAX = 8
+AI_BREAKER_FAILURE_THRESHOLD = 5
+AI_BREAKER_RESET_TIMEOUT = 60
+AI_JOB_WORKERS = 4
+AI_JOB_TIMEOUT = 300
+AI_JOB_MAX_ATTEMPTS = 3
+AI_JOB_POLL_INTERVAL = 1.0
+# Génération par lot sur le catalogue de matières (voir chatgpt/batch.py), lots
+# exécutés un à un par run_ai_worker : appels simultanés et plafond d'appels par minute au modèle
+AI_BATCH_CONCURRENCY = 4
+AI_BATCH_RATE_PER_MINUTE = 60
+# Images reçues par /api/generate-model/ : taille maximale du fichier téléversé
+# et plus grand côté (px) de la version envoyée à Gemini
+GENERATE_MODEL_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+GENERATE_MODEL_IMAGE_MAX_SIDE = 1024
 LOGOUT_REDIRECT_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
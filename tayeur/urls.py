@@ -20,6 +20,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('admin/', include('api.urls')),  # Ajout pour vues admin personnalisées
     path('api/', include('api.urls')),
+    path('', include('chatgpt.urls')),  # /api/ai/... (OpenAI)
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     # Remove or comment out the old token auth URL
     # path('api/token/', obtain_auth_token, name='api_token_auth'),